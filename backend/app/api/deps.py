@@ -1,11 +1,34 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import AsyncGenerator
+from ..core.config import settings
 from ..core.database import get_database
+from ..core.tracing import tracer
+from ..crud.backend import UserBackend
+from ..crud.memory import MemoryUserCRUD, memory_engine
 from ..crud.user import UserCRUD
 
 
+def user_backend(database: AsyncIOMotorDatabase) -> UserBackend:
+    """A user backend for the configured storage; the caller closes it"""
+    if settings.storage_backend == "memory":
+        return MemoryUserCRUD(memory_engine)
+    return UserCRUD(database)
+
+
 async def get_user_crud(
     database: AsyncIOMotorDatabase = Depends(get_database)
-) -> UserCRUD:
-    """Dependency to get UserCRUD instance"""
-    return UserCRUD(database)
+) -> AsyncGenerator[UserBackend, None]:
+    """Dependency to get a per-request user backend for the configured storage"""
+    with tracer.span("deps.get_user_crud"):
+        user_crud = user_backend(database)
+    try:
+        yield user_crud
+    finally:
+        await user_crud.close()
+
+
+def require_debug() -> None:
+    """Hide debug endpoints unless DEBUG is enabled"""
+    if not settings.debug:
+        raise HTTPException(status_code=404, detail="Not Found")
@@ -0,0 +1,133 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from typing import Optional
+import os
+import time
+from ...core.loop_watchdog import loop_watchdog
+from ...core.memory_profile import GROUPINGS, SnapshotNotFound, memory_profiler
+from ...core.slow_queries import slow_query_log
+from ...core.tracing import trace_buffer, tracer
+
+router = APIRouter()
+
+
+@router.get("/traces")
+async def get_traces(limit: int = Query(20, ge=1, le=200, description="Number of traces")):
+    """Most recent kept traces (OTLP JSON), newest first"""
+    return {"traces": trace_buffer.recent(limit), "stats": tracer.stats()}
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """A kept trace (OTLP JSON) by trace ID"""
+    trace = trace_buffer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500, description="Number of recent slow queries"),
+    shapes: int = Query(20, ge=1, le=200, description="Number of query shapes")
+):
+    """Recent slow MongoDB commands, newest first, and the costliest query shapes"""
+    return {
+        "queries": slow_query_log.recent(limit),
+        "shapes": slow_query_log.by_shape(shapes),
+        "stats": slow_query_log.stats(),
+    }
+
+
+@router.get("/loop-stalls")
+async def get_loop_stalls(
+    limit: int = Query(20, ge=1, le=200, description="Number of recent stalls"),
+    sites: int = Query(20, ge=1, le=200, description="Number of blocking sites")
+):
+    """Recent event-loop stalls with the blocking stack and route, newest first, and the lag histogram"""
+    return {
+        "stalls": loop_watchdog.recent(limit),
+        "sites": loop_watchdog.by_site(sites),
+        "stats": loop_watchdog.stats(),
+    }
+
+
+def _memory_response(data: dict, download: bool, kind: str) -> JSONResponse:
+    """JSON, or a file named after the worker when ``download`` is set"""
+    headers = {}
+    if download:
+        filename = f"memory-{kind}-{os.getpid()}-{int(time.time())}.json"
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return JSONResponse(data, headers=headers)
+
+
+@router.get("/memory")
+async def get_memory_report(
+    limit: int = Query(30, ge=1, le=500, description="Number of most common object types"),
+    download: bool = Query(False, description="Serve as a JSON file attachment")
+):
+    """This worker's tracemalloc status, live object counts and GC stats"""
+    return _memory_response(memory_profiler.report(limit), download, "report")
+
+
+@router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: Optional[int] = Query(None, ge=1, le=50, description="Traceback depth per allocation")
+):
+    """Start tracing allocations in this worker (slows allocation until stopped)"""
+    return memory_profiler.start(frames)
+
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """Stop tracing allocations in this worker and drop its snapshots"""
+    return memory_profiler.stop()
+
+
+@router.get("/memory/snapshots")
+async def get_memory_snapshots():
+    """Snapshots kept by this worker"""
+    return memory_profiler.status()
+
+
+@router.post("/memory/snapshots")
+async def take_memory_snapshot(
+    limit: int = Query(20, ge=0, le=500, description="Number of largest allocation sites")
+):
+    """Take a tracemalloc snapshot in this worker"""
+    try:
+        return memory_profiler.snapshot(limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/memory/diff")
+async def get_memory_diff(
+    base: int = Query(..., description="Snapshot to compare against"),
+    target: Optional[int] = Query(None, description="Later snapshot; a new one is taken if omitted"),
+    group_by: str = Query("lineno", pattern=f"^({'|'.join(GROUPINGS)})$", description="lineno, filename or traceback"),
+    limit: int = Query(50, ge=1, le=500, description="Number of allocation sites"),
+    download: bool = Query(False, description="Serve as a JSON file attachment")
+):
+    """Allocation growth between two snapshots of this worker, largest first"""
+    try:
+        diff = memory_profiler.diff(base, target, group_by, limit)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _memory_response(diff, download, "diff")
+
+
+@router.get("/memory/objects")
+async def get_memory_objects(
+    limit: int = Query(30, ge=1, le=500, description="Number of most common object types")
+):
+    """Live objects in this worker: users, responses and cursors, and the most numerous types"""
+    return memory_profiler.object_counts(limit)
+
+
+@router.get("/memory/gc")
+async def get_memory_gc():
+    """Garbage collector counters and thresholds for this worker"""
+    return memory_profiler.gc_stats()
@@ -1,19 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List
-from ...crud.user import UserCRUD
-from ...schemas.user import UserCreate, UserUpdate, UserResponse, UserListResponse
-from ..deps import get_user_crud
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List, Optional
+from ...core.breaker import CircuitOpen
+from ...core.changes import change_feed, parse_token
+from ...core.config import settings
+from ...core.database import get_database
+from ...core.deadline import DeadlineExceeded
+from ...core.etag import user_etag, list_etag, etag_matches
+from ...core.health import health_checker
+from ...core.page_cache import CachedPage, user_pages
+from ...core.tracing import TracedRoute
+from ...crud.backend import UserBackend
+from ...crud.delete_jobs import DeleteJobCRUD, delete_job_runner
+from ...crud.stats import UserStatsCRUD
+from ...schemas.user import (
+    UserCreate, UserUpdate, UserResponse, UserListResponse,
+    UserBatchGetRequest, UserBatchGetResponse,
+    UserStatsResponse, UserStatsReconcileResponse,
+    UserDeleteJobRequest, UserDeleteJobResponse, UserDeleteJobListResponse
+)
+from ..deps import get_user_crud, user_backend
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.post("/", response_model=UserResponse, status_code=201)
 async def create_user(
     user_data: UserCreate,
-    user_crud: UserCRUD = Depends(get_user_crud)
+    user_crud: UserBackend = Depends(get_user_crud)
 ):
     """Create a new user"""
     try:
@@ -25,50 +44,298 @@ async def create_user(
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        logger.error(f"Error creating user: {e}")
+        logger.error("Error creating user: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+async def _render_users_page(user_crud: UserBackend, page: int, size: int, generation: int) -> CachedPage:
+    """Read one list page and serialize it as the response body"""
+    users = await user_crud.get_users(skip=(page - 1) * size, limit=size)
+    total = await user_crud.get_users_count()
+    body = UserListResponse(
+        users=[UserResponse(id=str(user.id), name=user.name, email=user.email) for user in users],
+        total=total,
+        page=page,
+        size=size
+    ).model_dump_json().encode()
+    etag = list_etag(((user.id, user.version) for user in users), total, page, size)
+    return CachedPage(generation, body, etag, total)
+
+
+def _prefetch_users_page(database: AsyncIOMotorDatabase, page: int, size: int) -> None:
+    async def render(generation: int) -> CachedPage:
+        # The request's backend is closed by the time this runs
+        user_crud = user_backend(database)
+        try:
+            return await _render_users_page(user_crud, page, size, generation)
+        finally:
+            await user_crud.close()
+
+    user_pages.prefetch((page, size), render)
+
+
 @router.get("/", response_model=UserListResponse)
 async def get_users(
     page: int = Query(1, ge=1, description="Page number"),
     size: int = Query(10, ge=1, le=100, description="Page size"),
-    user_crud: UserCRUD = Depends(get_user_crud)
+    if_none_match: Optional[str] = Header(None),
+    database: AsyncIOMotorDatabase = Depends(get_database),
+    user_crud: UserBackend = Depends(get_user_crud)
 ):
     """Get list of users with pagination"""
     try:
-        skip = (page - 1) * size
-        users = await user_crud.get_users(skip=skip, limit=size)
-        total = await user_crud.get_users_count()
-        
-        user_responses = [
-            UserResponse(id=str(user.id), name=user.name, email=user.email)
-            for user in users
-        ]
-        
-        return UserListResponse(
-            users=user_responses,
-            total=total,
-            page=page,
-            size=size
-        )
+        key = (page, size)
+        rendered = user_pages.get(key) if user_pages.enabled else None
+        if rendered is None:
+            if if_none_match:
+                # Revalidate from (_id, version) pairs without loading documents
+                versions = await user_crud.get_users_versions(skip=(page - 1) * size, limit=size)
+                total = await user_crud.get_users_count()
+                etag = list_etag(versions, total, page, size)
+                if etag_matches(if_none_match, etag):
+                    return Response(status_code=304, headers={"ETag": etag})
+
+            # Taken before reading: a write meanwhile keeps this page out of the cache
+            generation = user_pages.generation
+            rendered = await _render_users_page(user_crud, page, size, generation)
+            user_pages.put(key, rendered)
+        elif etag_matches(if_none_match, rendered.etag):
+            return Response(status_code=304, headers={"ETag": rendered.etag})
+
+        # Speculative work is the first to go when the service is struggling
+        if settings.page_cache_prefetch and page * size < rendered.total and not health_checker.degraded:
+            _prefetch_users_page(database, page + 1, size)
+
+        return Response(content=rendered.body, media_type="application/json", headers={"ETag": rendered.etag})
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error getting users: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/batch-get", response_model=UserBatchGetResponse)
+async def batch_get_users(
+    request: UserBatchGetRequest,
+    user_crud: UserBackend = Depends(get_user_crud)
+):
+    """Get many users by ID, in request order, with per-ID not-found markers"""
+    try:
+        docs = await user_crud.get_users_by_ids(request.ids)
+
+        # Built as plain dicts: re-validating thousands of stored users is the slow part
+        results = []
+        found = 0
+        for user_id in request.ids:
+            if not ObjectId.is_valid(user_id):
+                results.append({"id": user_id, "status": "invalid_id", "user": None})
+                continue
+            doc = docs.get(str(ObjectId(user_id)))
+            if doc is None:
+                results.append({"id": user_id, "status": "not_found", "user": None})
+                continue
+            found += 1
+            results.append({
+                "id": user_id,
+                "status": "found",
+                "user": {"id": str(doc["_id"]), "name": doc["name"], "email": doc["email"]}
+            })
+
+        return JSONResponse({
+            "results": results,
+            "found": found,
+            "not_found": len(results) - found
+        })
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error batch-getting users: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/stats", response_model=UserStatsResponse)
+async def get_user_stats(user_crud: UserBackend = Depends(get_user_crud)):
+    """Get user totals (overall and per email domain) from the materialized stats"""
+    try:
+        return UserStatsResponse(**await user_crud.get_stats())
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error getting user stats: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/stats/reconcile", response_model=UserStatsReconcileResponse)
+async def reconcile_user_stats(
+    dry_run: bool = Query(False, description="Report drift without rewriting the stats"),
+    user_crud: UserBackend = Depends(get_user_crud)
+):
+    """Rebuild user totals from a full scan and report how far they had drifted"""
+    try:
+        return UserStatsReconcileResponse(**await user_crud.reconcile_stats(apply=not dry_run))
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error reconciling user stats: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _delete_jobs(database: AsyncIOMotorDatabase) -> DeleteJobCRUD:
+    if settings.storage_backend == "memory":
+        raise HTTPException(status_code=501, detail="Bulk delete jobs need MongoDB storage")
+    return DeleteJobCRUD(database)
+
+
+@router.post("/delete-jobs", response_model=UserDeleteJobResponse, status_code=202)
+async def create_delete_job(
+    request: UserDeleteJobRequest,
+    database: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Start deleting every user matching the criteria in throttled background chunks"""
+    jobs = _delete_jobs(database)
+    try:
+        spec = {
+            "email_domain": request.email_domain.lower() if request.email_domain else None,
+            "created_before": request.created_before,
+        }
+        estimated_total = None
+        if spec["email_domain"]:
+            stats = await UserStatsCRUD(database).get_stats()
+            estimated_total = stats["domains"].get(spec["email_domain"], 0)
+        job = await jobs.create(spec, estimated_total)
+        delete_job_runner.notify()
+        return UserDeleteJobResponse.from_job(job)
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error creating delete job: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/delete-jobs", response_model=UserDeleteJobListResponse)
+async def list_delete_jobs(
+    limit: int = Query(20, ge=1, le=100, description="Number of recent jobs"),
+    database: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Most recent bulk delete jobs, newest first"""
+    jobs = _delete_jobs(database)
+    try:
+        return UserDeleteJobListResponse(jobs=[UserDeleteJobResponse.from_job(job) for job in await jobs.list(limit)])
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error listing delete jobs: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/delete-jobs/{job_id}", response_model=UserDeleteJobResponse)
+async def get_delete_job(job_id: str, database: AsyncIOMotorDatabase = Depends(get_database)):
+    """Progress of a bulk delete job"""
+    jobs = _delete_jobs(database)
+    try:
+        job = await jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return UserDeleteJobResponse.from_job(job)
+    except HTTPException:
+        raise
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        logger.error(f"Error getting users: {e}")
+        logger.error("Error getting delete job %s: %s", job_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.post("/delete-jobs/{job_id}/cancel", response_model=UserDeleteJobResponse)
+async def cancel_delete_job(job_id: str, database: AsyncIOMotorDatabase = Depends(get_database)):
+    """Stop a bulk delete job after its current chunk; users already deleted stay deleted"""
+    jobs = _delete_jobs(database)
+    try:
+        job = await jobs.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return UserDeleteJobResponse.from_job(job)
+    except HTTPException:
+        raise
+    except (DeadlineExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error("Error cancelling delete job %s: %s", job_id, e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _resume_token(token: Optional[str]) -> Optional[str]:
+    if token:
+        try:
+            parse_token(token)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid resume token")
+    return token
+
+
+@router.get("/changes")
+async def user_changes(
+    since: Optional[str] = Query(None, description="Resume after this change token"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Stream user changes as Server-Sent Events; reconnects resume from Last-Event-ID"""
+    token = _resume_token(last_event_id or since)
+
+    async def events():
+        # Browsers retry dropped streams after this many milliseconds
+        yield b"retry: 2000\n\n"
+        async for record in change_feed.subscribe(token, heartbeat=settings.change_feed_heartbeat_s):
+            yield record.sse if record is not None else b": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/changes/ws")
+async def user_changes_ws(websocket: WebSocket, since: Optional[str] = None):
+    """Stream user changes as JSON text messages over a WebSocket"""
+    try:
+        token = _resume_token(since)
+    except HTTPException:
+        await websocket.close(code=1008, reason="Invalid resume token")
+        return
+
+    await websocket.accept()
+    try:
+        async for record in change_feed.subscribe(token, heartbeat=settings.change_feed_heartbeat_s):
+            await websocket.send_text(record.data if record is not None else '{"op":"heartbeat"}')
+    except WebSocketDisconnect:
+        pass
+
+
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: str,
-    user_crud: UserCRUD = Depends(get_user_crud)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_crud: UserBackend = Depends(get_user_crud)
 ):
     """Get user by ID"""
     try:
+        if if_none_match:
+            version = await user_crud.get_user_version(user_id)
+            if version is not None:
+                # Same id form as the 200 response's ETag, whatever case the client sent
+                etag = user_etag(str(ObjectId(user_id)), version)
+                if etag_matches(if_none_match, etag):
+                    return Response(status_code=304, headers={"ETag": etag})
+
         user = await user_crud.get_user(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
+
+        response.headers["ETag"] = user_etag(str(ObjectId(user.id)), user.version)
         return UserResponse(
             id=str(user.id),
             name=user.name,
@@ -76,8 +343,10 @@ async def get_user(
         )
     except HTTPException:
         raise
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        logger.error(f"Error getting user {user_id}: {e}")
+        logger.error("Error getting user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -85,7 +354,7 @@ async def get_user(
 async def update_user(
     user_id: str,
     user_data: UserUpdate,
-    user_crud: UserCRUD = Depends(get_user_crud)
+    user_crud: UserBackend = Depends(get_user_crud)
 ):
     """Update user by ID"""
     try:
@@ -102,15 +371,17 @@ async def update_user(
         raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        logger.error(f"Error updating user {user_id}: {e}")
+        logger.error("Error updating user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.delete("/{user_id}", status_code=204)
 async def delete_user(
     user_id: str,
-    user_crud: UserCRUD = Depends(get_user_crud)
+    user_crud: UserBackend = Depends(get_user_crud)
 ):
     """Delete user by ID"""
     try:
@@ -119,6 +390,8 @@ async def delete_user(
             raise HTTPException(status_code=404, detail="User not found")
     except HTTPException:
         raise
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        logger.error(f"Error deleting user {user_id}: {e}")
+        logger.error("Error deleting user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,249 @@
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import asyncio
+import time
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# Paths (suffixes) served as bulk work, behind interactive reads and writes
+BULK_PATH_SUFFIXES = ("/batch-get", "/stats/reconcile")
+# Long-lived streams hold no database work; a slot each would starve everyone else
+STREAM_PATH_SUFFIXES = ("/changes",)
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str):
+        self.status_code = status_code
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter with priority classes and per-client fair queues.
+
+    The limit grows by ~1 per limit's worth of fast completions and shrinks
+    multiplicatively (at most once per target-latency interval) when a
+    request is slow or fails. Requests over the limit wait in a per-client
+    queue; freed slots go to interactive work first and round-robin across
+    clients within a class. Bulk work may use only ``bulk_share`` of the limit.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 64,
+        min_limit: int = 4,
+        max_limit: int = 512,
+        target_latency: float = 0.25,
+        backoff_ratio: float = 0.9,
+        max_queue: int = 256,
+        queue_timeout: float = 0.1,
+        client_queue_limit: int = 32,
+        bulk_share: float = 0.25,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff_ratio = backoff_ratio
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_queue_limit = client_queue_limit
+        self.bulk_share = bulk_share
+
+        self.in_flight = {priority: 0 for priority in PRIORITIES}
+        self.queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self.queued = 0
+        self._last_decrease = 0.0
+
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "client_queue_full": 0, "queue_timeout": 0, "degraded": 0}
+        self.total_latency = 0.0
+        self.completed = 0
+
+    @property
+    def total_in_flight(self) -> int:
+        return sum(self.in_flight.values())
+
+    def _has_capacity(self, priority: str) -> bool:
+        if self.total_in_flight >= int(self.limit):
+            return False
+        if priority == BULK:
+            return self.in_flight[BULK] < max(1, int(self.limit * self.bulk_share))
+        return True
+
+    async def acquire(self, priority: str, client: str) -> None:
+        """Wait for a slot, or raise Rejected when the queue is full or the wait too long"""
+        if not self.queues[priority] and self._has_capacity(priority):
+            self._grant(priority)
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Rejected(503, "queue_full")
+        client_queue = self.queues[priority].setdefault(client, deque())
+        if len(client_queue) >= self.client_queue_limit:
+            self.rejected["client_queue_full"] += 1
+            raise Rejected(429, "client_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        client_queue.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the timeout fired
+                return
+            waiter.cancel()
+            self._remove(priority, client, waiter)
+            self.rejected["queue_timeout"] += 1
+            raise Rejected(503, "queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority, 0.0, failed=False, record=False)
+            else:
+                waiter.cancel()
+                self._remove(priority, client, waiter)
+            raise
+
+    def release(self, priority: str, latency: float, failed: bool, record: bool = True) -> None:
+        self.in_flight[priority] -= 1
+        if record:
+            self.completed += 1
+            self.total_latency += latency
+            self._adjust(latency, failed)
+        self._dispatch()
+
+    def _grant(self, priority: str) -> None:
+        self.in_flight[priority] += 1
+        self.admitted += 1
+
+    def _adjust(self, latency: float, failed: bool) -> None:
+        if failed or latency > self.target_latency:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.target_latency:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue and self._has_capacity(priority):
+                # Round-robin: take the head client's oldest waiter, then rotate it to the back
+                client, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                self.queued -= 1
+                if waiters:
+                    queue.move_to_end(client)
+                else:
+                    del queue[client]
+                if not waiter.done():
+                    self._grant(priority)
+                    waiter.set_result(None)
+
+    def _remove(self, priority: str, client: str, waiter: asyncio.Future) -> None:
+        waiters = self.queues[priority].get(client)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self.queues[priority][client]
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": dict(self.in_flight),
+            "queued": {priority: sum(map(len, self.queues[priority].values())) for priority in PRIORITIES},
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_latency_ms": 1000 * self.total_latency / self.completed if self.completed else 0.0,
+        }
+
+
+def classify(scope: Scope) -> str:
+    """Priority class of a request"""
+    headers = Headers(scope=scope)
+    if headers.get("x-priority") == BULK or scope["path"].rstrip("/").endswith(BULK_PATH_SUFFIXES):
+        return BULK
+    return INTERACTIVE
+
+
+def client_key(scope: Scope) -> str:
+    """Fair-share key: an explicit client id header, else the peer address"""
+    client_id = Headers(scope=scope).get("x-client-id")
+    if client_id:
+        return client_id
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionControlMiddleware:
+    """
+    Apply an AdaptiveLimiter to requests under ``path_prefix``.
+
+    While ``degraded`` (a callable reading the cached health report) returns
+    True, bulk work is turned away so what capacity is left goes to
+    interactive requests.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: AdaptiveLimiter,
+        path_prefix: str = "",
+        retry_after: int = 1,
+        degraded: Optional[Callable[[], bool]] = None,
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.path_prefix = path_prefix
+        self.retry_after = retry_after
+        self.degraded = degraded
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.path_prefix)
+            or scope["path"].rstrip("/").endswith(STREAM_PATH_SUFFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        priority = classify(scope)
+        try:
+            if priority == BULK and self.degraded is not None and self.degraded():
+                self.limiter.rejected["degraded"] += 1
+                raise Rejected(503, "degraded")
+            await self.limiter.acquire(priority, client_key(scope))
+        except Rejected as e:
+            response = JSONResponse(
+                {"detail": "Server overloaded, retry later", "reason": e.reason},
+                status_code=e.status_code,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        status: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            failed = status is None or status >= 500
+            self.limiter.release(priority, time.perf_counter() - started, failed)
@@ -0,0 +1,220 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, TypeVar
+from pymongo.errors import ConnectionFailure, PyMongoError
+import asyncio
+import functools
+import logging
+import random
+import time
+from .config import settings
+from .deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+OK, SLOW, FAILED = 0, 1, 2
+
+T = TypeVar("T")
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} is open")
+        self.retry_after = retry_after
+
+
+def is_failure(exc: BaseException) -> bool:
+    """Whether an error says the database is unreachable, as opposed to a bad request"""
+    if isinstance(exc, DeadlineExceeded):
+        # Out of budget while still selecting a server or waiting on the network
+        return isinstance(exc.__cause__, ConnectionFailure)
+    if isinstance(exc, ConnectionFailure):
+        return True
+    return isinstance(exc, PyMongoError) and exc.has_error_label("RetryableWriteError")
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient errors worth another attempt; timeouts already used up the budget"""
+    return is_failure(exc) and not isinstance(exc, DeadlineExceeded) and not getattr(exc, "timeout", False)
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is down.
+
+    Closed: calls go through and the last ``window`` outcomes are kept. Once
+    ``min_calls`` are recorded and the share that failed reaches
+    ``failure_rate``, or the share slower than ``slow_call`` seconds reaches
+    ``slow_call_rate``, the circuit opens. Open: calls raise CircuitOpen
+    without touching the dependency for ``open_duration`` seconds. Half-open:
+    up to ``half_open_calls`` trial calls go through; if they all succeed
+    quickly the circuit closes, and any failure opens it again.
+
+    Only dependency errors (see is_failure) count as failures; a duplicate
+    key or validation error is a healthy database doing its job.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call: float = 2.0,
+        slow_call_rate: float = 0.8,
+        open_duration: float = 10.0,
+        half_open_calls: int = 3,
+        retry_attempts: int = 2,
+        retry_base_delay: float = 0.05,
+        retry_max_delay: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.enabled = enabled
+
+        self.state = CLOSED
+        self.outcomes: Deque[int] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+
+        self.opened = 0
+        self.rejected = 0
+        self.retries = 0
+
+    def _transition(self, state: str) -> None:
+        logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self.outcomes.clear()
+        self._trials = 0
+        self._trial_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.opened += 1
+
+    def before_call(self) -> bool:
+        """Admit a call, returning whether it is a half-open trial, or raise CircuitOpen"""
+        if self.state == OPEN:
+            remaining = self.open_duration - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.name, remaining)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.open_duration)
+            self._trials += 1
+            return True
+        return False
+
+    def record(self, trial: bool, latency: Optional[float], failed: bool) -> None:
+        """Count a finished call; ``latency`` None means it is not judged on speed"""
+        outcome = FAILED if failed else SLOW if latency is not None and latency > self.slow_call else OK
+        if trial:
+            if self.state != HALF_OPEN:
+                return
+            if outcome != OK:
+                self._transition(OPEN)
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_calls:
+                self._transition(CLOSED)
+            return
+        if self.state != CLOSED:
+            # Started before the circuit opened; the verdict is already in
+            return
+
+        self.outcomes.append(outcome)
+        if len(self.outcomes) < self.min_calls:
+            return
+        failures = self.outcomes.count(FAILED) / len(self.outcomes)
+        slow = self.outcomes.count(SLOW) / len(self.outcomes)
+        if failures >= self.failure_rate or slow >= self.slow_call_rate:
+            self._transition(OPEN)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform up to the capped exponential delay"""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], retry: bool = False, timed: bool = True) -> T:
+        """Run ``fn`` through the breaker, retrying transient errors when ``retry`` is set"""
+        if not self.enabled:
+            return await fn()
+
+        attempt = 0
+        while True:
+            trial = self.before_call()
+            started = time.perf_counter()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                if trial and self.state == HALF_OPEN:
+                    # Give the trial slot back; the call tells us nothing
+                    self._trials = max(0, self._trials - 1)
+                raise
+            except Exception as e:
+                self.record(trial, None, is_failure(e))
+                if not retry or attempt >= self.retry_attempts or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                deadline = current_deadline()
+                if deadline is not None and deadline.remaining <= delay:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.info("Retrying %s call in %.0fms after: %s", self.name, delay * 1000, e)
+                await asyncio.sleep(delay)
+                continue
+            self.record(trial, time.perf_counter() - started if timed else None, False)
+            return result
+
+    def guard(self, retry: bool = False, timed: bool = True):
+        """Decorator running an async function through call()"""
+        def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            @functools.wraps(fn)
+            async def wrapper(*args: Any, **kwargs: Any) -> T:
+                return await self.call(lambda: fn(*args, **kwargs), retry=retry, timed=timed)
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        calls = len(self.outcomes)
+        return {
+            "state": self.state,
+            "failure_rate": round(self.outcomes.count(FAILED) / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(self.outcomes.count(SLOW) / calls, 3) if calls else 0.0,
+            "calls_in_window": calls,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retries": self.retries,
+        }
+
+
+# Process-wide: every request's UserCRUD shares one view of MongoDB's health
+mongo_breaker = CircuitBreaker(
+    "mongo",
+    window=settings.breaker_window,
+    min_calls=settings.breaker_min_calls,
+    failure_rate=settings.breaker_failure_rate,
+    slow_call=settings.breaker_slow_call_ms / 1000,
+    slow_call_rate=settings.breaker_slow_call_rate,
+    open_duration=settings.breaker_open_s,
+    half_open_calls=settings.breaker_half_open_calls,
+    retry_attempts=settings.breaker_retry_attempts,
+    retry_base_delay=settings.breaker_retry_base_ms / 1000,
+    retry_max_delay=settings.breaker_retry_max_ms / 1000,
+    enabled=settings.breaker_enabled,
+)
@@ -0,0 +1,361 @@
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from bson import Timestamp
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+from .config import settings
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+Key = Tuple[int, int]
+
+
+def parse_token(token: str) -> Key:
+    """Resume token "<seconds>.<counter>" as a comparable key; ValueError if malformed"""
+    seconds, _, counter = token.partition(".")
+    return int(seconds), int(counter)
+
+
+def format_token(key: Key) -> str:
+    return f"{key[0]}.{key[1]}"
+
+
+class ChangeRecord:
+    """One change, serialized once for every subscriber"""
+    __slots__ = ("key", "token", "event", "data", "sse")
+
+    def __init__(self, key: Optional[Key], event: dict):
+        self.key = key
+        self.token = format_token(key) if key is not None else None
+        self.event = {"token": self.token, **event} if key is not None else event
+        self.data = json.dumps(self.event, separators=(",", ":"), default=str)
+        event_id = f"id: {self.token}\n" if key is not None else ""
+        self.sse = f"{event_id}event: {event['op']}\ndata: {self.data}\n\n".encode()
+
+
+# Sent when a subscriber may have missed changes and must reload what it shows
+RESET = ChangeRecord(None, {"op": "reset"})
+
+
+class Lagged(Exception):
+    pass
+
+
+class Broadcaster:
+    """
+    Fan-out of change records to any number of in-process subscribers.
+
+    Records go into one shared ring of the last ``history`` changes; each
+    subscriber only keeps its position in it. Publishing appends and wakes
+    every waiting subscriber through a single shared future, so a change
+    costs one serialization however many subscribers there are. A
+    subscriber that falls more than ``history`` records behind gets RESET.
+    """
+
+    def __init__(self, history: int = 1024):
+        self.history: Deque[ChangeRecord] = deque(maxlen=history)
+        self.seq = 0  # records ever broadcast; a subscriber's position counts the same way
+        # Changes after this key are all still in history
+        self.floor: Key = (int(time.time()), 0)
+        self._changed: Optional[asyncio.Future] = None
+        # Called with every record, e.g. to drop caches on writes from other workers
+        self.listeners: List[Callable[[ChangeRecord], None]] = []
+
+        self.subscribers = 0
+        self.lagged = 0
+
+    def broadcast(self, key: Key, event: dict) -> ChangeRecord:
+        record = ChangeRecord(key, event)
+        if len(self.history) == self.history.maxlen:
+            self.floor = self.history[0].key
+        self.history.append(record)
+        self.seq += 1
+        for listener in self.listeners:
+            listener(record)
+        if self._changed is not None:
+            if not self._changed.get_loop().is_closed():
+                self._changed.set_result(None)
+            self._changed = None
+        return record
+
+    def position_after(self, key: Key) -> Optional[int]:
+        """Position of the first record newer than ``key``, or None if history no longer reaches back"""
+        if key < self.floor:
+            return None
+        oldest = self.seq - len(self.history)
+        for offset, record in enumerate(self.history):
+            if record.key > key:
+                return oldest + offset
+        return self.seq
+
+    async def wait(self, position: int, timeout: Optional[float] = None) -> List[ChangeRecord]:
+        """Records from ``position`` on, waiting up to ``timeout`` for one to arrive"""
+        if position >= self.seq:
+            loop = asyncio.get_running_loop()
+            if self._changed is None or self._changed.get_loop() is not loop:
+                self._changed = loop.create_future()
+            # asyncio.wait leaves the shared future alone when this waiter gives up
+            await asyncio.wait([self._changed], timeout=timeout)
+        oldest = self.seq - len(self.history)
+        if position < oldest:
+            raise Lagged()
+        return list(islice(self.history, position - oldest, None))
+
+    async def subscribe(
+        self,
+        since: Optional[str] = None,
+        backfill: Optional[Callable[[Key], Awaitable[Optional[List[ChangeRecord]]]]] = None,
+        heartbeat: Optional[float] = None,
+    ) -> AsyncIterator[Optional[ChangeRecord]]:
+        """
+        Yield changes after the ``since`` token (or from now), RESET when some
+        were missed, and None every ``heartbeat`` seconds without changes.
+
+        Changes older than history come from ``backfill``, when given.
+        """
+        self.subscribers += 1
+        try:
+            last_key = parse_token(since) if since else None
+            position = self.seq
+            if last_key is not None:
+                found = self.position_after(last_key)
+                if found is not None:
+                    position = found
+                else:
+                    records = await backfill(last_key) if backfill is not None else None
+                    if records is None:
+                        last_key = None
+                        yield RESET
+                    else:
+                        for record in records:
+                            last_key = record.key
+                            yield record
+                    # Whatever is in history now may overlap the backfill; keys skip repeats
+                    position = self.seq - len(self.history)
+
+            while True:
+                try:
+                    records = await self.wait(position, heartbeat)
+                except Lagged:
+                    self.lagged += 1
+                    position, last_key = self.seq, None
+                    yield RESET
+                    continue
+                if not records:
+                    yield None
+                    continue
+                position += len(records)
+                for record in records:
+                    if last_key is not None and record.key <= last_key:
+                        continue
+                    yield record
+                last_key = None
+        finally:
+            self.subscribers -= 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "published": self.seq,
+            "history": len(self.history),
+            "lagged": self.lagged,
+        }
+
+
+class ChangeFeed:
+    """
+    User change events from UserCRUD writes to subscribers in every worker.
+
+    With a collection from ``get_collection``, events are inserted into a
+    capped collection whose ``ts`` field the server stamps with a unique,
+    increasing timestamp; each worker tails it with a tailable cursor and
+    broadcasts what it reads, so all workers deliver the same order and
+    resume tokens. Without one (memory backend, or not shared) events are
+    broadcast directly in this process.
+    """
+
+    COLLECTION = "user_changes"
+
+    def __init__(
+        self,
+        broadcaster: Broadcaster,
+        get_collection: Optional[Callable[[], Optional[AsyncIOMotorCollection]]] = None,
+        capped_size: int = 16 * 1024 * 1024,
+        capped_max: int = 100_000,
+        retry_interval: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.broadcaster = broadcaster
+        self.get_collection = get_collection or (lambda: None)
+        self.capped_size = capped_size
+        self.capped_max = capped_max
+        self.retry_interval = retry_interval
+        self.enabled = enabled
+        self._last_local: Key = (0, 0)
+        self._task: Optional[asyncio.Task] = None
+
+        self.publish_errors = 0
+        self.tail_errors = 0
+
+    def _local_key(self) -> Key:
+        now = int(time.time())
+        seconds, counter = self._last_local
+        self._last_local = (now, 1) if now > seconds else (seconds, counter + 1)
+        return self._last_local
+
+    async def publish(self, op: str, user_id: str, user: Optional[dict] = None) -> None:
+        """Announce a change; failures are logged, never raised into the write"""
+        if not self.enabled:
+            return
+        event = {
+            "op": op,
+            "id": user_id,
+            "user": user,
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        }
+        collection = self.get_collection()
+        if collection is None:
+            self.broadcaster.broadcast(self._local_key(), event)
+            return
+        try:
+            # An empty timestamp right after _id is filled in by the server
+            await collection.insert_one({"ts": Timestamp(0, 0), **event})
+        except PyMongoError as e:
+            self.publish_errors += 1
+            logger.warning("Could not publish user change: %s", e)
+
+    async def publish_many(self, op: str, user_ids: List[str]) -> None:
+        """Announce the same change for many users, e.g. a bulk delete chunk, in one insert"""
+        if not self.enabled or not user_ids:
+            return
+        at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        events = [{"op": op, "id": user_id, "user": None, "at": at} for user_id in user_ids]
+        collection = self.get_collection()
+        if collection is None:
+            for event in events:
+                self.broadcaster.broadcast(self._local_key(), event)
+            return
+        try:
+            await collection.insert_many([{"ts": Timestamp(0, 0), **event} for event in events], ordered=True)
+        except PyMongoError as e:
+            self.publish_errors += 1
+            logger.warning("Could not publish %s user changes: %s", len(events), e)
+
+    async def user_changed(self, op: str, user: Any) -> None:
+        """Publish a created or updated UserModel"""
+        await self.publish(op, user.id, {"name": user.name, "email": user.email, "version": user.version})
+
+    async def start(self, database: AsyncIOMotorDatabase) -> None:
+        """Create the capped collection if needed and start tailing it"""
+        if self.get_collection() is None or self._task is not None:
+            return
+        try:
+            await database.create_collection(
+                self.COLLECTION, capped=True, size=self.capped_size, max=self.capped_max
+            )
+        except CollectionInvalid:
+            pass  # already exists
+        except PyMongoError as e:
+            logger.warning("Could not create the change feed collection: %s", e)
+        self._task = asyncio.ensure_future(self._tail())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @staticmethod
+    def _key(ts: Timestamp) -> Key:
+        return ts.time, ts.inc
+
+    @staticmethod
+    def _event(doc: dict) -> dict:
+        return {field: doc.get(field) for field in ("op", "id", "user", "at")}
+
+    async def _tail(self) -> None:
+        last: Optional[Timestamp] = None
+        while True:
+            collection = self.get_collection()
+            try:
+                if last is None:
+                    newest = await collection.find_one({}, sort=[("$natural", -1)])
+                    last = newest["ts"] if newest else Timestamp(int(time.time()), 0)
+                    self.broadcaster.floor = self._key(last)
+                cursor = collection.find({"ts": {"$gt": last}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                # An idle getMore returns no documents but leaves the cursor open, so
+                # keep reading it; only a dead cursor (e.g. the collection was empty
+                # when it was opened) needs a new query
+                while cursor.alive:
+                    try:
+                        doc = await cursor.next()
+                    except StopAsyncIteration:
+                        continue
+                    last = doc["ts"]
+                    self.broadcaster.broadcast(self._key(last), self._event(doc))
+            except PyMongoError as e:
+                self.tail_errors += 1
+                logger.warning("Change feed tail failed, retrying: %s", e)
+            await asyncio.sleep(self.retry_interval)
+
+    async def backfill(self, after: Key) -> Optional[List[ChangeRecord]]:
+        """Changes after ``after`` from the capped collection, or None if some were already evicted"""
+        collection = self.get_collection()
+        if collection is None:
+            return None
+        limit = self.broadcaster.history.maxlen
+        try:
+            oldest = await collection.find_one({}, sort=[("$natural", 1)])
+            if oldest is not None and self._key(oldest["ts"]) > after:
+                return None
+            docs = await collection.find({"ts": {"$gt": Timestamp(*after)}}).sort("$natural", 1).to_list(limit + 1)
+        except PyMongoError as e:
+            logger.warning("Change feed backfill failed: %s", e)
+            return None
+        if len(docs) > limit:
+            # Too far behind to replay; cheaper for the client to reload
+            return None
+        return [ChangeRecord(self._key(doc["ts"]), self._event(doc)) for doc in docs]
+
+    def subscribe(self, since: Optional[str] = None, heartbeat: Optional[float] = None):
+        return self.broadcaster.subscribe(since, self.backfill, heartbeat)
+
+    def stats(self) -> dict:
+        return {
+            **self.broadcaster.stats(),
+            "shared": self.get_collection() is not None,
+            "publish_errors": self.publish_errors,
+            "tail_errors": self.tail_errors,
+        }
+
+
+def change_collection() -> Optional[AsyncIOMotorCollection]:
+    """The capped collection shared by workers, when storage is MongoDB and sharing is on"""
+    if not settings.change_feed_shared or settings.storage_backend == "memory" or db.database is None:
+        return None
+    return db.database[ChangeFeed.COLLECTION]
+
+
+# Process-wide: subscribers in this worker share one broadcaster
+change_feed = ChangeFeed(
+    Broadcaster(history=settings.change_feed_history),
+    get_collection=change_collection,
+    capped_size=settings.change_feed_capped_bytes,
+    capped_max=settings.change_feed_capped_max,
+    enabled=settings.change_feed_enabled,
+)
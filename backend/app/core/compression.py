@@ -0,0 +1,260 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import hashlib
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+# Preferred order when the client accepts several encodings equally
+SUPPORTED_ENCODINGS = [
+    name for name, module in (("br", brotli), ("zstd", zstandard), ("gzip", zlib))
+    if module is not None
+]
+
+# Levels at or above these are slow enough to be moved off the event loop
+HEAVY_LEVELS = {"gzip": 9, "br": 9, "zstd": 15}
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str] = SUPPORTED_ENCODINGS) -> Optional[str]:
+    """Pick the best available encoding from an Accept-Encoding header"""
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StreamCompressor:
+    """Incremental compressor with a common interface across encodings"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+            self._compress = self._compressor.process
+            self._finish = self._compressor.finish
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress_bytes(encoding: str, data: bytes, level: int) -> bytes:
+    """Compress a complete body in one shot"""
+    compressor = StreamCompressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+class CompressionMiddleware:
+    """ASGI middleware negotiating gzip, brotli or zstd response compression"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+        zstd_level: int = 3,
+        offload_size: int = 256 * 1024,
+        cache_size: int = 128,
+        cacheable_paths: Iterable[str] = (),
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+        self.offload_size = offload_size
+        self.cache_size = cache_size
+        self.cacheable_paths = set(cacheable_paths)
+        self.cache: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            encoding = negotiate_encoding(headers.get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressionResponder(self, scope, encoding, send)
+                await self.app(scope, receive, responder.send)
+                return
+        await self.app(scope, receive, send)
+
+    def should_offload(self, encoding: str, size: int) -> bool:
+        """Decide whether compressing this body would block the event loop too long"""
+        return size >= self.offload_size or self.levels[encoding] >= HEAVY_LEVELS[encoding]
+
+    async def compress(self, encoding: str, data: bytes) -> bytes:
+        level = self.levels[encoding]
+        if self.should_offload(encoding, len(data)):
+            return await run_in_threadpool(compress_bytes, encoding, data, level)
+        return compress_bytes(encoding, data, level)
+
+    def cache_key(self, scope: Scope, headers: Headers, encoding: str, body: bytes) -> Optional[Tuple[str, str, str]]:
+        """Key for cacheable responses: ETagged pages or configured static paths"""
+        if self.cache_size <= 0:
+            return None
+        path = scope.get("path", "")
+        etag = headers.get("etag")
+        if etag:
+            return (encoding, f"{path}?{scope.get('query_string', b'').decode()}", etag)
+        if path in self.cacheable_paths:
+            return (encoding, path, hashlib.sha1(body).hexdigest())
+        return None
+
+    def cache_get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        compressed = self.cache.get(key)
+        if compressed is None:
+            self.cache_misses += 1
+            return None
+        self.cache.move_to_end(key)
+        self.cache_hits += 1
+        return compressed
+
+    def cache_put(self, key: Tuple[str, str, str], compressed: bytes) -> None:
+        self.cache[key] = compressed
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+class _CompressionResponder:
+    """Per-request send wrapper that compresses the outgoing body"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, encoding: str, send: Send):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self._send = send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Optional[StreamCompressor] = None
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold the start message until the first body chunk decides the headers
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+                # Each event must reach the client as soon as it is sent
+                or content_type.startswith("text/event-stream")
+            )
+        elif message_type != "http.response.body":
+            await self._send(message)
+        elif self.passthrough:
+            await self._start()
+            await self._send(message)
+        elif not self.started:
+            await self._first_body(message)
+        else:
+            await self._next_body(message)
+
+    async def _start(self) -> None:
+        if not self.started:
+            self.started = True
+            await self._send(self.initial_message)
+
+    def _set_encoding_headers(self) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The encoded representation is no longer byte-identical
+            headers["ETag"] = f"W/{etag}"
+        return headers
+
+    async def _first_body(self, message: Message) -> None:
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not more_body:
+            if len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self._start()
+                await self._send(message)
+                return
+
+            headers = Headers(raw=self.initial_message["headers"])
+            key = self.middleware.cache_key(self.scope, headers, self.encoding, body)
+            compressed = self.middleware.cache_get(key) if key else None
+            if compressed is None:
+                compressed = await self.middleware.compress(self.encoding, body)
+                if key:
+                    self.middleware.cache_put(key, compressed)
+
+            headers = self._set_encoding_headers()
+            headers["Content-Length"] = str(len(compressed))
+            message["body"] = compressed
+            await self._start()
+            await self._send(message)
+            return
+
+        # Streaming response: compress each chunk as it arrives
+        headers = self._set_encoding_headers()
+        del headers["Content-Length"]
+        self.compressor = StreamCompressor(self.encoding, self.middleware.levels[self.encoding])
+        message["body"] = await self._compress_chunk(body, finish=False)
+        await self._start()
+        await self._send(message)
+
+    async def _next_body(self, message: Message) -> None:
+        more_body = message.get("more_body", False)
+        message["body"] = await self._compress_chunk(message.get("body", b""), finish=not more_body)
+        await self._send(message)
+
+    async def _compress_chunk(self, chunk: bytes, finish: bool) -> bytes:
+        def work() -> bytes:
+            data = self.compressor.compress(chunk)
+            if finish:
+                data += self.compressor.finish()
+            return data
+
+        if self.middleware.should_offload(self.encoding, len(chunk)):
+            return await run_in_threadpool(work)
+        return work()
@@ -8,6 +8,7 @@ class Settings(BaseSettings):
     # Database Configuration
     mongodb_url: str = "mongodb://localhost:27017"
     database_name: str = "fastapi_db"
+    mongodb_server_selection_timeout_ms: int = 5000  # driver default is 30s
 
     # API Configuration
     api_v1_str: str = "/api/v1"
@@ -17,6 +18,12 @@ class Settings(BaseSettings):
     # Server Configuration
     host: str = "0.0.0.0"
     port: int = 8570
+    workers: int = 0  # 0 = one worker per available CPU
+    backlog: int = 2048
+    keep_alive_timeout: int = 5
+    graceful_timeout: int = 30
+    max_requests: int = 0  # Recycle a worker after this many requests (0 = never)
+    max_requests_jitter: int = 0
 
     # Development Settings
     debug: bool = False
@@ -29,8 +36,170 @@ class Settings(BaseSettings):
     # CORS Settings (JSON string format)
     allowed_origins: str = '["http://localhost:8571", "http://localhost:3000"]'
 
-    # Logging Configuration
+    # Storage Backend: "mongo", or "memory" to keep users in process (edge and
+    # sidecar deployments, tests, benchmarks). A memory snapshot path, when set,
+    # is restored on startup and written on shutdown
+    storage_backend: str = "mongo"
+    memory_snapshot_path: str = ""
+
+    # Consistency Profiles (JSON string format): profiles are attached to UserCRUD
+    # operations with collection options; writing requests use a causal session.
+    # bulk_create is the write-behind insert_many, acknowledged by the primary alone
+    consistency_profiles: str = (
+        '{"primary": {"read_preference": "primary"}, '
+        '"majority_write": {"w": "majority", "read_concern": "majority"}, '
+        '"fast_write": {"w": 1}, '
+        '"replica_read": {"read_preference": "secondaryPreferred", "read_concern": "majority"}}'
+    )
+    consistency_operations: str = (
+        '{"get": "primary", "list": "replica_read", "count": "replica_read", '
+        '"batch_get": "replica_read", "create": "majority_write", "bulk_create": "fast_write", '
+        '"update": "majority_write", "delete": "majority_write", "bulk_delete": "majority_write", '
+        '"migration": "majority_write"}'
+    )
+    causal_consistency: bool = True
+
+    # Request Deadlines (milliseconds). Clients may ask for a budget with the
+    # X-Request-Timeout header; route defaults are JSON {"METHOD /path": ms}
+    deadline_default_ms: int = 10000
+    deadline_max_ms: int = 60000
+    deadline_route_defaults: str = (
+        '{"POST /api/v1/users/batch-get": 30000, "POST /api/v1/users/stats/reconcile": 60000}'
+    )
+
+    # Batching Configuration
+    user_loader_window_ms: float = 0.0  # 0 = batch lookups issued in the same event-loop tick
+    user_loader_max_batch_size: int = 1000
+
+    # Batch-get Configuration
+    batch_get_max_ids: int = 5000
+    batch_get_chunk_size: int = 500
+
+    # Write-behind Configuration (batch concurrent creates into insert_many)
+    write_behind_enabled: bool = False
+    write_behind_batch_size: int = 500
+    write_behind_flush_ms: float = 5.0
+    write_behind_max_queue: int = 5000
+
+    # User Stats (materialized totals; the reconciler recounts them periodically)
+    stats_reconcile_interval_s: int = 0  # 0 = only on demand via POST /users/stats/reconcile
+
+    # Bulk Delete Jobs (users deleted by filter in throttled chunks; state in bulk_delete_jobs)
+    bulk_delete_target_ms: float = 200.0  # chunk latency the throttle steers toward
+    bulk_delete_min_batch: int = 10
+    bulk_delete_max_batch: int = 1000
+    bulk_delete_initial_batch: int = 100
+    bulk_delete_duty_cycle: float = 0.5  # share of time spent deleting; the rest is pause
+    bulk_delete_lease_s: float = 30.0  # a job whose worker stops saving progress is resumed elsewhere
+    bulk_delete_poll_s: float = 5.0
+    bulk_delete_concurrency: int = 1  # jobs run at once per worker
+
+    # Data Migrations (python -m app.migrations; batches paced against a latency budget)
+    migration_target_ms: float = 100.0  # batch latency the throttle steers toward
+    migration_min_batch: int = 50
+    migration_max_batch: int = 2000
+    migration_initial_batch: int = 200
+    migration_duty_cycle: float = 0.5  # share of time spent writing; the rest is pause
+    migration_lease_s: float = 60.0  # a migration whose runner stops saving progress can be taken over
+
+    # List Page Cache (rendered GET /users pages, dropped on any user write)
+    page_cache_size: int = 256  # pages kept; 0 disables the cache
+    page_cache_ttl_s: float = 10.0  # bounds staleness from writes this worker did not see
+    page_cache_prefetch: bool = True  # render page N+1 in the background when page N is served
+    page_cache_max_prefetches: int = 4
+
+    # Change Feed (user changes streamed over SSE/WebSocket). Shared across
+    # workers through a capped collection unless CHANGE_FEED_SHARED is off
+    change_feed_enabled: bool = True
+    change_feed_shared: bool = True
+    change_feed_history: int = 1024  # recent changes kept in memory for resume
+    change_feed_capped_bytes: int = 16 * 1024 * 1024
+    change_feed_capped_max: int = 100000
+    change_feed_heartbeat_s: float = 15.0
+
+    # Idempotency (Idempotency-Key header on POSTs under /api/v1/users)
+    idempotency_enabled: bool = True
+    idempotency_ttl_s: int = 86400
+    idempotency_cache_size: int = 10000
+    idempotency_cache_bytes: int = 64 * 1024 * 1024  # total response bytes kept in-process per worker
+    idempotency_lock_timeout_s: float = 30.0  # how long a duplicate waits on an attempt in progress
+    idempotency_max_body_bytes: int = 1024 * 1024  # larger responses are not stored
+
+    # Admission Control (adaptive concurrency limit in front of the users API)
+    admission_enabled: bool = True
+    admission_initial_limit: int = 64
+    admission_min_limit: int = 4
+    admission_max_limit: int = 512
+    admission_target_latency_ms: float = 250.0
+    admission_backoff_ratio: float = 0.9
+    admission_max_queue: int = 256
+    admission_queue_timeout_ms: float = 100.0
+    admission_client_queue_limit: int = 32
+    admission_bulk_share: float = 0.25
+    admission_retry_after: int = 1
+
+    # Circuit Breaker (fast 503s instead of waiting on an unreachable MongoDB)
+    breaker_enabled: bool = True
+    breaker_window: int = 20  # most recent calls judged
+    breaker_min_calls: int = 10
+    breaker_failure_rate: float = 0.5
+    breaker_slow_call_ms: float = 2000.0
+    breaker_slow_call_rate: float = 0.8
+    breaker_open_s: float = 10.0  # before half-open trial calls
+    breaker_half_open_calls: int = 3
+    breaker_retry_attempts: int = 2  # extra attempts for reads on transient errors
+    breaker_retry_base_ms: float = 50.0
+    breaker_retry_max_ms: float = 1000.0
+
+    # Health Checks (readiness is computed in the background; probes never query MongoDB)
+    health_check_interval_s: float = 5.0
+    health_ping_timeout_s: float = 2.0
+    health_failure_threshold: int = 2  # consecutive failed pings before unhealthy
+    health_degraded_ping_ms: float = 100.0
+    health_degraded_pool_ratio: float = 0.9  # of maxPoolSize checked out
+    health_degraded_loop_lag_ms: float = 200.0
+
+    # Compression Configuration
+    compression_minimum_size: int = 500
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+    compression_zstd_level: int = 3
+    compression_offload_size: int = 256 * 1024
+    compression_cache_size: int = 128
+
+    # Tracing (span tree per request; kept when head-sampled, slow or failed)
+    tracing_enabled: bool = True
+    tracing_sample_rate: float = 0.01
+    tracing_slow_ms: float = 500.0
+    tracing_max_spans: int = 500  # per trace
+    tracing_buffer_size: int = 200  # recent traces served at /debug/traces
+    tracing_export_path: str = ""  # also append OTLP JSON lines to this file
+
+    # Slow Query Log (MongoDB commands over the threshold, at /debug/slow-queries)
+    slow_query_enabled: bool = True
+    slow_query_ms: float = 100.0
+    slow_query_buffer_size: int = 500
+    slow_query_explain_sample_rate: float = 0.1  # of slow commands, re-run as explain("executionStats")
+    slow_query_explain_interval_s: float = 60.0  # at most one explain per query shape per interval
+
+    # Memory Profiling (tracemalloc is off until started at /debug/memory/tracemalloc/start)
+    memory_profile_max_snapshots: int = 4  # per worker; the oldest is dropped first
+    memory_profile_frames: int = 1  # traceback depth recorded per allocation
+
+    # Event Loop Watchdog (lag histogram; stacks of blocking code at /debug/loop-stalls)
+    loop_watchdog_enabled: bool = True
+    loop_watchdog_interval_ms: float = 50.0  # how often lag is sampled
+    loop_watchdog_threshold_ms: float = 100.0  # blocked this long, the loop thread's stack is captured
+    loop_watchdog_buffer_size: int = 100
+    loop_watchdog_max_frames: int = 40
+
+    # Logging Configuration (records go through a queue to a background writer)
     log_level: str = "INFO"
+    log_format: str = "json"  # json | text
+    log_queue_size: int = 10000  # records beyond this are dropped rather than block
+    access_log_enabled: bool = True
+    access_log_sample_rate: float = 1.0  # fraction of non-5xx requests logged
+    access_log_rate_limit: float = 0.0  # access lines per second, 0 = unlimited
 
     class Config:
         env_file = ".env"
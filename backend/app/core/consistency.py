@@ -0,0 +1,59 @@
+from pymongo import ReadPreference, WriteConcern
+from pymongo.read_concern import ReadConcern
+from functools import lru_cache
+from typing import Dict
+import json
+import logging
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def collection_options(profile: dict) -> dict:
+    """Translate a profile ({"w", "j", "wtimeout_ms", "read_preference", "read_concern"})
+    into keyword arguments for ``get_collection``/``with_options``"""
+    options = {}
+    write_concern = {
+        key: profile[name]
+        for name, key in (("w", "w"), ("j", "j"), ("wtimeout_ms", "wtimeout"))
+        if name in profile
+    }
+    if write_concern:
+        options["write_concern"] = WriteConcern(**write_concern)
+    if "read_preference" in profile:
+        options["read_preference"] = READ_PREFERENCES[profile["read_preference"]]
+    if "read_concern" in profile:
+        options["read_concern"] = ReadConcern(profile["read_concern"])
+    return options
+
+
+@lru_cache(maxsize=None)
+def _operation_options(profiles_json: str, operations_json: str) -> Dict[str, dict]:
+    try:
+        profiles = json.loads(profiles_json)
+        operations = json.loads(operations_json)
+    except (json.JSONDecodeError, TypeError):
+        logger.error("Invalid consistency profile settings, using client defaults")
+        return {}
+
+    resolved = {}
+    for operation, profile_name in operations.items():
+        if profile_name not in profiles:
+            logger.error("Unknown consistency profile '%s' for '%s'", profile_name, operation)
+            continue
+        resolved[operation] = collection_options(profiles[profile_name])
+    return resolved
+
+
+def options_for(operation: str) -> dict:
+    """Collection options for a named operation (empty = client defaults)"""
+    resolved = _operation_options(settings.consistency_profiles, settings.consistency_operations)
+    return resolved.get(operation, {})
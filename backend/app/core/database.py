@@ -1,5 +1,9 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from .config import settings
+from .health import health_checker, pool_monitor
+from .logs import db_timer
+from .slow_queries import slow_query_log
+from .tracing import mongo_tracer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,8 +24,15 @@ async def get_database():
 async def connect_to_mongo():
     """Create database connection"""
     logger.info("Connecting to MongoDB...")
-    db.client = AsyncIOMotorClient(settings.mongodb_url)
+    db.client = AsyncIOMotorClient(
+        settings.mongodb_url,
+        serverSelectionTimeoutMS=settings.mongodb_server_selection_timeout_ms,
+        event_listeners=[db_timer, mongo_tracer, slow_query_log, pool_monitor],
+    )
     db.database = db.client[settings.database_name]
+    # Explains of slow queries run on a background thread with the sync client
+    slow_query_log.get_client = lambda: db.client.delegate
+    health_checker.get_client = lambda: db.client
     logger.info("Connected to MongoDB!")
 
 
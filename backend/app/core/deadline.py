@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+from pymongo.errors import PyMongoError
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import asyncio
+import functools
+import json
+import logging
+import time
+
+import pymongo
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "x-request-timeout"
+
+T = TypeVar("T")
+
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def remaining(self) -> float:
+        return self.budget - self.elapsed
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, deadline: Deadline):
+        super().__init__("Request deadline exceeded")
+        self.budget_ms = round(deadline.budget * 1000)
+        self.elapsed_ms = round(deadline.elapsed * 1000)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope() -> Iterator[None]:
+    """
+    Bound the MongoDB work inside the block by the request's remaining budget.
+
+    pymongo.timeout applies the budget as maxTimeMS on each command and to
+    server selection and connection-pool checkout. Motor copies the context
+    into its executor threads, so this covers async calls too.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        yield
+        return
+
+    remaining = deadline.remaining
+    if remaining <= 0:
+        raise DeadlineExceeded(deadline)
+    try:
+        with pymongo.timeout(remaining):
+            yield
+    except PyMongoError as e:
+        if e.timeout:
+            raise DeadlineExceeded(deadline) from e
+        raise
+
+
+def with_deadline(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Run an async function inside deadline_scope()"""
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        with deadline_scope():
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+async def wait_shared(future: "asyncio.Future[T]") -> T:
+    """
+    Wait for work shared with other requests (a coalesced or batched read)
+    no longer than this request's remaining budget.
+
+    The shared work runs under the budget of the request that started it;
+    a later caller with a shorter budget gives up on its own, without
+    cancelling the work for the others.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return await asyncio.shield(future)
+
+    remaining = deadline.remaining
+    if remaining <= 0:
+        raise DeadlineExceeded(deadline)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), remaining)
+    except asyncio.TimeoutError:
+        if future.done():
+            raise  # the shared work itself timed out
+        raise DeadlineExceeded(deadline) from None
+
+
+def parse_route_defaults(value: str) -> Dict[str, float]:
+    """Parse {"METHOD /path": milliseconds} JSON into seconds"""
+    try:
+        return {route: ms / 1000 for route, ms in json.loads(value).items()}
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        logger.error("Invalid deadline route defaults, ignoring")
+        return {}
+
+
+class DeadlineMiddleware:
+    """
+    Give each request under ``path_prefix`` a deadline and stop its work when the
+    client goes away.
+
+    The budget comes from the X-Request-Timeout header (milliseconds, capped at
+    ``max_budget``), else a per-route default, else ``default_budget``.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        path_prefix: str = "",
+        default_budget: float = 10.0,
+        max_budget: float = 60.0,
+        route_budgets: Optional[Dict[str, float]] = None,
+    ):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.default_budget = default_budget
+        self.max_budget = max_budget
+        self.route_budgets = route_budgets or {}
+        self.disconnect_cancellations = 0
+
+    def budget_for(self, scope: Scope) -> float:
+        header = Headers(scope=scope).get(DEADLINE_HEADER)
+        if header:
+            try:
+                return min(max(float(header), 0.0) / 1000, self.max_budget)
+            except ValueError:
+                pass
+        route = f"{scope['method']} {scope['path'].rstrip('/')}"
+        return self.route_budgets.get(route, self.default_budget)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        token = _current.set(Deadline(self.budget_for(scope)))
+        messages: "asyncio.Queue[Message]" = asyncio.Queue()
+        response_complete = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        # The app task copies the context, so it sees the deadline
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, send_wrapper))
+
+        async def pump() -> None:
+            # Sole reader of the server's receive: forwards messages to the app and
+            # cancels it if the client disconnects before the response is done
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not response_complete and not app_task.done():
+                        self.disconnect_cancellations += 1
+                        logger.info("Client disconnected, cancelling %s %s", scope["method"], scope["path"])
+                        app_task.cancel()
+                    return
+
+        pump_task = asyncio.ensure_future(pump())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not app_task.cancelled():
+                # We were cancelled ourselves (e.g. shutdown): take the app down with us
+                app_task.cancel()
+                raise
+            # Cancelled because the client left; nobody is waiting for a response
+        finally:
+            pump_task.cancel()
+            _current.reset(token)
@@ -0,0 +1,31 @@
+from typing import Iterable, Optional, Tuple
+import hashlib
+
+
+def user_etag(user_id: str, version: int) -> str:
+    """Build the ETag for a single user document"""
+    return f'"{user_id}-{version}"'
+
+
+def list_etag(entries: Iterable[Tuple[str, int]], total: int, page: int, size: int) -> str:
+    """Build the ETag for a list page from its (id, version) pairs and paging info"""
+    digest = hashlib.sha1(f"{total}:{page}:{size}".encode())
+    for user_id, version in entries:
+        digest.update(f"|{user_id}-{version}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,263 @@
+from datetime import datetime, timezone
+from pymongo import common, monitoring
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from .breaker import CLOSED, CircuitBreaker, mongo_breaker
+from .config import settings
+from .loop_watchdog import loop_watchdog
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+UNHEALTHY = "unhealthy"
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connections checked out of and waited for in each server's pool, from driver events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pools: Dict[Any, Dict[str, int]] = {}
+
+    def _pool(self, address: Any) -> Dict[str, int]:
+        return self.pools.setdefault(address, {"in_use": 0, "waiting": 0, "max_size": common.MAX_POOL_SIZE})
+
+    def _add(self, address: Any, field: str, delta: int) -> None:
+        with self._lock:
+            pool = self._pool(address)
+            pool[field] = max(0, pool[field] + delta)
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        with self._lock:
+            # Options only list non-default values
+            self._pool(event.address)["max_size"] = event.options.get("maxPoolSize", common.MAX_POOL_SIZE)
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        with self._lock:
+            self.pools.pop(event.address, None)
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        self._add(event.address, "waiting", 1)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        self._add(event.address, "waiting", -1)
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["in_use"] += 1
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        self._add(event.address, "in_use", -1)
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def stats(self) -> dict:
+        """Totals over all servers, and the fullest pool's saturation"""
+        with self._lock:
+            pools = [dict(pool) for pool in self.pools.values()]
+        saturation = max((pool["in_use"] / pool["max_size"] for pool in pools if pool["max_size"]), default=0.0)
+        return {
+            "in_use": sum(pool["in_use"] for pool in pools),
+            "waiting": sum(pool["waiting"] for pool in pools),
+            "saturation": round(saturation, 3),
+        }
+
+
+class HealthChecker:
+    """
+    Readiness computed in the background and served from a cache.
+
+    Every ``interval`` seconds a task pings MongoDB (the client from
+    ``get_client``; None skips the check), reads pool usage from ``pool``
+    and the worst event-loop lag since the last check from ``get_loop_lag``
+    (the loop watchdog's samples). Probes only read the cached report, so
+    probe traffic never reaches the database.
+
+    The report is unhealthy once ``failure_threshold`` consecutive pings
+    fail, or when no check has completed recently; it is degraded on a
+    single failed or slow ping, a nearly exhausted pool, a lagging loop or
+    a ``breaker`` that is not closed.
+    """
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        ping_timeout: float = 2.0,
+        degraded_ping: float = 0.1,
+        degraded_pool_ratio: float = 0.9,
+        degraded_loop_lag: float = 0.2,
+        failure_threshold: int = 2,
+        get_client: Optional[Callable[[], Any]] = None,
+        get_loop_lag: Optional[Callable[[], float]] = None,
+        pool: Optional[PoolMonitor] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.degraded_ping = degraded_ping
+        self.degraded_pool_ratio = degraded_pool_ratio
+        self.degraded_loop_lag = degraded_loop_lag
+        self.failure_threshold = failure_threshold
+        self.get_client = get_client or (lambda: None)
+        self.get_loop_lag = get_loop_lag or (lambda: 0.0)
+        self.pool = pool
+        self.breaker = breaker
+
+        self.loop_lag = 0.0
+        self.consecutive_failures = 0
+        self.checks = 0
+        self.transitions = 0
+        self._report: Optional[dict] = None
+        self._checked_at: Optional[float] = None
+        self._ping: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error("Health check failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def check(self) -> dict:
+        """Run every check once and cache the report"""
+        mongo = await self._check_mongo()
+        pool = self.pool.stats() if self.pool is not None else None
+        breaker = self.breaker.stats() if self.breaker is not None else None
+        self.loop_lag = self.get_loop_lag()
+
+        reasons: List[str] = []
+        status = HEALTHY
+        if mongo["status"] == "error":
+            if self.consecutive_failures >= self.failure_threshold:
+                status = UNHEALTHY
+            reasons.append(f"mongo ping failed: {mongo['error']}")
+        elif mongo["status"] == "ok" and mongo["latency_ms"] > self.degraded_ping * 1000:
+            reasons.append(f"mongo ping {mongo['latency_ms']}ms")
+        if pool is not None and pool["saturation"] >= self.degraded_pool_ratio:
+            reasons.append(f"connection pool {pool['saturation']:.0%} in use, {pool['waiting']} waiting")
+        if breaker is not None and breaker["state"] != CLOSED:
+            reasons.append(f"mongo circuit {breaker['state']}")
+        if self.loop_lag > self.degraded_loop_lag:
+            reasons.append(f"event loop lag {self.loop_lag * 1000:.0f}ms")
+        if reasons and status == HEALTHY:
+            status = DEGRADED
+
+        previous = self._report["status"] if self._report else None
+        if previous is not None and previous != status:
+            self.transitions += 1
+            logger.warning("Health changed from %s to %s: %s", previous, status, "; ".join(reasons) or "ok")
+
+        self.checks += 1
+        self._checked_at = time.monotonic()
+        self._report = {
+            "status": status,
+            "reasons": reasons,
+            "checked_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "checks": {
+                "mongo": mongo,
+                "pool": pool,
+                "circuit_breaker": breaker,
+                "event_loop": {"lag_ms": round(self.loop_lag * 1000, 1)},
+            },
+        }
+        return self._report
+
+    async def _check_mongo(self) -> dict:
+        client = self.get_client()
+        if client is None:
+            return {"status": "skipped"}
+
+        # A ping still hanging from an earlier check is waited on, not repeated,
+        # so an unreachable server never piles up probes
+        if self._ping is None or self._ping.done():
+            self._ping = asyncio.ensure_future(client.admin.command("ping"))
+            self._ping.add_done_callback(lambda ping: ping.cancelled() or ping.exception())
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ping), self.ping_timeout)
+        except asyncio.TimeoutError:
+            error = f"no reply in {self.ping_timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        else:
+            self.consecutive_failures = 0
+            return {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+        self.consecutive_failures += 1
+        return {"status": "error", "error": error, "consecutive_failures": self.consecutive_failures}
+
+    def report(self) -> dict:
+        """The cached report; unhealthy before the first check or when checks have stopped"""
+        if self._report is None:
+            return {"status": UNHEALTHY, "reasons": ["no health check completed yet"], "checked_at": None, "checks": {}}
+        age = time.monotonic() - self._checked_at
+        if age > 3 * self.interval + self.ping_timeout:
+            return {**self._report, "status": UNHEALTHY, "reasons": [f"last health check {age:.0f}s ago"]}
+        return self._report
+
+    @property
+    def status(self) -> str:
+        return self.report()["status"]
+
+    @property
+    def degraded(self) -> bool:
+        """Whether checks have run and found a problem"""
+        return self._report is not None and self.status != HEALTHY
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "checks": self.checks,
+            "transitions": self.transitions,
+            "consecutive_failures": self.consecutive_failures,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+        }
+
+
+# Process-wide; connect_to_mongo registers pool_monitor with the client
+pool_monitor = PoolMonitor()
+health_checker = HealthChecker(
+    interval=settings.health_check_interval_s,
+    ping_timeout=settings.health_ping_timeout_s,
+    degraded_ping=settings.health_degraded_ping_ms / 1000,
+    degraded_pool_ratio=settings.health_degraded_pool_ratio,
+    degraded_loop_lag=settings.health_degraded_loop_lag_ms / 1000,
+    failure_threshold=settings.health_failure_threshold,
+    get_loop_lag=loop_watchdog.peak_lag,
+    pool=pool_monitor,
+    breaker=mongo_breaker,
+)
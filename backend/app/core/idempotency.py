@@ -0,0 +1,407 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+# Server error code for an index that exists with other options
+INDEX_OPTIONS_CONFLICT = 85
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status", "headers", "body", "age")
+
+    def __init__(
+        self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, age: float = 0.0
+    ):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # Seconds since the key was first used, when loaded from MongoDB
+        self.age = age
+
+    @classmethod
+    def from_document(cls, document: dict) -> "StoredResponse":
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in document["headers"]]
+        created_at = document["created_at"].replace(tzinfo=timezone.utc)
+        age = max(0.0, (datetime.now(timezone.utc) - created_at).total_seconds())
+        return cls(document["fingerprint"], document["status"], headers, bytes(document["body"]), age)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class KeyReused(Exception):
+    """The key was already used for a different request"""
+
+
+class KeyInProgress(Exception):
+    """Another attempt with the key is still running"""
+
+
+class IdempotencyStore:
+    """
+    Responses by idempotency key: an in-process LRU in front of a MongoDB
+    collection whose TTL index expires keys after ``ttl`` seconds. The LRU
+    holds at most ``cache_size`` responses and ``cache_bytes`` of them, and
+    forgets a key after ``ttl`` too, so it never replays one MongoDB dropped.
+
+    ``begin`` either returns the response of a completed attempt or makes
+    the caller the owner of the key until it calls ``complete`` or
+    ``abandon``. Duplicates in this process wait on the owner's future;
+    duplicates in other processes see a pending document and poll it.
+    A pending document older than ``lock_timeout`` (its owner died) is
+    taken over. If MongoDB is unavailable the store degrades to in-process
+    only rather than failing requests.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Optional[AsyncIOMotorCollection]],
+        ttl: int = 86400,
+        cache_size: int = 10000,
+        cache_bytes: int = 64 * 1024 * 1024,
+        lock_timeout: float = 30.0,
+        poll_interval: float = 0.05,
+    ):
+        self.get_collection = get_collection
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        # key -> (monotonic time the key was first used, response)
+        self._cache: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+        self._cached_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._indexed = False
+
+        self.replays = {"memory": 0, "mongo": 0}
+        self.waits = 0
+        self.stored = 0
+        self.abandoned = 0
+        self.errors = 0
+
+    async def begin(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """Return the stored response for ``key``, or None if the caller now owns it"""
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            stored = self._cached(key)
+            if stored is not None:
+                self.replays["memory"] += 1
+                return self._check(stored, fingerprint)
+
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                break
+            self.waits += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                raise KeyInProgress()
+            # The owner completed (now cached) or gave up (we may take over)
+
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            stored = await self._claim(key, fingerprint, deadline)
+        except BaseException:
+            self._release(key)
+            raise
+        if stored is None:
+            return None
+
+        self._release(key)
+        self.replays["mongo"] += 1
+        self._remember(key, stored)
+        return self._check(stored, fingerprint)
+
+    async def complete(self, key: str, stored: StoredResponse) -> None:
+        self._remember(key, stored)
+        self._release(key)
+        self.stored += 1
+
+        collection = self.get_collection()
+        if collection is None:
+            return
+        try:
+            await collection.update_one({"_id": key}, {"$set": {
+                "state": "completed",
+                "status": stored.status,
+                "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in stored.headers],
+                "body": stored.body,
+            }})
+        except PyMongoError as e:
+            self.errors += 1
+            logger.error("Could not store idempotent response: %s", e)
+
+    async def abandon(self, key: str) -> None:
+        """Give up ownership without a response, so a retry runs again"""
+        self._release(key)
+        self.abandoned += 1
+
+        collection = self.get_collection()
+        if collection is None:
+            return
+        try:
+            await collection.delete_one({"_id": key, "state": "pending"})
+        except PyMongoError as e:
+            self.errors += 1
+            logger.error("Could not release idempotency key: %s", e)
+
+    async def _claim(self, key: str, fingerprint: str, deadline: float) -> Optional[StoredResponse]:
+        collection = self.get_collection()
+        if collection is None:
+            return None
+
+        try:
+            await self._ensure_index(collection)
+            while True:
+                pending = {
+                    "_id": key,
+                    "fingerprint": fingerprint,
+                    "state": "pending",
+                    "lock_expires": time.time() + self.lock_timeout,
+                    "created_at": datetime.now(timezone.utc),
+                }
+                try:
+                    await collection.insert_one(pending)
+                    return None
+                except DuplicateKeyError:
+                    pass
+
+                document = await collection.find_one({"_id": key})
+                if document is None:
+                    # Abandoned or expired in between; try again
+                    continue
+                if document["state"] == "completed":
+                    return StoredResponse.from_document(document)
+                if document["fingerprint"] != fingerprint:
+                    raise KeyReused()
+                if document["lock_expires"] < time.time():
+                    # Owner died mid-request: take over its lock
+                    result = await collection.replace_one(
+                        {"_id": key, "state": "pending", "lock_expires": document["lock_expires"]}, pending
+                    )
+                    if result.modified_count:
+                        return None
+                    continue
+                if time.monotonic() >= deadline:
+                    raise KeyInProgress()
+                await asyncio.sleep(self.poll_interval)
+        except PyMongoError as e:
+            self.errors += 1
+            logger.error("Idempotency store unavailable, continuing in-process only: %s", e)
+            return None
+
+    async def _ensure_index(self, collection: AsyncIOMotorCollection) -> None:
+        """Create the TTL index, or move an existing one to ``ttl``; the store owns this index"""
+        if self._indexed:
+            return
+        try:
+            await collection.create_index("created_at", expireAfterSeconds=self.ttl)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # Built with an earlier IDEMPOTENCY_TTL_S: change it in place
+            try:
+                await collection.database.command({
+                    "collMod": collection.name,
+                    "index": {"keyPattern": {"created_at": 1}, "expireAfterSeconds": self.ttl},
+                })
+                logger.info("Idempotency keys now expire after %ds", self.ttl)
+            except OperationFailure as collmod_error:
+                # Keys are still stored; they just expire on the index's old TTL
+                self.errors += 1
+                logger.error("Could not change the idempotency key TTL to %ds: %s", self.ttl, collmod_error)
+        self._indexed = True
+
+    def _check(self, stored: StoredResponse, fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != fingerprint:
+            raise KeyReused()
+        return stored
+
+    def _cached(self, key: str) -> Optional[StoredResponse]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        first_used, stored = entry
+        if time.monotonic() - first_used > self.ttl:
+            self._forget(key)
+            return None
+        self._cache.move_to_end(key)
+        return stored
+
+    def _remember(self, key: str, stored: StoredResponse) -> None:
+        if stored.size > self.cache_bytes:
+            return
+        self._forget(key)
+        self._cache[key] = (time.monotonic() - stored.age, stored)
+        self._cached_bytes += stored.size
+        while len(self._cache) > self.cache_size or self._cached_bytes > self.cache_bytes:
+            self._forget(next(iter(self._cache)))
+
+    def _forget(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cached_bytes -= entry[1].size
+
+    def _release(self, key: str) -> None:
+        waiter = self._inflight.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "cached_bytes": self._cached_bytes,
+            "in_flight": len(self._inflight),
+            "replays": dict(self.replays),
+            "waits": self.waits,
+            "stored": self.stored,
+            "abandoned": self.abandoned,
+            "errors": self.errors,
+        }
+
+
+def fingerprint_request(scope: Scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(scope["method"].encode())
+    digest.update(scope["path"].encode())
+    digest.update(scope.get("query_string", b""))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class IdempotencyMiddleware:
+    """
+    Make POSTs under ``path_prefix`` that carry an Idempotency-Key header safe
+    to retry.
+
+    The first attempt runs normally and its response is stored (unless it
+    is a 5xx or larger than ``max_body_size``); a retry with the same key and
+    request gets that response back with ``Idempotent-Replayed: true`` and
+    never reaches the route. Reusing a key for a different request is a 422;
+    a duplicate that outwaits ``lock_timeout`` gets a 409.
+    """
+
+    def __init__(self, app: ASGIApp, store: IdempotencyStore, path_prefix: str = "", max_body_size: int = 1024 * 1024):
+        self.app = app
+        self.store = store
+        self.path_prefix = path_prefix
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = Headers(scope=scope).get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                {"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}, status_code=400
+            )
+            await response(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        key = f"{scope['method']} {scope['path'].rstrip('/')} {idempotency_key}"
+        fingerprint = fingerprint_request(scope, body)
+        try:
+            stored = await self.store.begin(key, fingerprint)
+        except KeyReused:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"}, status_code=422
+            )
+            await response(scope, receive, send)
+            return
+        except KeyInProgress:
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                status_code=409,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        if stored is not None:
+            await send({
+                "type": "http.response.start",
+                "status": stored.status,
+                "headers": stored.headers + [(REPLAYED_HEADER, b"true")],
+            })
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        await self._run_and_store(scope, receive, send, key, fingerprint, body)
+
+    async def _run_and_store(
+        self, scope: Scope, receive: Receive, send: Send, key: str, fingerprint: str, body: bytes
+    ) -> None:
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status: Optional[int] = None
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+        size = 0
+        complete = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, headers, size, complete
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= self.max_body_size:
+                    chunks.append(chunk)
+                if not message.get("more_body", False):
+                    complete = True
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+        except BaseException:
+            await self.store.abandon(key)
+            raise
+
+        if complete and status is not None and status < 500 and size <= self.max_body_size:
+            await self.store.complete(key, StoredResponse(fingerprint, status, headers, b"".join(chunks)))
+        else:
+            await self.store.abandon(key)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
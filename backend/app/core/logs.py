@@ -0,0 +1,315 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, List, Optional
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+REQUEST_ID_HEADER = "x-request-id"
+
+access_logger = logging.getLogger("app.access")
+
+
+class RequestContext:
+    """Per-request fields attached to every log record emitted while serving it"""
+
+    __slots__ = ("request_id", "method", "path", "scope", "db_durations")
+
+    def __init__(self, request_id: str, method: str, path: str, scope: Optional[Scope] = None):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.scope = scope
+        # Appended to from Motor's executor threads; list.append is atomic
+        self.db_durations: List[float] = []
+
+    @property
+    def route(self) -> str:
+        """Method and route template once the request has been routed, else the raw path"""
+        route = self.scope.get("route") if self.scope else None
+        return f"{self.method} {route.path_format if route else self.path}"
+
+    @property
+    def db_time_ms(self) -> float:
+        return round(sum(self.db_durations) * 1000, 3)
+
+    def fields(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "db_time_ms": self.db_time_ms,
+            "db_calls": len(self.db_durations),
+        }
+
+
+_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+def current_context() -> Optional[RequestContext]:
+    return _context.get()
+
+
+# Requests by the task serving them, for threads that cannot see the loop's context
+_task_contexts: Dict[asyncio.Task, RequestContext] = {}
+
+
+def context_for_task(task: Optional[asyncio.Task]) -> Optional[RequestContext]:
+    """The request a task is serving; safe to call from any thread"""
+    return _task_contexts.get(task) if task is not None else None
+
+
+class DbTimeListener(monitoring.CommandListener):
+    """Add MongoDB command durations to the current request's context"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event.duration_micros)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event.duration_micros)
+
+    @staticmethod
+    def _record(duration_micros: int) -> None:
+        context = _context.get()
+        if context is not None:
+            context.db_durations.append(duration_micros / 1_000_000)
+
+
+db_timer = DbTimeListener()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with request context and ``extra`` fields"""
+
+    RESERVED = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "context"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            entry.update(context)
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the request id, for local development"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line = f"{line} [request_id={context['request_id']}]"
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hand records to the listener thread without blocking the caller.
+
+    Unlike QueueHandler, the message is not formatted here: the record
+    keeps its msg and args and the listener formats it. Request context
+    is captured now, since the listener thread cannot see contextvars.
+    When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        context = _context.get()
+        if context is not None:
+            record.context = context.fields()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """Root logger -> NonBlockingQueueHandler -> QueueListener -> stderr"""
+
+    def __init__(self):
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+        self.output: Optional[logging.Handler] = None
+        self.queue_size = 10000
+
+    def start(self, level: str, log_format: str, queue_size: int) -> None:
+        self.queue_size = queue_size
+        self.output = logging.StreamHandler(sys.stderr)
+        self.output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if not _is_capture(handler):
+                root.removeHandler(handler)
+        root.setLevel(level.upper())
+        self._start_listener()
+
+    def _start_listener(self) -> None:
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(self.queue_size)
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+        self.handler = NonBlockingQueueHandler(log_queue)
+        root.addHandler(self.handler)
+        self.listener = QueueListener(log_queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def after_fork(self) -> None:
+        # The listener thread does not survive fork; each worker needs its own
+        if self.listener is not None:
+            self.listener = None
+            self._start_listener()
+
+    def stop(self) -> None:
+        """Flush queued records and stop the listener"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0,
+        }
+
+
+def _is_capture(handler: logging.Handler) -> bool:
+    # Leave test-harness handlers (pytest's caplog) alone
+    return type(handler).__module__.startswith("_pytest")
+
+
+pipeline = LoggingPipeline()
+os.register_at_fork(after_in_child=pipeline.after_fork)
+atexit.register(pipeline.stop)
+
+
+def setup_logging(level: str = "INFO", log_format: str = "json", queue_size: int = 10000) -> None:
+    """Route all logging through the background listener (safe to call again)"""
+    if pipeline.listener is not None:
+        logging.getLogger().setLevel(level.upper())
+        return
+    pipeline.start(level, log_format, queue_size)
+
+
+class AccessLogPolicy:
+    """
+    Decide which requests get an access log line.
+
+    Successful requests are logged with probability ``sample_rate``; 5xx
+    responses always are. ``rate_limit`` caps access lines per second
+    (0 = no cap); lines it suppresses are counted and the count is
+    reported on the next line written.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, rate_limit: float = 0.0):
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self.logged = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._suppressed_since_last = 0
+
+    def _take_token(self) -> bool:
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def log(self, context: RequestContext, status: int, duration: float) -> None:
+        if status < 500 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        if not self._take_token():
+            self.rate_limited += 1
+            self._suppressed_since_last += 1
+            return
+
+        self.logged += 1
+        extra = {"status": status, "duration_ms": round(duration * 1000, 3)}
+        if self._suppressed_since_last:
+            extra["suppressed"] = self._suppressed_since_last
+            self._suppressed_since_last = 0
+        access_logger.info("%s %s %d", context.method, context.path, status, extra=extra)
+
+    def stats(self) -> dict:
+        return {"logged": self.logged, "sampled_out": self.sampled_out, "rate_limited": self.rate_limited}
+
+
+class AccessLogMiddleware:
+    """
+    Give each HTTP request a log context and an access log line.
+
+    The request id comes from X-Request-ID (or is generated) and is echoed
+    in the response; ``policy`` decides whether the access line is written.
+    """
+
+    def __init__(self, app: ASGIApp, policy: AccessLogPolicy):
+        self.app = app
+        self.policy = policy
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        context = RequestContext(request_id, scope["method"], scope["path"], scope)
+        token = _context.set(context)
+        task = asyncio.current_task()
+        _task_contexts[task] = context
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.policy.log(context, status, time.perf_counter() - started)
+            _task_contexts.pop(task, None)
+            _context.reset(token)
@@ -0,0 +1,220 @@
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional, Sequence
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from .config import settings
+from .logs import context_for_task
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the lag histogram buckets; the last one catches the rest
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+class LagHistogram:
+    """Counts of lag samples per bucket, with their sum and maximum"""
+
+    def __init__(self, buckets_ms: Sequence[float] = LAG_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * len(self.buckets_ms)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, lag_ms: float) -> None:
+        for i, bound in enumerate(self.buckets_ms):
+            if lag_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets_ms, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max_ms)
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5), 3),
+            "p99_ms": round(self.quantile(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": [
+                {"le_ms": "inf" if bound == float("inf") else bound, "count": count}
+                for bound, count in zip(self.buckets_ms, self.counts)
+            ],
+        }
+
+
+class LoopWatchdog:
+    """
+    Event-loop lag histogram, and the stack of whatever blocks the loop.
+
+    A task on the loop wakes every ``interval`` seconds and records how late
+    it woke as lag. A helper thread watches for that wake-up: once it is
+    ``threshold`` seconds overdue, the loop is stuck in synchronous code, so
+    the thread captures the loop thread's stack with ``sys._current_frames``
+    along with the request its running task serves. One stack is taken per
+    stall, and the full duration is filled in when the loop wakes again.
+    The last ``capacity`` stalls are kept, and stalls are also counted by
+    the innermost frame, where the blocking code usually is.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.05,
+        threshold: float = 0.1,
+        capacity: int = 100,
+        max_frames: int = 40,
+        enabled: bool = True,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_frames = max_frames
+        self.enabled = enabled
+        self.histogram = LagHistogram()
+        self._peak_lag = 0.0
+        self.stalls: Deque[dict] = deque(maxlen=capacity)
+        self.sites: Counter = Counter()
+        self.captured = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._due: Optional[float] = None
+        self._captured_due: Optional[float] = None
+        self._stall: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running loop"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._run())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._due = None
+
+    async def _run(self) -> None:
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._tick(time.monotonic())
+
+    def _tick(self, now: float) -> None:
+        lag = max(0.0, now - self._due)
+        with self._lock:
+            self.histogram.observe(lag * 1000)
+            self._peak_lag = max(self._peak_lag, lag)
+            stall, self._stall = self._stall, None
+        if stall is not None:
+            stall["blocked_ms"] = round(lag * 1000, 1)
+            logger.warning(
+                "Event loop blocked for %.0fms serving %s at %s",
+                lag * 1000, stall["route"] or "no request", stall["site"]
+            )
+
+    def _watch(self) -> None:
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stopped.wait(poll):
+            due = self._due
+            if due is None or due == self._captured_due:
+                continue
+            overdue = time.monotonic() - due
+            # Overdue by the threshold: the loop is stuck, once per wake-up missed
+            if overdue >= self.threshold:
+                self._captured_due = due
+                self.capture(overdue, due)
+
+    def capture(self, overdue: float, due: Optional[float] = None) -> Optional[dict]:
+        """Record the loop thread's current stack as a stall ``overdue`` seconds long so far"""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame, limit=self.max_frames)
+        del frame
+        if due is not None and self._due != due:
+            # The loop woke while the stack was taken; it is no longer the blocking code
+            return None
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        context = context_for_task(task)
+        site = f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}" if stack else "unknown"
+        stall = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "blocked_ms": None,  # filled in when the loop wakes
+            "overdue_ms": round(overdue * 1000, 1),
+            "route": context.route if context is not None else None,
+            "request_id": context.request_id if context is not None else None,
+            "task": task.get_name() if task is not None else None,
+            "site": site,
+            "stack": [f"{entry.filename}:{entry.lineno} in {entry.name}: {entry.line}" for entry in stack],
+        }
+        with self._lock:
+            self._stall = stall
+            self.stalls.append(stall)
+            self.sites[site] += 1
+            self.captured += 1
+        return stall
+
+    def peak_lag(self) -> float:
+        """Worst lag in seconds since the previous call"""
+        with self._lock:
+            peak, self._peak_lag = self._peak_lag, 0.0
+        return peak
+
+    def recent(self, limit: int) -> List[dict]:
+        with self._lock:
+            return list(self.stalls)[-limit:][::-1]
+
+    def by_site(self, limit: int) -> List[dict]:
+        with self._lock:
+            return [{"site": site, "stalls": count} for site, count in self.sites.most_common(limit)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            histogram = self.histogram.to_dict()
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "stalls": self.captured,
+            "lag": histogram,
+        }
+
+
+# Process-wide; started on the worker's loop at startup, stalls at /debug/loop-stalls
+loop_watchdog = LoopWatchdog(
+    interval=settings.loop_watchdog_interval_ms / 1000,
+    threshold=settings.loop_watchdog_threshold_ms / 1000,
+    capacity=settings.loop_watchdog_buffer_size,
+    max_frames=settings.loop_watchdog_max_frames,
+    enabled=settings.loop_watchdog_enabled,
+)
@@ -0,0 +1,213 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+from .config import settings
+
+GROUPINGS = ("lineno", "filename", "traceback")
+
+# Allocations made by the profiler itself or the import system are noise
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# Types whose live instance counts are always reported, by qualified name
+WATCHED_TYPES = (
+    "app.models.user.UserModel",
+    "app.schemas.user.UserResponse",
+    "motor.motor_asyncio.AsyncIOMotorCursor",
+    "motor.motor_asyncio.AsyncIOMotorCommandCursor",
+    "motor.motor_asyncio.AsyncIOMotorLatentCommandCursor",
+    "pymongo.cursor.Cursor",
+    "pymongo.command_cursor.CommandCursor",
+    "app.core.changes.ChangeRecord",
+)
+
+
+def rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _qualified_name(cls: type) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+class SnapshotNotFound(Exception):
+    pass
+
+
+class MemoryProfiler:
+    """
+    On-demand memory profiling for one worker process.
+
+    ``start`` turns on tracemalloc (which slows allocation down, so it is
+    off until asked for); ``snapshot`` keeps up to ``max_snapshots``
+    snapshots, oldest dropped first, and ``diff`` compares two of them
+    grouped by line, file or traceback. ``object_counts`` and ``gc_stats``
+    need no tracing. Everything is per process: with several workers, each
+    request sees whichever worker served it, named by ``pid``.
+    """
+
+    def __init__(self, max_snapshots: int = 4, frames: int = 1):
+        self.max_snapshots = max_snapshots
+        self.frames = frames
+        self._snapshots: Dict[int, Tuple[str, tracemalloc.Snapshot]] = {}
+        self._next_id = 1
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: Optional[int] = None) -> dict:
+        """Start tracing allocations with ``frames`` frames of traceback each"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or self.frames)
+        return self.status()
+
+    def stop(self) -> dict:
+        """Stop tracing and drop snapshots, releasing tracemalloc's memory"""
+        tracemalloc.stop()
+        self._snapshots.clear()
+        return self.status()
+
+    def status(self) -> dict:
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "pid": os.getpid(),
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            "rss_bytes": rss_bytes(),
+            "snapshots": [self._summary(snapshot_id) for snapshot_id in self._snapshots],
+        }
+
+    def snapshot(self, limit: int = 20) -> dict:
+        """Take a snapshot and return its largest allocation sites"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        snapshot_id = self._next_id
+        self._next_id += 1
+        self._snapshots[snapshot_id] = (datetime.now(timezone.utc).isoformat(timespec="milliseconds"), snapshot)
+        while len(self._snapshots) > self.max_snapshots:
+            del self._snapshots[next(iter(self._snapshots))]
+        return {
+            **self._summary(snapshot_id),
+            "top": [self._stat(stat) for stat in snapshot.statistics("lineno")[:limit]],
+        }
+
+    def _get(self, snapshot_id: int) -> tracemalloc.Snapshot:
+        try:
+            return self._snapshots[snapshot_id][1]
+        except KeyError:
+            raise SnapshotNotFound(f"Snapshot {snapshot_id} not found in worker {os.getpid()}")
+
+    def _summary(self, snapshot_id: int) -> dict:
+        taken_at, snapshot = self._snapshots[snapshot_id]
+        return {
+            "id": snapshot_id,
+            "taken_at": taken_at,
+            "traced_bytes": sum(trace.size for trace in snapshot.traces),
+        }
+
+    def diff(self, base: int, target: Optional[int] = None, group_by: str = "lineno", limit: int = 50) -> dict:
+        """Allocation growth from snapshot ``base`` to ``target`` (a new snapshot if None), largest first"""
+        if group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+        before = self._get(base)
+        if target is None:
+            target = self.snapshot(limit=0)["id"]
+        after = self._get(target)
+        stats = after.compare_to(before, group_by)
+        return {
+            "pid": os.getpid(),
+            "base": base,
+            "target": target,
+            "group_by": group_by,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "count_diff": sum(stat.count_diff for stat in stats),
+            "stats": [self._stat(stat) for stat in stats[:limit]],
+        }
+
+    @staticmethod
+    def _stat(stat) -> dict:
+        frames = stat.traceback
+        entry = {
+            "file": frames[0].filename,
+            "line": frames[0].lineno,
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        if len(frames) > 1:
+            entry["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in frames]
+        if hasattr(stat, "size_diff"):
+            entry["size_diff_bytes"] = stat.size_diff
+            entry["count_diff"] = stat.count_diff
+        return entry
+
+    @staticmethod
+    def object_counts(limit: int = 30) -> dict:
+        """Live objects tracked by the garbage collector: watched types and the most numerous types"""
+        by_type: Counter = Counter(type(obj) for obj in gc.get_objects())
+        by_name: Counter = Counter()
+        for cls, count in by_type.items():
+            by_name[_qualified_name(cls)] += count
+        return {
+            "pid": os.getpid(),
+            "total": sum(by_type.values()),
+            "watched": {name: by_name.get(name, 0) for name in WATCHED_TYPES},
+            "top": [{"type": name, "count": count} for name, count in by_name.most_common(limit)],
+        }
+
+    @staticmethod
+    def gc_stats() -> dict:
+        return {
+            "pid": os.getpid(),
+            "enabled": gc.isenabled(),
+            "thresholds": list(gc.get_threshold()),
+            "counts": list(gc.get_count()),
+            "generations": gc.get_stats(),
+            "uncollectable": len(gc.garbage),
+            "frozen": gc.get_freeze_count(),
+            "rss_bytes": rss_bytes(),
+        }
+
+    def report(self, limit: int = 30) -> dict:
+        """Status, object counts and GC stats together, e.g. to download and compare across days"""
+        return {
+            "pid": os.getpid(),
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "tracemalloc": self.status(),
+            "objects": self.object_counts(limit),
+            "gc": self.gc_stats(),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "snapshots": len(self._snapshots),
+            "rss_bytes": rss_bytes(),
+        }
+
+
+# Process-wide; served under /debug/memory when DEBUG is on
+memory_profiler = MemoryProfiler(
+    max_snapshots=settings.memory_profile_max_snapshots,
+    frames=settings.memory_profile_frames,
+)
@@ -0,0 +1,14 @@
+from typing import Callable, Dict
+
+
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """Register a callable returning a snapshot of a subsystem's counters"""
+    _providers[name] = provider
+
+
+def collect() -> Dict[str, dict]:
+    """Snapshot every registered subsystem"""
+    return {name: provider() for name, provider in _providers.items()}
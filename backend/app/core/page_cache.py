@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from contextvars import Context
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import logging
+import time
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPage:
+    """A rendered list page: response body, its ETag and the total it was rendered with"""
+    __slots__ = ("generation", "stored_at", "body", "etag", "total", "prefetched")
+
+    def __init__(self, generation: int, body: bytes, etag: str, total: int):
+        self.generation = generation
+        self.stored_at = time.monotonic()
+        self.body = body
+        self.etag = etag
+        self.total = total
+        self.prefetched = False
+
+
+class PageCache:
+    """
+    Serialized list pages by query parameters, invalidated by generation.
+
+    Every write calls ``invalidate``, which bumps the generation; pages
+    rendered under an older generation are never served again and age out
+    of the LRU, so invalidation costs O(1) however many pages are cached.
+    A page is stored only if no write happened while it was being rendered,
+    since it may have read data from before that write. ``ttl`` bounds how
+    long a page may miss writes this process never heard about.
+
+    ``prefetch`` renders a page in the background, e.g. the next one while
+    a client reads the current, so paging forward is served from memory.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 10.0, max_prefetches: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_prefetches = max_prefetches
+        self.generation = 0
+        self._pages: "OrderedDict[Hashable, CachedPage]" = OrderedDict()
+        self._prefetching: Dict[Hashable, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+        self.prefetch_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def invalidate(self) -> None:
+        """Stop serving every page cached so far"""
+        self.generation += 1
+
+    def _fresh(self, page: CachedPage) -> bool:
+        return page.generation == self.generation and time.monotonic() - page.stored_at < self.ttl
+
+    def get(self, key: Hashable) -> Optional[CachedPage]:
+        page = self._pages.get(key)
+        if page is None or not self._fresh(page):
+            if page is not None:
+                del self._pages[key]
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        if page.prefetched:
+            page.prefetched = False
+            self.prefetch_hits += 1
+        return page
+
+    def put(self, key: Hashable, page: CachedPage) -> None:
+        """Store a page rendered under ``page.generation``, unless a write has happened since"""
+        if not self.enabled or page.generation != self.generation:
+            return
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+    def prefetch(self, key: Hashable, render: Callable[[int], Awaitable[Optional[CachedPage]]]) -> None:
+        """Render and store ``key`` in the background unless it is cached or already on its way"""
+        if not self.enabled or key in self._prefetching or len(self._prefetching) >= self.max_prefetches:
+            return
+        page = self._pages.get(key)
+        if page is not None and self._fresh(page):
+            return
+        # A fresh context: the request's deadline, trace and DB timer end with the response
+        task = asyncio.get_running_loop().create_task(self._prefetch(key, render), context=Context())
+        self._prefetching[key] = task
+
+    async def _prefetch(self, key: Hashable, render: Callable[[int], Awaitable[Optional[CachedPage]]]) -> None:
+        try:
+            page = await render(self.generation)
+            if page is not None:
+                page.prefetched = True
+                self.put(key, page)
+                self.prefetches += 1
+        except Exception as e:
+            self.prefetch_errors += 1
+            logger.debug("Prefetch of %s failed: %s", key, e)
+        finally:
+            self._prefetching.pop(key, None)
+
+    async def stop(self) -> None:
+        """Cancel prefetches still running"""
+        tasks = list(self._prefetching.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._prefetching.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._pages),
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "prefetches": self.prefetches,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_errors": self.prefetch_errors,
+            "prefetching": len(self._prefetching),
+        }
+
+
+# Process-wide: user writes in this process invalidate it, and so do changes
+# from other workers arriving through the change feed (see main)
+user_pages = PageCache(
+    max_entries=settings.page_cache_size,
+    ttl=settings.page_cache_ttl_s,
+    max_prefetches=settings.page_cache_max_prefetches,
+)
@@ -0,0 +1,52 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+from .deadline import wait_shared
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into a single execution.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same result, each for no longer than its own
+    request deadline. Each caller is shielded so a cancelled or timed-out
+    request doesn't cancel the shared call for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+
+    @property
+    def coalesced(self) -> int:
+        return self.calls - self.executions
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is None:
+            self.executions += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._release(key, f))
+        return await wait_shared(future)
+
+    def forget(self) -> None:
+        """Stop handing out in-flight results, e.g. after a write changed the data"""
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+    def _release(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved when no caller is left to see it
+            future.exception()
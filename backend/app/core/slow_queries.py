@@ -0,0 +1,294 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import json
+import logging
+import random
+import threading
+import time
+from .config import settings
+from .logs import current_context
+
+logger = logging.getLogger(__name__)
+
+# Where each command keeps the filter that decides its plan
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session and cluster fields the driver adds; explain rejects or ignores them
+DRIVER_FIELDS = {"lsid", "txnNumber", "startTransaction", "autocommit", "readConcern", "writeConcern"}
+
+
+def normalize(value: Any) -> Any:
+    """Replace literal values with "?" so queries differing only in values share a shape"""
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [normalize(item) for item in value]
+        return ["?"] if value else []
+    return "?"
+
+
+def command_shape(command_name: str, command: dict) -> Dict[str, Any]:
+    """The parts of a command that decide its plan, with values removed"""
+    shape: Dict[str, Any] = {}
+    if command_name in FILTER_FIELDS:
+        shape["filter"] = normalize(command.get(FILTER_FIELDS[command_name], {}))
+    elif command_name == "aggregate":
+        shape["pipeline"] = normalize(command.get("pipeline", []))
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        shape["filter"] = normalize(statements[0].get("q", {}))
+    if "sort" in command:
+        shape["sort"] = dict(command["sort"])
+    if command_name == "distinct":
+        shape["key"] = command.get("key")
+    return shape
+
+
+def explainable(command: dict) -> dict:
+    """The command as sent, minus the driver's session and cluster fields, ready to wrap in explain"""
+    return {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in DRIVER_FIELDS
+    }
+
+
+def explain_summary(explain: dict) -> dict:
+    """Winning plan and work done, from explain("executionStats") output"""
+    stats = explain.get("executionStats", {})
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    return {
+        "stages": plan_stages(winning_plan),
+        "winning_plan": winning_plan,
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """Stage names of a plan from the root down, e.g. ["FETCH", "IXSCAN"], including every input of OR/merge stages"""
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        if not node:
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        # Newer servers nest the classic plan under queryPlan
+        children = [node.get("inputStage"), node.get("queryPlan"), *node.get("inputStages", [])]
+        pending.extend(reversed(children))
+    return stages
+
+
+class ShapeStats:
+    __slots__ = ("key", "command", "collection", "shape", "count", "total_ms", "max_ms", "routes", "explain")
+
+    def __init__(self, key: str, command: str, collection: str, shape: dict):
+        self.key = key
+        self.command = command
+        self.collection = collection
+        self.shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.routes: Dict[str, int] = {}
+        self.explain: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "collection": self.collection,
+            "shape": self.shape,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "routes": dict(self.routes),
+            "explain": self.explain,
+        }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """
+    Record MongoDB commands slower than ``threshold`` seconds.
+
+    Each slow command is kept (most recent ``capacity``) with its shape,
+    duration and the route that issued it, and aggregated per shape. For a
+    ``explain_sample_rate`` fraction of slow commands, at most once per shape
+    every ``explain_interval`` seconds, the command is re-run as
+    explain("executionStats") on a single background thread using the sync
+    client from ``get_client``, so the request and event loop never wait on it.
+    """
+
+    MAX_SHAPES = 1000
+    MAX_ROUTES_PER_SHAPE = 20
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        capacity: int = 500,
+        explain_sample_rate: float = 0.1,
+        explain_interval: float = 60.0,
+        get_client: Optional[Callable[[], Optional[MongoClient]]] = None,
+        enabled: bool = True,
+    ):
+        self.threshold_micros = threshold * 1_000_000
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self.get_client = get_client or (lambda: None)
+        self.enabled = enabled
+        self.entries: Deque[dict] = deque(maxlen=capacity)
+        self.shapes: Dict[str, ShapeStats] = {}
+        self._started: Dict[Tuple[Any, int], Tuple[dict, Optional[str], Optional[str]]] = {}
+        self._last_explain: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._explainer: Optional[ThreadPoolExecutor] = None
+        self.recorded = 0
+        self.explained = 0
+        self.explain_errors = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if not self.enabled or event.command_name not in EXPLAINABLE:
+            return
+        context = current_context()
+        self._started[(event.connection_id, event.request_id)] = (
+            event.command,
+            context.route if context else None,
+            context.request_id if context else None,
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, failed=True)
+
+    def _finished(self, event: Any, failed: bool = False) -> None:
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None or event.duration_micros < self.threshold_micros:
+            return
+        command, route, request_id = started
+        self.record(
+            event.command_name, event.database_name, command, event.duration_micros / 1000,
+            route, request_id, failed
+        )
+
+    def record(
+        self,
+        command_name: str,
+        database: str,
+        command: dict,
+        duration_ms: float,
+        route: Optional[str] = None,
+        request_id: Optional[str] = None,
+        failed: bool = False,
+    ) -> dict:
+        collection = str(command.get(command_name, ""))
+        shape = command_shape(command_name, command)
+        key = f"{database}.{collection} {command_name} {json.dumps(shape, sort_keys=True, default=str)}"
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "command": command_name,
+            "database": database,
+            "collection": collection,
+            "shape": shape,
+            "duration_ms": round(duration_ms, 3),
+            "route": route,
+            "request_id": request_id,
+            "failed": failed,
+            "explain": None,
+        }
+
+        with self._lock:
+            self.recorded += 1
+            self.entries.append(entry)
+            stats = self.shapes.get(key)
+            if stats is None:
+                if len(self.shapes) >= self.MAX_SHAPES:
+                    # Drop the least costly shape to stay bounded
+                    del self.shapes[min(self.shapes.values(), key=lambda s: s.total_ms).key]
+                stats = self.shapes[key] = ShapeStats(key, command_name, f"{database}.{collection}", shape)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            if route and (route in stats.routes or len(stats.routes) < self.MAX_ROUTES_PER_SHAPE):
+                stats.routes[route] = stats.routes.get(route, 0) + 1
+            explain = self._should_explain(key)
+
+        logger.info(
+            "Slow MongoDB %s on %s.%s took %.1fms", command_name, database, collection, duration_ms,
+            extra={"query_shape": shape, "route": route}
+        )
+        if explain:
+            self._submit_explain(database, command_name, command, entry, stats)
+        return entry
+
+    def _should_explain(self, key: str) -> bool:
+        if random.random() >= self.explain_sample_rate:
+            return False
+        now = time.monotonic()
+        if now - self._last_explain.get(key, float("-inf")) < self.explain_interval:
+            return False
+        self._last_explain[key] = now
+        return True
+
+    def _submit_explain(self, database: str, command_name: str, command: dict, entry: dict, stats: ShapeStats) -> None:
+        client = self.get_client()
+        if client is None:
+            return
+        if self._explainer is None:
+            self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._explainer.submit(self._explain, client, database, explainable(command), entry, stats)
+
+    def _explain(self, client: MongoClient, database: str, command: dict, entry: dict, stats: ShapeStats) -> None:
+        try:
+            result = client[database].command({"explain": command, "verbosity": "executionStats"})
+        except PyMongoError as e:
+            self.explain_errors += 1
+            logger.warning("Explain of slow query failed: %s", e)
+            return
+        summary = explain_summary(result)
+        with self._lock:
+            entry["explain"] = summary
+            stats.explain = summary
+            self.explained += 1
+
+    def recent(self, limit: int) -> List[dict]:
+        with self._lock:
+            return list(self.entries)[-limit:][::-1]
+
+    def by_shape(self, limit: int) -> List[dict]:
+        with self._lock:
+            shapes = sorted(self.shapes.values(), key=lambda s: s.total_ms, reverse=True)[:limit]
+            return [stats.to_dict() for stats in shapes]
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_micros / 1000,
+            "recorded": self.recorded,
+            "shapes": len(self.shapes),
+            "explained": self.explained,
+            "explain_errors": self.explain_errors,
+        }
+
+
+# Process-wide; connect_to_mongo gives it the client to run explains with
+slow_query_log = SlowQueryLog(
+    threshold=settings.slow_query_ms / 1000,
+    capacity=settings.slow_query_buffer_size,
+    explain_sample_rate=settings.slow_query_explain_sample_rate,
+    explain_interval=settings.slow_query_explain_interval_s,
+    enabled=settings.slow_query_enabled,
+)
@@ -0,0 +1,53 @@
+class AdaptiveThrottle:
+    """
+    Batch size and pacing for background batch work, steered by latency.
+
+    After each batch, ``record`` takes how long it took. A batch slower
+    than ``target_latency`` halves the next batch; a faster one grows it by
+    ``min_batch`` (additive increase, multiplicative decrease, as in TCP).
+    The returned pause keeps the work to ``duty_cycle`` of wall time. A
+    database that slows down under load therefore gets smaller batches and
+    longer gaps without any explicit rate setting.
+    """
+
+    def __init__(
+        self,
+        target_latency: float = 0.2,
+        min_batch: int = 10,
+        max_batch: int = 1000,
+        initial_batch: int = 100,
+        duty_cycle: float = 0.5,
+        max_pause: float = 5.0,
+    ):
+        self.target_latency = target_latency
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+        self.max_pause = max_pause
+        self.batch_size = min(max(initial_batch, min_batch), max_batch)
+
+        self.batches = 0
+        self.slow_batches = 0
+        self.last_latency = 0.0
+        self.last_pause = 0.0
+
+    def record(self, latency: float) -> float:
+        """Adjust the batch size from one batch's latency and return the pause before the next"""
+        self.batches += 1
+        self.last_latency = latency
+        if latency > self.target_latency:
+            self.slow_batches += 1
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+        else:
+            self.batch_size = min(self.max_batch, self.batch_size + self.min_batch)
+        self.last_pause = min(self.max_pause, latency * (1 - self.duty_cycle) / self.duty_cycle)
+        return self.last_pause
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "slow_batches": self.slow_batches,
+            "last_latency_ms": round(self.last_latency * 1000, 1),
+            "last_pause_ms": round(self.last_pause * 1000, 1),
+        }
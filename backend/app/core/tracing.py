@@ -0,0 +1,425 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def fail(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self.trace.error = True
+
+    def finish(self) -> None:
+        self.end_ns = time.time_ns()
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "sampled", "error", "dropped_spans", "max_spans")
+
+    def __init__(self, trace_id: str, sampled: bool, max_spans: int):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.sampled = sampled
+        self.error = False
+        self.dropped_spans = 0
+        self.max_spans = max_spans
+
+    def add(self, span: Span) -> bool:
+        # Called from Motor's executor threads too; list.append is atomic
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.root.end_ns - self.root.start_ns) / 1_000_000
+
+    def to_otlp(self, service_name: str) -> dict:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.core.tracing"},
+                    "spans": [span.to_otlp() for span in self.spans],
+                }],
+            }]
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class RingBufferExporter:
+    """Keep the most recent exported traces in memory"""
+
+    def __init__(self, capacity: int = 200):
+        self.traces: Deque[Tuple[str, dict]] = deque(maxlen=capacity)
+
+    def export(self, trace_id: str, otlp: dict) -> None:
+        self.traces.append((trace_id, otlp))
+
+    def recent(self, limit: int) -> List[dict]:
+        return [otlp for _, otlp in list(self.traces)[-limit:]][::-1]
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        for stored_id, otlp in reversed(self.traces):
+            if stored_id == trace_id:
+                return otlp
+        return None
+
+
+class FileExporter:
+    """Append traces as OTLP JSON lines from a background thread"""
+
+    def __init__(self, path: str, queue_size: int = 1000):
+        self.path = path
+        self.queue: "queue.Queue[str]" = queue.Queue(queue_size)
+        self.dropped = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, trace_id: str, otlp: dict) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._write, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self.queue.put_nowait(json.dumps(otlp, separators=(",", ":")))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self) -> None:
+        while True:
+            line = self.queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.error("Could not write trace to %s: %s", self.path, e)
+
+
+class Tracer:
+    """
+    In-process tracer. Spans nest through a contextvar, so code only needs
+    ``with tracer.span(...)`` and is a no-op outside a trace.
+
+    Every trace records its spans; when it ends it is exported if it was
+    head-sampled (``sample_rate``, or the caller's traceparent flag), or
+    (tail sampling) if it took at least ``slow_threshold`` seconds or
+    recorded an error.
+    """
+
+    def __init__(
+        self,
+        service_name: str = "app",
+        sample_rate: float = 0.01,
+        slow_threshold: float = 0.5,
+        max_spans: int = 500,
+        exporters: Optional[list] = None,
+        enabled: bool = True,
+    ):
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.max_spans = max_spans
+        self.exporters = exporters or []
+        self.enabled = enabled
+        self.started = 0
+        self.exported = {"head": 0, "slow": 0, "error": 0}
+
+    @contextmanager
+    def trace(
+        self, name: str, traceparent: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Optional[Span]]:
+        """Start a new trace with a server span as its root"""
+        if not self.enabled:
+            yield None
+            return
+
+        trace_id, parent_id, sampled = None, None, None
+        match = _TRACEPARENT.match(traceparent or "")
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1)
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+
+        trace = Trace(trace_id or _new_id(16), sampled, self.max_spans)
+        root = Span(trace, name, parent_id, KIND_SERVER, attributes or {})
+        trace.add(root)
+        self.started += 1
+
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.finish()
+            self._end(trace)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Record a child of the current span (nothing happens outside a trace)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(parent.trace, name, parent.span_id, kind, attributes)
+        if not parent.trace.add(span):
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+    def traced(self, name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+        """Decorate an async function to run inside a span"""
+        def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            @functools.wraps(fn)
+            async def wrapper(*args: Any, **kwargs: Any) -> T:
+                with self.span(name):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _end(self, trace: Trace) -> None:
+        if trace.sampled:
+            reason = "head"
+        elif trace.error:
+            reason = "error"
+        elif trace.duration_ms >= self.slow_threshold * 1000:
+            reason = "slow"
+        else:
+            return
+
+        self.exported[reason] += 1
+        trace.root.set("sampling.reason", reason)
+        if trace.dropped_spans:
+            trace.root.set("spans.dropped", trace.dropped_spans)
+        otlp = trace.to_otlp(self.service_name)
+        for exporter in self.exporters:
+            exporter.export(trace.trace_id, otlp)
+
+    def stats(self) -> dict:
+        return {"started": self.started, "exported": dict(self.exported)}
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """
+    Record each MongoDB command as a client span under the span that issued it.
+
+    Motor runs commands in executor threads with the caller's context
+    copied in, so the issuing span is visible here.
+    """
+
+    def __init__(self):
+        self._open: Dict[Tuple[Any, int], Span] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, f"mongodb.{event.command_name}", parent.span_id, KIND_CLIENT, {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": str(event.command.get(event.command_name, "")),
+        })
+        if parent.trace.add(span):
+            self._open[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        span = self._open.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.finish()
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        span = self._open.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.error = str(event.failure.get("errmsg", "command failed"))
+            span.trace.error = True
+            span.finish()
+
+
+class TracingMiddleware:
+    """Wrap each HTTP request in a trace named after its route"""
+
+    def __init__(self, app: ASGIApp, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not self.tracer.enabled
+            # An event stream lasts as long as the client stays; its trace would only time that
+            or Headers(scope=scope).get("accept", "").startswith("text/event-stream")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = Headers(scope=scope).get(TRACEPARENT_HEADER)
+        with self.tracer.trace(f"{scope['method']} {scope['path']}", traceparent, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }) as root:
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.trace.error = True
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    # Low-cardinality name: the route template, not the concrete path
+                    root.name = f"{scope['method']} {route.path_format}"
+                    root.set("http.route", route.path_format)
+
+
+class TracedLayer:
+    """Run a middleware inside a span named after it"""
+
+    def __init__(self, app: ASGIApp, tracer: Tracer, middleware_class: type, **options: Any):
+        self.app = middleware_class(app, **options)
+        self.tracer = tracer
+        self.name = f"middleware.{middleware_class.__name__}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        with self.tracer.span(self.name):
+            await self.app(scope, receive, send)
+
+
+def instrument_middleware(app: Any, tracer: Tracer) -> None:
+    """Give every middleware added so far its own span (call before the first request)"""
+    app.user_middleware = [
+        Middleware(TracedLayer, tracer=tracer, middleware_class=middleware.cls, **middleware.options)
+        for middleware in app.user_middleware
+    ]
+
+
+exporters: list = [RingBufferExporter(settings.tracing_buffer_size)]
+if settings.tracing_export_path:
+    exporters.append(FileExporter(settings.tracing_export_path))
+
+# Process-wide tracer used by the middleware, routes, CRUD layer and Mongo listener
+tracer = Tracer(
+    service_name=settings.project_name,
+    sample_rate=settings.tracing_sample_rate,
+    slow_threshold=settings.tracing_slow_ms / 1000,
+    max_spans=settings.tracing_max_spans,
+    exporters=exporters,
+    enabled=settings.tracing_enabled,
+)
+trace_buffer: RingBufferExporter = exporters[0]
+mongo_tracer = MongoCommandTracer()
+
+
+class TracedRoute(APIRoute):
+    """APIRoute whose handler (dependencies, endpoint, serialization) runs in a span"""
+
+    def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+        handler = super().get_route_handler()
+        name = f"route.{self.name}"
+
+        async def traced_handler(request: Request) -> Response:
+            with tracer.span(name):
+                return await handler(request)
+
+        return traced_handler
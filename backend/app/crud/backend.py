@@ -0,0 +1,75 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import inspect
+from ..core.tracing import tracer
+from ..models.user import UserModel, UserUpdate
+from ..schemas.user import UserCreate
+
+
+class UserBackend(ABC):
+    """
+    Storage interface the users API is written against.
+
+    UserCRUD is the MongoDB implementation; MemoryUserCRUD keeps users in
+    process. Implementations raise ValueError("Email already registered")
+    on email conflicts and treat malformed IDs as not found.
+
+    Public async methods of implementations are traced automatically.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(method):
+                setattr(cls, name, tracer.traced(f"{cls.__name__}.{name}")(method))
+
+    @abstractmethod
+    async def create_user(self, user_data: UserCreate) -> UserModel:
+        """Create a new user"""
+
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[UserModel]:
+        """Get user by ID"""
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[UserModel]:
+        """Get user by email"""
+
+    @abstractmethod
+    async def get_users(self, skip: int = 0, limit: int = 10) -> List[UserModel]:
+        """Get list of users with pagination, in _id order"""
+
+    @abstractmethod
+    async def get_user_version(self, user_id: str) -> Optional[int]:
+        """Get the current version of a user"""
+
+    @abstractmethod
+    async def get_users_versions(self, skip: int = 0, limit: int = 10) -> List[Tuple[str, int]]:
+        """Get (id, version) pairs for a page of users, in list order"""
+
+    @abstractmethod
+    async def get_users_by_ids(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Get raw user documents (_id, name and email) for many IDs, keyed by ID"""
+
+    @abstractmethod
+    async def get_users_count(self) -> int:
+        """Get total count of users"""
+
+    @abstractmethod
+    async def update_user(self, user_id: str, user_data: UserUpdate) -> Optional[UserModel]:
+        """Update user by ID"""
+
+    @abstractmethod
+    async def delete_user(self, user_id: str) -> bool:
+        """Delete user by ID"""
+
+    @abstractmethod
+    async def get_stats(self) -> dict:
+        """Get user totals: {"total", "domains", "updated_at"}"""
+
+    @abstractmethod
+    async def reconcile_stats(self, apply: bool = True) -> dict:
+        """Recount user totals and report drift"""
+
+    async def close(self) -> None:
+        """Release per-request resources"""
@@ -0,0 +1,408 @@
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import os
+import re
+import socket
+import time
+from ..core.breaker import CLOSED, is_failure, mongo_breaker
+from ..core.changes import DELETED, change_feed
+from ..core.config import settings
+from ..core.consistency import options_for
+from ..core.health import health_checker
+from ..core.page_cache import user_pages
+from ..core.throttle import AdaptiveThrottle
+from ..migrations.runner import COMPLETED as MIGRATED, MigrationRunner
+from ..migrations.steps import AddEmailDomain
+from .stats import UserStatsCRUD
+from .user import user_reads
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = [PENDING, RUNNING]
+
+
+def user_filter(spec: dict, domain_field: bool = True) -> dict:
+    """
+    MongoDB filter for a job's {"email_domain", "created_before"} criteria.
+
+    The domain is matched on the indexed ``email_domain`` field, or, with
+    ``domain_field`` off, by a regex on ``email`` that no index can serve,
+    for users stored before migration 3 backfilled the field.
+    """
+    query: dict = {}
+    if spec.get("email_domain") and domain_field:
+        query["email_domain"] = spec["email_domain"]
+    elif spec.get("email_domain"):
+        query["email"] = {"$regex": f"@{re.escape(spec['email_domain'])}$", "$options": "i"}
+    if spec.get("created_before"):
+        # ObjectIds start with their creation time
+        query["_id"] = {"$lt": ObjectId.from_datetime(spec["created_before"])}
+    return query
+
+
+async def domain_field_ready(database: AsyncIOMotorDatabase) -> bool:
+    """Whether migration 3 has backfilled ``email_domain`` on every user"""
+    record = await database[MigrationRunner.COLLECTION].find_one({"_id": AddEmailDomain.version}, {"status": 1})
+    return record is not None and record.get("status") == MIGRATED
+
+
+def chunk_filter(spec: dict, after: Optional[ObjectId], domain_field: bool = True) -> dict:
+    """The job's filter restricted to _ids after the last deleted one"""
+    query = user_filter(spec, domain_field)
+    if after is not None:
+        query["_id"] = {**query.get("_id", {}), "$gt": after}
+    return query
+
+
+class DeleteJobCRUD:
+    """
+    Bulk delete jobs in the ``bulk_delete_jobs`` collection.
+
+    A job is owned by at most one worker at a time: ``claim`` takes a
+    pending job, or a running one whose owner stopped heartbeating for
+    ``lease`` seconds, and every ``save`` is conditional on still owning it.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.bulk_delete_jobs
+
+    async def create(self, spec: dict, estimated_total: Optional[int] = None) -> dict:
+        now = datetime.now(timezone.utc)
+        job = {
+            "filter": spec,
+            "estimated_total": estimated_total,
+            "status": PENDING,
+            "cancel_requested": False,
+            "deleted": 0,
+            "chunks": 0,
+            "last_id": None,
+            "batch_size": None,
+            "error": None,
+            "owner": None,
+            "heartbeat_at": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        result = await self.collection.insert_one(job)
+        job["_id"] = result.inserted_id
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.collection.find_one({"_id": ObjectId(job_id)})
+
+    async def list(self, limit: int = 20) -> List[dict]:
+        """Most recent jobs first"""
+        return await self.collection.find().sort("_id", -1).limit(limit).to_list(length=limit)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Ask a job to stop after its current chunk; a job nobody runs yet stops at once"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        job = await self.collection.find_one_and_update(
+            {"_id": ObjectId(job_id), "status": PENDING, "owner": None},
+            {"$set": {"status": CANCELLED, "cancel_requested": True, "finished_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            return job
+        return await self.collection.find_one_and_update(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"cancel_requested": True}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def claim(self, owner: str, lease: float) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {
+                "status": {"$in": ACTIVE},
+                "$or": [{"owner": None}, {"heartbeat_at": {"$lt": now - timedelta(seconds=lease)}}],
+            },
+            {"$set": {"status": RUNNING, "owner": owner, "heartbeat_at": now}},
+            sort=[("_id", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def save(self, job_id: ObjectId, owner: str, fields: dict) -> Optional[dict]:
+        """Update an owned job and heartbeat; None if another worker took it over"""
+        return await self.collection.find_one_and_update(
+            {"_id": job_id, "owner": owner},
+            {"$set": {**fields, "heartbeat_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+
+class DeleteJobRunner:
+    """
+    Run bulk delete jobs in the background of each worker.
+
+    A job deletes matching users in ascending ``_id`` chunks: find the next
+    chunk's _ids after the last one deleted, delete them with one
+    ``delete_many`` (with the filter repeated, so a user edited in between is
+    spared), then record progress for the users it deleted. The throttle
+    sizes chunks and pauses from each chunk's latency, and ``bulk_delete`` writes wait for a majority, so replication
+    lag slows the job down instead of growing. Work pauses while the
+    service is degraded or the MongoDB circuit is not closed.
+
+    Jobs survive restarts: progress is saved after every chunk, and a job
+    whose worker disappeared is claimed by another once its lease expires.
+    """
+
+    def __init__(
+        self,
+        target_latency: float = 0.2,
+        min_batch: int = 10,
+        max_batch: int = 1000,
+        initial_batch: int = 100,
+        duty_cycle: float = 0.5,
+        lease: float = 30.0,
+        poll_interval: float = 5.0,
+        concurrency: int = 1,
+    ):
+        self.target_latency = target_latency
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.initial_batch = initial_batch
+        self.duty_cycle = duty_cycle
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+        self._database: Optional[AsyncIOMotorDatabase] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._jobs: dict = {}
+
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.deleted = 0
+        self.paused = 0
+
+    def start(self, database: AsyncIOMotorDatabase) -> None:
+        if self._task is None:
+            self._database = database
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._jobs.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._jobs.clear()
+
+    def notify(self) -> None:
+        """Look for work now rather than at the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        jobs = DeleteJobCRUD(self._database)
+        while True:
+            try:
+                while len(self._jobs) < self.concurrency:
+                    job = await jobs.claim(self.owner, self.lease)
+                    if job is None:
+                        break
+                    self._jobs[job["_id"]] = asyncio.ensure_future(self._run_job(jobs, job))
+            except Exception as e:
+                logger.error("Could not claim bulk delete jobs: %s", e)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_job(self, jobs: DeleteJobCRUD, job: dict) -> None:
+        try:
+            await self.run(jobs, job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job to whichever worker polls next
+            await asyncio.shield(jobs.save(job["_id"], self.owner, {"owner": None}))
+            raise
+        except Exception as e:
+            logger.exception("Bulk delete job %s failed", job["_id"])
+            self.failed += 1
+            try:
+                await jobs.save(job["_id"], self.owner, {"status": FAILED, "error": str(e), "owner": None})
+            except Exception as save_error:
+                logger.error("Could not record bulk delete job %s as failed: %s", job["_id"], save_error)
+        finally:
+            self._jobs.pop(job["_id"], None)
+            self.notify()
+
+    async def run(self, jobs: DeleteJobCRUD, job: dict) -> Optional[dict]:
+        """Delete chunk after chunk until nothing matches, the job is cancelled or it fails"""
+        database = jobs.collection.database
+        users = database.get_collection("users", **options_for("bulk_delete"))
+        stats = UserStatsCRUD(database)
+        throttle = AdaptiveThrottle(
+            target_latency=self.target_latency,
+            min_batch=self.min_batch,
+            max_batch=self.max_batch,
+            initial_batch=job.get("batch_size") or self.initial_batch,
+            duty_cycle=self.duty_cycle,
+        )
+        spec = job["filter"]
+        domain_field = await self._retry(job, domain_field_ready, database)
+        if spec.get("email_domain") and not domain_field:
+            logger.warning("Bulk delete job %s matching emails by regex until migration 3 completes", job["_id"])
+        logger.info("Bulk delete job %s running: %s", job["_id"], spec)
+        if job.get("started_at") is None:
+            started_at = {"started_at": datetime.now(timezone.utc)}
+            job = await self._retry(job, jobs.save, job["_id"], self.owner, started_at) or job
+
+        while True:
+            if job["cancel_requested"]:
+                return await self._finish(jobs, job, CANCELLED)
+            await self._wait_until_healthy(jobs, job)
+
+            started = time.perf_counter()
+            try:
+                query = chunk_filter(spec, job["last_id"], domain_field)
+                cursor = users.find(query, {"email": 1}).sort("_id", 1)
+                docs = await cursor.limit(throttle.batch_size).to_list(length=throttle.batch_size)
+                if not docs:
+                    return await self._finish(jobs, job, COMPLETED)
+            except Exception as e:
+                if not is_failure(e):
+                    logger.error("Bulk delete job %s failed: %s", job["_id"], e)
+                    return await self._finish(jobs, job, FAILED, error=str(e))
+                logger.warning("Bulk delete job %s waiting on MongoDB: %s", job["_id"], e)
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            deleted, gone, last_id, error = [], [], job["last_id"], None
+            try:
+                deleted, gone = await self._delete_chunk(job, users, spec, docs, domain_field)
+                last_id = docs[-1]["_id"]
+            except Exception as e:
+                logger.error("Bulk delete job %s failed: %s", job["_id"], e)
+                error = e
+            pause = throttle.record(time.perf_counter() - started)
+
+            # The chunk is gone: from here on, only ever retry, or its
+            # stats, events and progress would be lost
+            user_reads.forget()
+            user_pages.invalidate()
+            await self._retry(job, stats.record_deletes, [doc["email"] for doc in deleted])
+            # A repeated delete event is harmless, a missing one is not
+            await change_feed.publish_many(DELETED, [str(doc["_id"]) for doc in gone])
+            self.deleted += len(deleted)
+
+            job = await self._retry(job, jobs.save, job["_id"], self.owner, {
+                "last_id": last_id,
+                "deleted": job["deleted"] + len(deleted),
+                "chunks": job["chunks"] + 1,
+                "batch_size": throttle.batch_size,
+            })
+            if job is None:
+                logger.warning("Bulk delete job lost its lease to another worker")
+                return None
+            if error is not None:
+                return await self._finish(jobs, job, FAILED, error=str(error))
+            await asyncio.sleep(pause)
+
+    async def _delete_chunk(
+        self, job: dict, users: AsyncIOMotorCollection, spec: dict, docs: List[dict], domain_field: bool
+    ) -> Tuple[List[dict], List[dict]]:
+        """Delete a chunk with one command; the users this job deleted, and every one now gone"""
+        ids = [doc["_id"] for doc in docs]
+        attempts = 0
+
+        async def delete_many():
+            nonlocal attempts
+            attempts += 1
+            return await users.delete_many({**user_filter(spec, domain_field), "_id": {"$in": ids}})
+
+        result = await self._retry(job, delete_many)
+        if result.deleted_count == len(docs):
+            return docs, docs
+
+        # Some were spared by an edit, or deleted elsewhere meanwhile and already
+        # counted there: account for the chunk user by user
+        remaining = {doc["_id"] for doc in await self._retry(job, self._find_ids, users, ids)}
+        gone = [doc for doc in docs if doc["_id"] not in remaining]
+        if attempts > 1:
+            # An interrupted attempt may have deleted users the retry could not count
+            return gone, gone
+        # Which of the gone users were deleted elsewhere is unknown; the total
+        # (and, with an email_domain filter, each domain's count) is still right
+        return gone[:result.deleted_count], gone
+
+    @staticmethod
+    async def _find_ids(users: AsyncIOMotorCollection, ids: List[ObjectId]) -> List[dict]:
+        return await users.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(length=len(ids))
+
+    async def _retry(self, job: dict, operation: Callable[..., Awaitable[T]], *args: Any) -> T:
+        """Await ``operation(*args)`` until MongoDB is reachable; other errors are raised"""
+        while True:
+            try:
+                return await operation(*args)
+            except Exception as e:
+                if not is_failure(e):
+                    raise
+                logger.warning("Bulk delete job %s waiting on MongoDB: %s", job["_id"], e)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _wait_until_healthy(self, jobs: DeleteJobCRUD, job: dict) -> None:
+        """Hold off, keeping the lease, while requests need the database more"""
+        while health_checker.degraded or mongo_breaker.state != CLOSED:
+            self.paused += 1
+            await asyncio.sleep(self.poll_interval)
+            await self._retry(job, jobs.save, job["_id"], self.owner, {})
+
+    async def _finish(self, jobs: DeleteJobCRUD, job: dict, status: str, error: Optional[str] = None) -> dict:
+        if status == COMPLETED:
+            self.completed += 1
+        elif status == FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+        logger.info("Bulk delete job %s %s after deleting %s users", job["_id"], status, job["deleted"])
+        return await self._retry(job, jobs.save, job["_id"], self.owner, {
+            "status": status,
+            "error": error,
+            "owner": None,
+            "finished_at": datetime.now(timezone.utc),
+        }) or job
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "deleted": self.deleted,
+            "paused": self.paused,
+        }
+
+
+# Process-wide: each worker runs at most ``concurrency`` jobs, claimed from the shared collection
+delete_job_runner = DeleteJobRunner(
+    target_latency=settings.bulk_delete_target_ms / 1000,
+    min_batch=settings.bulk_delete_min_batch,
+    max_batch=settings.bulk_delete_max_batch,
+    initial_batch=settings.bulk_delete_initial_batch,
+    duty_cycle=settings.bulk_delete_duty_cycle,
+    lease=settings.bulk_delete_lease_s,
+    poll_interval=settings.bulk_delete_poll_s,
+    concurrency=settings.bulk_delete_concurrency,
+)
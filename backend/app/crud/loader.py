@@ -0,0 +1,103 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from bson import ObjectId
+from typing import Dict, Optional
+import asyncio
+import logging
+import time
+from ..core.deadline import wait_shared
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+        self.futures: Dict[ObjectId, asyncio.Future] = {}
+
+
+class UserLoader:
+    """
+    Micro-batching loader for user-by-id lookups.
+
+    Lookups issued within the same event-loop tick (or within ``window``
+    seconds of the first one) are resolved with a single
+    ``{"_id": {"$in": [...]}}`` query. Batches are kept per collection so
+    separate databases are never mixed.
+    """
+
+    def __init__(self, max_batch_size: int = 1000, window: float = 0.0):
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._batches: Dict[str, _Batch] = {}
+        self.batches = 0
+        self.keys = 0
+        self.max_batch = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    async def load(self, collection: AsyncIOMotorCollection, user_id: ObjectId) -> Optional[dict]:
+        """Queue a lookup and wait for the batch it lands in"""
+        loop = asyncio.get_running_loop()
+        key = collection.full_name
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(collection)
+            if self.window > 0:
+                loop.call_later(self.window, self._dispatch, key, batch)
+            else:
+                loop.call_soon(self._dispatch, key, batch)
+
+        future = batch.futures.get(user_id)
+        if future is None:
+            future = batch.futures[user_id] = loop.create_future()
+            # Mark a failure as retrieved in case every caller already gave up
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if len(batch.futures) >= self.max_batch_size:
+                self._dispatch(key, batch)
+
+        # The batch query runs under the first caller's deadline; wait within our own
+        return await wait_shared(future)
+
+    def _dispatch(self, key: str, batch: _Batch) -> None:
+        if self._batches.get(key) is not batch:
+            # Already dispatched because it filled up
+            return
+        del self._batches[key]
+        asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: _Batch) -> None:
+        ids = list(batch.futures)
+        started = time.perf_counter()
+        try:
+            cursor = batch.collection.find({"_id": {"$in": ids}})
+            docs = await cursor.to_list(length=len(ids))
+        except Exception as e:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._record(len(ids), time.perf_counter() - started)
+
+        by_id = {doc["_id"]: doc for doc in docs}
+        for user_id, future in batch.futures.items():
+            if not future.done():
+                future.set_result(by_id.get(user_id))
+
+    def _record(self, size: int, latency: float) -> None:
+        self.batches += 1
+        self.keys += size
+        self.max_batch = max(self.max_batch, size)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "keys": self.keys,
+            "avg_batch_size": self.keys / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "avg_latency_ms": 1000 * self.total_latency / self.batches if self.batches else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+            "pending": sum(len(batch.futures) for batch in self._batches.values()),
+        }
@@ -0,0 +1,284 @@
+from bisect import bisect_left, insort
+from bson import ObjectId
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+from ..core import metrics
+from ..core.changes import CREATED, DELETED, UPDATED, change_feed
+from ..core.page_cache import user_pages
+from ..models.user import UserModel, UserUpdate
+from ..schemas.user import UserCreate
+from .backend import UserBackend
+from .stats import email_domain
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+class UserRecord:
+    __slots__ = ("id", "name", "email", "version")
+
+    def __init__(self, id: ObjectId, name: str, email: str, version: int):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.version = version
+
+    def to_model(self) -> UserModel:
+        return UserModel(_id=self.id, name=self.name, email=self.email, version=self.version)
+
+
+class MemoryEngine:
+    """
+    In-process user store.
+
+    Records are ``__slots__`` objects held in a dict by _id, with a sorted
+    list of _ids (the ordered index used for pagination) and a unique hash
+    index on email. User totals are kept up to date on every write.
+    Operations are synchronous and never yield to the event loop, so each
+    one is atomic with respect to other requests.
+    """
+
+    def __init__(self):
+        self._records: Dict[ObjectId, UserRecord] = {}
+        self._ids: List[ObjectId] = []
+        self._emails: Dict[str, ObjectId] = {}
+        self.domains: Counter = Counter()
+        self.updated_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, object_id: ObjectId) -> Optional[UserRecord]:
+        return self._records.get(object_id)
+
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        object_id = self._emails.get(email)
+        return self._records[object_id] if object_id is not None else None
+
+    def page(self, skip: int, limit: int) -> List[UserRecord]:
+        """Records in _id order"""
+        return [self._records[object_id] for object_id in self._ids[skip:skip + limit]]
+
+    def insert(self, name: str, email: str, object_id: Optional[ObjectId] = None, version: int = 1) -> UserRecord:
+        if email in self._emails:
+            raise ValueError("Email already registered")
+        record = UserRecord(object_id or ObjectId(), name, email, version)
+        self._add(record)
+        self._touch()
+        return record
+
+    def update(self, object_id: ObjectId, fields: dict) -> Optional[UserRecord]:
+        record = self._records.get(object_id)
+        if record is None:
+            return None
+
+        email = fields.get("email")
+        if email is not None and email != record.email:
+            if email in self._emails:
+                raise ValueError("Email already registered")
+            del self._emails[record.email]
+            self._emails[email] = object_id
+            self._count(record.email, -1)
+            self._count(email, 1)
+            record.email = email
+        if "name" in fields:
+            record.name = fields["name"]
+        record.version += 1
+        self._touch()
+        return record
+
+    def delete(self, object_id: ObjectId) -> Optional[UserRecord]:
+        record = self._records.pop(object_id, None)
+        if record is None:
+            return None
+        del self._ids[bisect_left(self._ids, object_id)]
+        del self._emails[record.email]
+        self._count(record.email, -1)
+        self._touch()
+        return record
+
+    def _add(self, record: UserRecord) -> None:
+        self._records[record.id] = record
+        # ObjectIds grow over time, so this is almost always an append
+        if not self._ids or self._ids[-1] < record.id:
+            self._ids.append(record.id)
+        else:
+            insort(self._ids, record.id)
+        self._emails[record.email] = record.id
+        self._count(record.email, 1)
+
+    def _count(self, email: str, delta: int) -> None:
+        domain = email_domain(email)
+        self.domains[domain] += delta
+        if not self.domains[domain]:
+            del self.domains[domain]
+
+    def _touch(self) -> None:
+        self.updated_at = datetime.now(timezone.utc)
+
+    def recount(self) -> Counter:
+        """Per-domain counts from a full scan of the records"""
+        return Counter(email_domain(record.email) for record in self._records.values())
+
+    def clear(self) -> None:
+        self._records.clear()
+        self._ids.clear()
+        self._emails.clear()
+        self.domains.clear()
+        self.updated_at = None
+
+    def snapshot(self, path: str) -> int:
+        """Write all records to ``path`` atomically; returns the number written"""
+        rows = [
+            [str(record.id), record.name, record.email, record.version]
+            for record in self._records.values()
+        ]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": SNAPSHOT_FORMAT, "users": rows}, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        logger.info("Wrote snapshot of %s users to %s", len(rows), path)
+        return len(rows)
+
+    def restore(self, path: str) -> int:
+        """Replace the contents with a snapshot; returns the number loaded"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {data.get('format')}")
+        self.load(UserRecord(ObjectId(row[0]), row[1], row[2], row[3]) for row in data["users"])
+        logger.info("Restored %s users from %s", len(self), path)
+        return len(self)
+
+    def load(self, records: Iterable[UserRecord]) -> None:
+        self.clear()
+        for record in records:
+            if record.email in self._emails:
+                raise ValueError(f"Duplicate email in snapshot: {record.email}")
+            self._records[record.id] = record
+            self._emails[record.email] = record.id
+            self._count(record.email, 1)
+        self._ids = sorted(self._records)
+        self._touch()
+
+    def stats(self) -> dict:
+        return {"users": len(self._records), "domains": len(self.domains)}
+
+
+# Process-wide, since a MemoryUserCRUD is created per request
+memory_engine = MemoryEngine()
+metrics.register("memory_engine", memory_engine.stats)
+
+
+class MemoryUserCRUD(UserBackend):
+    """UserBackend over a MemoryEngine"""
+
+    def __init__(self, engine: MemoryEngine):
+        self.engine = engine
+
+    async def create_user(self, user_data: UserCreate) -> UserModel:
+        """Create a new user"""
+        user = self.engine.insert(user_data.name, user_data.email).to_model()
+        user_pages.invalidate()
+        await change_feed.user_changed(CREATED, user)
+        return user
+
+    async def get_user(self, user_id: str) -> Optional[UserModel]:
+        """Get user by ID"""
+        if not ObjectId.is_valid(user_id):
+            return None
+        record = self.engine.get(ObjectId(user_id))
+        return record.to_model() if record else None
+
+    async def get_user_by_email(self, email: str) -> Optional[UserModel]:
+        """Get user by email"""
+        record = self.engine.get_by_email(email)
+        return record.to_model() if record else None
+
+    async def get_users(self, skip: int = 0, limit: int = 10) -> List[UserModel]:
+        """Get list of users with pagination"""
+        return [record.to_model() for record in self.engine.page(skip, limit)]
+
+    async def get_user_version(self, user_id: str) -> Optional[int]:
+        """Get the current version of a user"""
+        if not ObjectId.is_valid(user_id):
+            return None
+        record = self.engine.get(ObjectId(user_id))
+        return record.version if record else None
+
+    async def get_users_versions(self, skip: int = 0, limit: int = 10) -> List[Tuple[str, int]]:
+        """Get (id, version) pairs for a page of users, in list order"""
+        return [(str(record.id), record.version) for record in self.engine.page(skip, limit)]
+
+    async def get_users_by_ids(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Get raw user documents (name and email only) for many IDs, keyed by ID"""
+        docs = {}
+        for user_id in user_ids:
+            if not ObjectId.is_valid(user_id):
+                continue
+            record = self.engine.get(ObjectId(user_id))
+            if record is not None:
+                docs[str(record.id)] = {"_id": record.id, "name": record.name, "email": record.email}
+        return docs
+
+    async def get_users_count(self) -> int:
+        """Get total count of users"""
+        return len(self.engine)
+
+    async def update_user(self, user_id: str, user_data: UserUpdate) -> Optional[UserModel]:
+        """Update user by ID"""
+        if not ObjectId.is_valid(user_id):
+            return None
+
+        update_data = {k: v for k, v in user_data.model_dump().items() if v is not None}
+        if not update_data:
+            return await self.get_user(user_id)
+
+        record = self.engine.update(ObjectId(user_id), update_data)
+        if record is None:
+            return None
+        user = record.to_model()
+        user_pages.invalidate()
+        await change_feed.user_changed(UPDATED, user)
+        return user
+
+    async def delete_user(self, user_id: str) -> bool:
+        """Delete user by ID"""
+        if not ObjectId.is_valid(user_id):
+            return False
+        if self.engine.delete(ObjectId(user_id)) is None:
+            return False
+        user_pages.invalidate()
+        await change_feed.publish(DELETED, user_id)
+        return True
+
+    async def get_stats(self) -> dict:
+        """Get user totals"""
+        return {
+            "total": len(self.engine),
+            "domains": dict(self.engine.domains),
+            "updated_at": self.engine.updated_at,
+        }
+
+    async def reconcile_stats(self, apply: bool = True) -> dict:
+        """Recount user totals from the records and report drift"""
+        actual = self.engine.recount()
+        stored = self.engine.domains
+        domain_drift = {
+            domain: stored.get(domain, 0) - actual.get(domain, 0)
+            for domain in set(stored) | set(actual)
+            if stored.get(domain, 0) != actual.get(domain, 0)
+        }
+        if apply and domain_drift:
+            self.engine.domains = actual
+        return {
+            "drifted": bool(domain_drift),
+            "total_drift": 0,
+            "domain_drift": domain_drift,
+            "stats": await self.get_stats(),
+        }
@@ -0,0 +1,194 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClientSession
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS_ID = "users"
+
+
+def email_domain(email: str) -> str:
+    return email.rsplit("@", 1)[-1].lower()
+
+
+def _encode(domain: str) -> str:
+    # Dots would be read as nested paths by $inc
+    return domain.replace("%", "%25").replace(".", "%2E")
+
+
+def _decode(key: str) -> str:
+    return key.replace("%2E", ".").replace("%25", "%")
+
+
+class UserStatsCRUD:
+    """
+    Materialized user statistics kept in a single ``user_stats`` document.
+
+    The document holds the total number of users and a count per email
+    domain, updated with ``$inc`` by UserCRUD writes, so reading it is a
+    single ``find_one``. ``reconcile`` rebuilds it from a full scan. Every
+    ``$inc`` also bumps ``generation``, so a rebuild can tell whether writes
+    landed while it was scanning.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.user_stats
+        self.users = database.users
+
+    async def record_create(self, email: str, session: Optional[AsyncIOMotorClientSession] = None) -> None:
+        await self._inc({"total": 1, f"domains.{_encode(email_domain(email))}": 1}, session)
+
+    async def record_delete(self, email: str, session: Optional[AsyncIOMotorClientSession] = None) -> None:
+        await self._inc({"total": -1, f"domains.{_encode(email_domain(email))}": -1}, session)
+
+    async def record_deletes(self, emails: List[str], session: Optional[AsyncIOMotorClientSession] = None) -> None:
+        """Count many deleted users in one update"""
+        if not emails:
+            return
+        increments = {"total": -len(emails)}
+        for domain, count in Counter(email_domain(email) for email in emails).items():
+            increments[f"domains.{_encode(domain)}"] = -count
+        await self._inc(increments, session)
+
+    async def record_email_change(
+        self, old_email: str, new_email: str, session: Optional[AsyncIOMotorClientSession] = None
+    ) -> None:
+        old_domain, new_domain = email_domain(old_email), email_domain(new_email)
+        if old_domain != new_domain:
+            await self._inc({f"domains.{_encode(old_domain)}": -1, f"domains.{_encode(new_domain)}": 1}, session)
+
+    async def _inc(self, increments: Dict[str, int], session: Optional[AsyncIOMotorClientSession]) -> None:
+        await self.collection.update_one(
+            {"_id": STATS_ID},
+            {"$inc": {**increments, "generation": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            session=session
+        )
+
+    async def get_stats(self) -> dict:
+        """Get the current totals"""
+        doc = await self.collection.find_one({"_id": STATS_ID})
+        return self._to_stats(doc)
+
+    async def reconcile(self, apply: bool = True, attempts: int = 3) -> dict:
+        """
+        Recount from a full scan, report drift and (by default) store the recount.
+
+        The recount is only stored if no write changed the document during the
+        scan, or it would overwrite their increments; otherwise the scan is
+        repeated, up to ``attempts`` times, and then left to the next run.
+        """
+        doc = None
+        for _ in range(attempts if apply else 1):
+            before = await self.collection.find_one({"_id": STATS_ID})
+            total, domains = await self._recount()
+            if not apply:
+                break
+            doc = await self._replace(before, total, domains)
+            if doc is not None:
+                break
+            logger.info("User stats changed during reconciliation, recounting")
+        else:
+            logger.warning("User stats kept changing during reconciliation; left for the next run")
+            doc = await self.collection.find_one({"_id": STATS_ID})
+
+        stored = self._to_stats(before)
+        domain_drift = {
+            domain: stored["domains"].get(domain, 0) - domains.get(domain, 0)
+            for domain in set(stored["domains"]) | set(domains)
+            if stored["domains"].get(domain, 0) != domains.get(domain, 0)
+        }
+        total_drift = stored["total"] - total
+        drifted = bool(total_drift or domain_drift)
+        if drifted:
+            logger.warning("User stats drifted by %s users across %s domains", total_drift, len(domain_drift))
+
+        return {
+            "drifted": drifted,
+            "total_drift": total_drift,
+            "domain_drift": domain_drift,
+            "stats": self._to_stats(doc) if doc is not None else stored,
+        }
+
+    async def _recount(self) -> Tuple[int, Counter]:
+        total = 0
+        domains: Counter = Counter()
+        async for user in self.users.find({}, {"email": 1, "_id": 0}).batch_size(5000):
+            total += 1
+            domains[email_domain(user["email"])] += 1
+        return total, domains
+
+    async def _replace(self, before: Optional[dict], total: int, domains: Counter) -> Optional[dict]:
+        """Store a recount unless the document changed since ``before``; None if it did"""
+        generation = before.get("generation") if before else None
+        replacement = {
+            "total": total,
+            "domains": {_encode(domain): count for domain, count in domains.items()},
+            "updated_at": datetime.now(timezone.utc),
+            "generation": (generation or 0) + 1,
+        }
+        if before is None:
+            try:
+                await self.collection.insert_one({"_id": STATS_ID, **replacement})
+            except DuplicateKeyError:
+                return None  # created by a write meanwhile
+            return {"_id": STATS_ID, **replacement}
+        # A missing generation (stats written before it existed) matches None
+        return await self.collection.find_one_and_replace(
+            {"_id": STATS_ID, "generation": generation},
+            replacement,
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def _to_stats(doc: Optional[dict]) -> dict:
+        if not doc:
+            return {"total": 0, "domains": {}, "updated_at": None}
+        return {
+            "total": doc.get("total", 0),
+            "domains": {_decode(key): count for key, count in doc.get("domains", {}).items() if count},
+            "updated_at": doc.get("updated_at"),
+        }
+
+
+class StatsReconciler:
+    """Periodically reconcile the materialized user stats in the background"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.runs = 0
+        self.drifted_runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, database: AsyncIOMotorDatabase) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run(UserStatsCRUD(database)))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, stats: UserStatsCRUD) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await stats.reconcile()
+            except Exception as e:
+                logger.error("User stats reconciliation failed: %s", e)
+                continue
+            self.runs += 1
+            if report["drifted"]:
+                self.drifted_runs += 1
+
+    def stats(self) -> dict:
+        return {"interval_s": self.interval, "runs": self.runs, "drifted_runs": self.drifted_runs}
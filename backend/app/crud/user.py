@@ -1,58 +1,252 @@
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection, AsyncIOMotorClientSession
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from bson import ObjectId
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
+from ..core import metrics
+from ..core.breaker import mongo_breaker
+from ..core.changes import CREATED, DELETED, UPDATED, change_feed
+from ..core.config import settings
+from ..core.consistency import options_for
+from ..core.deadline import with_deadline
+from ..core.page_cache import user_pages
+from ..core.singleflight import SingleFlight
 from ..models.user import UserModel, UserUpdate
 from ..schemas.user import UserCreate
+from .backend import UserBackend
+from .loader import UserLoader
+from .stats import UserStatsCRUD, email_domain
+from .write_behind import WriteBehindBuffer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Compound index that lets version lookups be answered from the index alone
+# (see init-mongo.js)
+VERSION_INDEX = [("_id", 1), ("version", 1)]
+VERSION_PROJECTION = {"_id": 1, "version": 1}
 
-class UserCRUD:
+
+def email_fields(email: str) -> dict:
+    """Fields derived from the email, stored with it (older documents get them from migrations)"""
+    return {"email_normalized": email.strip().lower(), "email_domain": email_domain(email)}
+
+# Process-wide, since a UserCRUD is created per request
+user_reads = SingleFlight()
+metrics.register("user_reads", user_reads.stats)
+
+user_loader = UserLoader(
+    max_batch_size=settings.user_loader_max_batch_size,
+    window=settings.user_loader_window_ms / 1000
+)
+metrics.register("user_loader", user_loader.stats)
+
+user_writes = WriteBehindBuffer(
+    max_batch_size=settings.write_behind_batch_size,
+    flush_interval=settings.write_behind_flush_ms / 1000,
+    max_queue=settings.write_behind_max_queue
+)
+metrics.register("user_writes", user_writes.stats)
+
+
+class UserCRUD(UserBackend):
     def __init__(self, database: AsyncIOMotorDatabase):
+        self.database = database
         self.collection = database.users
+        self.stats = UserStatsCRUD(database)
+        self.session: Optional[AsyncIOMotorClientSession] = None
+        self._collections: Dict[str, AsyncIOMotorCollection] = {}
 
+    def _for(self, operation: str) -> AsyncIOMotorCollection:
+        """Users collection carrying the consistency profile configured for an operation"""
+        collection = self._collections.get(operation)
+        if collection is None:
+            options = options_for(operation)
+            collection = self.database.get_collection("users", **options) if options else self.collection
+            self._collections[operation] = collection
+        return collection
+
+    async def _start_session(self) -> None:
+        """Open a causally consistent session so this request reads its own writes"""
+        if self.session is not None or not settings.causal_consistency:
+            return
+        try:
+            self.session = await self.database.client.start_session(causal_consistency=True)
+        except NotImplementedError:
+            # Storage without session support (e.g. mongomock in tests)
+            logger.debug("Sessions not supported, continuing without causal consistency")
+
+    async def close(self) -> None:
+        """End the request's session, if a write opened one"""
+        if self.session is not None:
+            await self.session.end_session()
+            self.session = None
+
+    @mongo_breaker.guard()
+    @with_deadline
     async def create_user(self, user_data: UserCreate) -> UserModel:
         """Create a new user"""
+        collection = self._for("create")
+
         # Check if email already exists
-        existing_user = await self.collection.find_one({"email": user_data.email})
+        existing_user = await collection.find_one({"email": user_data.email}, session=self.session)
         if existing_user:
             raise ValueError("Email already registered")
 
         user_dict = user_data.model_dump()
-        result = await self.collection.insert_one(user_dict)
-        
+        user_dict["version"] = 1
+        user_dict.update(email_fields(user_dict["email"]))
+        try:
+            if settings.write_behind_enabled:
+                # Batched with concurrent creates; the document we sent is what was stored
+                await user_writes.insert(self._for("bulk_create"), user_dict)
+                user_reads.forget()
+                user_pages.invalidate()
+                await self.stats.record_create(user_dict["email"])
+                user = UserModel(**user_dict)
+                await change_feed.user_changed(CREATED, user)
+                return user
+
+            await self._start_session()
+            result = await collection.insert_one(user_dict, session=self.session)
+        except DuplicateKeyError:
+            raise ValueError("Email already registered")
+        user_reads.forget()
+        user_pages.invalidate()
+        await self.stats.record_create(user_dict["email"], session=self.session)
+
         # Retrieve the created user
-        created_user = await self.collection.find_one({"_id": result.inserted_id})
-        return UserModel(**created_user)
+        created_user = await collection.find_one({"_id": result.inserted_id}, session=self.session)
+        user = UserModel(**created_user)
+        await change_feed.user_changed(CREATED, user)
+        return user
 
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
     async def get_user(self, user_id: str) -> Optional[UserModel]:
         """Get user by ID"""
         if not ObjectId.is_valid(user_id):
             return None
-        
-        user = await self.collection.find_one({"_id": ObjectId(user_id)})
+
+        if self.session is not None:
+            # Reads after a write stay in the request's session instead of being shared
+            return await self._find_user("get", {"_id": ObjectId(user_id)})
+
+        return await user_reads.do(
+            (self.collection.full_name, "id", user_id),
+            lambda: self._load_user(ObjectId(user_id))
+        )
+
+    async def _load_user(self, object_id: ObjectId) -> Optional[UserModel]:
+        # Batched with other lookups issued in the same event-loop tick
+        user = await user_loader.load(self._for("get"), object_id)
         if user:
             return UserModel(**user)
         return None
 
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
     async def get_user_by_email(self, email: str) -> Optional[UserModel]:
         """Get user by email"""
-        user = await self.collection.find_one({"email": email})
+        if self.session is not None:
+            return await self._find_user("get", {"email": email})
+
+        return await user_reads.do(
+            (self.collection.full_name, "email", email),
+            lambda: self._find_user("get", {"email": email})
+        )
+
+    async def _find_user(self, operation: str, query: dict) -> Optional[UserModel]:
+        user = await self._for(operation).find_one(query, session=self.session)
         if user:
             return UserModel(**user)
         return None
 
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
     async def get_users(self, skip: int = 0, limit: int = 10) -> List[UserModel]:
         """Get list of users with pagination"""
-        cursor = self.collection.find().skip(skip).limit(limit)
+        if self.session is not None:
+            return await self._find_users(skip, limit)
+
+        return await user_reads.do(
+            (self.collection.full_name, "list", skip, limit),
+            lambda: self._find_users(skip, limit)
+        )
+
+    async def _find_users(self, skip: int, limit: int) -> List[UserModel]:
+        cursor = self._for("list").find(session=self.session).sort("_id", 1).skip(skip).limit(limit)
         users = await cursor.to_list(length=limit)
         return [UserModel(**user) for user in users]
 
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
+    async def get_user_version(self, user_id: str) -> Optional[int]:
+        """Get the current version of a user without fetching the document"""
+        if not ObjectId.is_valid(user_id):
+            return None
+
+        docs = await self._find_versions("get", {"_id": ObjectId(user_id)}, skip=0, limit=1)
+        if docs:
+            return docs[0].get("version", 0)
+        return None
+
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
+    async def get_users_versions(self, skip: int = 0, limit: int = 10) -> List[Tuple[str, int]]:
+        """Get (id, version) pairs for a page of users, in list order"""
+        docs = await self._find_versions("list", {}, skip=skip, limit=limit)
+        return [(str(doc["_id"]), doc.get("version", 0)) for doc in docs]
+
+    async def _find_versions(self, operation: str, query: dict, skip: int, limit: int) -> List[dict]:
+        """Run an index-covered query projecting only _id and version"""
+        def cursor():
+            return (
+                self._for(operation).find(query, VERSION_PROJECTION, session=self.session)
+                .sort("_id", 1).skip(skip).limit(limit)
+            )
+
+        try:
+            return await cursor().hint(VERSION_INDEX).to_list(length=limit)
+        except OperationFailure:
+            # Version index not built on this deployment yet; use the _id index
+            logger.warning("Version index missing, falling back to _id index")
+            return await cursor().to_list(length=limit)
+
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
+    async def get_users_by_ids(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Get raw user documents (name and email only) for many IDs, keyed by ID"""
+        object_ids = list({ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)})
+        chunk_size = settings.batch_get_chunk_size
+        chunks = [object_ids[i:i + chunk_size] for i in range(0, len(object_ids), chunk_size)]
+
+        results = await asyncio.gather(*(self._find_chunk(chunk) for chunk in chunks))
+        return {str(doc["_id"]): doc for docs in results for doc in docs}
+
+    async def _find_chunk(self, object_ids: List[ObjectId]) -> List[dict]:
+        cursor = self._for("batch_get").find(
+            {"_id": {"$in": object_ids}}, {"name": 1, "email": 1}, session=self.session
+        )
+        return await cursor.to_list(length=len(object_ids))
+
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
     async def get_users_count(self) -> int:
         """Get total count of users"""
-        return await self.collection.count_documents({})
+        if self.session is not None:
+            return await self._for("count").count_documents({}, session=self.session)
+
+        # Answered from collection metadata instead of scanning every document;
+        # sessions need the exact count_documents above
+        return await user_reads.do(
+            (self.collection.full_name, "count"),
+            lambda: self._for("count").estimated_document_count()
+        )
 
+    @mongo_breaker.guard()
+    @with_deadline
     async def update_user(self, user_id: str, user_data: UserUpdate) -> Optional[UserModel]:
         """Update user by ID"""
         if not ObjectId.is_valid(user_id):
@@ -62,31 +256,84 @@ class UserCRUD:
         update_data = {k: v for k, v in user_data.model_dump().items() if v is not None}
         
         if not update_data:
-            # If no data to update, return current user
-            return await self.get_user(user_id)
+            # If no data to update, return current user; unguarded, since this
+            # call already holds a breaker slot
+            return await self._find_user("get", {"_id": ObjectId(user_id)})
+
+        collection = self._for("update")
 
         # Check if email is being updated and if it already exists
         if "email" in update_data:
-            existing_user = await self.collection.find_one({
+            existing_user = await collection.find_one({
                 "email": update_data["email"],
                 "_id": {"$ne": ObjectId(user_id)}
-            })
+            }, session=self.session)
             if existing_user:
                 raise ValueError("Email already registered")
 
-        result = await self.collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        update_fields = {**update_data, **email_fields(update_data["email"])} if "email" in update_data else update_data
+        await self._start_session()
+        try:
+            if "email" in update_data:
+                # Need the old email to move the user between domain counts
+                previous = await collection.find_one_and_update(
+                    {"_id": ObjectId(user_id)},
+                    {"$set": update_fields, "$inc": {"version": 1}},
+                    projection={"email": 1},
+                    return_document=ReturnDocument.BEFORE,
+                    session=self.session
+                )
+                modified = previous is not None
+            else:
+                result = await collection.update_one(
+                    {"_id": ObjectId(user_id)},
+                    {"$set": update_fields, "$inc": {"version": 1}},
+                    session=self.session
+                )
+                modified = result.modified_count > 0
+        except DuplicateKeyError:
+            raise ValueError("Email already registered")
+        user_reads.forget()
+        user_pages.invalidate()
+
+        if "email" in update_data and modified:
+            await self.stats.record_email_change(previous["email"], update_data["email"], session=self.session)
         
-        if result.modified_count:
-            return await self.get_user(user_id)
+        if modified:
+            user = await self._find_user("get", {"_id": ObjectId(user_id)})
+            if user:
+                await change_feed.user_changed(UPDATED, user)
+            return user
         return None
 
+    @mongo_breaker.guard()
+    @with_deadline
     async def delete_user(self, user_id: str) -> bool:
         """Delete user by ID"""
         if not ObjectId.is_valid(user_id):
             return False
         
-        result = await self.collection.delete_one({"_id": ObjectId(user_id)})
-        return result.deleted_count > 0
+        await self._start_session()
+        deleted = await self._for("delete").find_one_and_delete(
+            {"_id": ObjectId(user_id)}, projection={"email": 1}, session=self.session
+        )
+        user_reads.forget()
+        user_pages.invalidate()
+        if deleted is None:
+            return False
+        await self.stats.record_delete(deleted["email"], session=self.session)
+        await change_feed.publish(DELETED, user_id)
+        return True
+
+    @mongo_breaker.guard(retry=True)
+    @with_deadline
+    async def get_stats(self) -> dict:
+        """Get the materialized user totals"""
+        return await self.stats.get_stats()
+
+    # A full scan is slow by design; only its errors count against the circuit
+    @mongo_breaker.guard(timed=False)
+    @with_deadline
+    async def reconcile_stats(self, apply: bool = True) -> dict:
+        """Rebuild the user totals from a full scan and report drift"""
+        return await self.stats.reconcile(apply=apply)
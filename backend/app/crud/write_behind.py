@@ -0,0 +1,118 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson import ObjectId
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_CODES = (11000, 11001)
+
+
+class _PendingBatch:
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+        self.entries: List[Tuple[dict, asyncio.Future]] = []
+        self.emails = set()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class WriteBehindBuffer:
+    """
+    Coalesce single-document inserts into unordered ``insert_many`` batches.
+
+    A batch is flushed when it reaches ``max_batch_size`` documents or
+    ``flush_interval`` seconds after its first document, whichever comes
+    first. Each caller waits until its own document is acknowledged and
+    gets its own error back. At most ``max_queue`` documents may be waiting
+    at once; further callers wait for room (backpressure).
+    """
+
+    def __init__(self, max_batch_size: int = 500, flush_interval: float = 0.005, max_queue: int = 5000):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches: Dict[str, _PendingBatch] = {}
+        self.queued = 0
+        self.flushes = 0
+        self.inserted = 0
+        self.failed = 0
+
+    async def insert(self, collection: AsyncIOMotorCollection, document: dict) -> ObjectId:
+        """Queue a document and return its _id once the batch is acknowledged"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            key = collection.full_name
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _PendingBatch(collection)
+                batch.timer = loop.call_later(self.flush_interval, self._flush, key, batch)
+
+            email = document.get("email")
+            if email is not None and email in batch.emails:
+                # Would collide with a document in the same batch
+                raise DuplicateKeyError("E11000 duplicate key error (pending insert)", code=11000)
+            batch.emails.add(email)
+
+            document.setdefault("_id", ObjectId())
+            future = loop.create_future()
+            batch.entries.append((document, future))
+            self.queued += 1
+            if len(batch.entries) >= self.max_batch_size:
+                self._flush(key, batch)
+
+            try:
+                return await asyncio.shield(future)
+            finally:
+                self.queued -= 1
+
+    def _flush(self, key: str, batch: _PendingBatch) -> None:
+        if self._batches.get(key) is not batch:
+            return
+        del self._batches[key]
+        batch.timer.cancel()
+        asyncio.ensure_future(self._write(batch))
+
+    async def _write(self, batch: _PendingBatch) -> None:
+        documents = [document for document, _ in batch.entries]
+        futures = [future for _, future in batch.entries]
+        errors: Dict[int, Exception] = {}
+        self.flushes += 1
+
+        try:
+            await batch.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything not listed in writeErrors was inserted
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") in DUPLICATE_KEY_CODES:
+                    errors[error["index"]] = DuplicateKeyError(error.get("errmsg", ""), code=error["code"])
+                else:
+                    errors[error["index"]] = OperationFailure(error.get("errmsg", ""), code=error.get("code"))
+        except Exception as e:
+            logger.error("Write-behind flush of %d documents failed: %s", len(documents), e)
+            errors = {index: e for index in range(len(documents))}
+
+        for index, (document, future) in enumerate(zip(documents, futures)):
+            if future.done():
+                continue
+            if index in errors:
+                self.failed += 1
+                future.set_exception(errors[index])
+            else:
+                self.inserted += 1
+                future.set_result(document["_id"])
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "flushes": self.flushes,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "avg_batch_size": (self.inserted + self.failed) / self.flushes if self.flushes else 0.0,
+        }
@@ -1,12 +1,32 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import settings
-from .core.database import connect_to_mongo, close_mongo_connection
-from .api.routes import users
+from .core import metrics
+from .core.admission import AdaptiveLimiter, AdmissionControlMiddleware
+from .core.breaker import CircuitOpen, mongo_breaker
+from .core.changes import change_feed
+from .core.compression import CompressionMiddleware
+from .core.health import health_checker, UNHEALTHY
+from .core.deadline import DeadlineMiddleware, DeadlineExceeded, parse_route_defaults
+from .core.loop_watchdog import loop_watchdog
+from .core.memory_profile import memory_profiler
+from .core.page_cache import user_pages
+from .core.idempotency import IdempotencyStore, IdempotencyMiddleware
+from .core.logs import AccessLogMiddleware, AccessLogPolicy, pipeline, setup_logging
+from .core.tracing import TracingMiddleware, instrument_middleware, tracer
+from .core.database import db, connect_to_mongo, close_mongo_connection
+from .crud.delete_jobs import delete_job_runner
+from .crud.memory import memory_engine
+from .crud.stats import StatsReconciler
+from .api.deps import require_debug
+from .api.routes import debug, users
 import logging
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records are written by a background thread, never on the event loop
+setup_logging(settings.log_level, settings.log_format, settings.log_queue_size)
+metrics.register("logging", pipeline.stats)
 logger = logging.getLogger(__name__)
 
 # Create FastAPI application
@@ -19,7 +39,99 @@ app = FastAPI(
     redoc_url=f"{settings.api_v1_str}/redoc",
 )
 
-# Set up CORS
+def idempotency_collection():
+    """Where idempotent responses are persisted (in-process only on the memory backend)"""
+    if settings.storage_backend == "memory" or db.database is None:
+        return None
+    return db.database.idempotency_keys
+
+
+# Retried POSTs (create, batch-get) replay the first attempt's response
+idempotency_store = IdempotencyStore(
+    get_collection=idempotency_collection,
+    ttl=settings.idempotency_ttl_s,
+    cache_size=settings.idempotency_cache_size,
+    cache_bytes=settings.idempotency_cache_bytes,
+    lock_timeout=settings.idempotency_lock_timeout_s,
+)
+metrics.register("idempotency", idempotency_store.stats)
+if settings.idempotency_enabled:
+    app.add_middleware(
+        IdempotencyMiddleware,
+        store=idempotency_store,
+        path_prefix=f"{settings.api_v1_str}/users",
+        max_body_size=settings.idempotency_max_body_bytes,
+    )
+
+# Shed load with a fast 429/503 instead of queueing on a saturated Mongo pool
+limiter = AdaptiveLimiter(
+    initial_limit=settings.admission_initial_limit,
+    min_limit=settings.admission_min_limit,
+    max_limit=settings.admission_max_limit,
+    target_latency=settings.admission_target_latency_ms / 1000,
+    backoff_ratio=settings.admission_backoff_ratio,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout_ms / 1000,
+    client_queue_limit=settings.admission_client_queue_limit,
+    bulk_share=settings.admission_bulk_share,
+)
+metrics.register("admission", limiter.stats)
+if settings.admission_enabled:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        limiter=limiter,
+        path_prefix=f"{settings.api_v1_str}/users",
+        retry_after=settings.admission_retry_after,
+        degraded=lambda: health_checker.degraded,
+    )
+
+# Per-request deadline, propagated to MongoDB; work stops when the client disconnects
+app.add_middleware(
+    DeadlineMiddleware,
+    path_prefix=f"{settings.api_v1_str}/users",
+    default_budget=settings.deadline_default_ms / 1000,
+    max_budget=settings.deadline_max_ms / 1000,
+    route_budgets=parse_route_defaults(settings.deadline_route_defaults),
+)
+
+# Compress responses (gzip/brotli/zstd negotiated from Accept-Encoding)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    gzip_level=settings.compression_gzip_level,
+    brotli_quality=settings.compression_brotli_quality,
+    zstd_level=settings.compression_zstd_level,
+    offload_size=settings.compression_offload_size,
+    cache_size=settings.compression_cache_size,
+    cacheable_paths=[app.openapi_url],
+)
+
+# Readiness is checked in the background and served from cache
+metrics.register("health", health_checker.stats)
+# Loop lag histogram; stacks of code that blocks the loop are under /debug/loop-stalls
+metrics.register("event_loop", loop_watchdog.stats)
+# Requests fail fast with 503 while MongoDB is unreachable
+metrics.register("circuit_breaker", mongo_breaker.stats)
+
+# User changes for SSE/WebSocket subscribers, shared by workers via a capped collection
+metrics.register("change_feed", change_feed.stats)
+
+# Rendered list pages; a change from any worker drops them
+change_feed.broadcaster.listeners.append(lambda record: user_pages.invalidate())
+metrics.register("page_cache", user_pages.stats)
+
+# Keeps the materialized user stats honest if an $inc was lost
+stats_reconciler = StatsReconciler(interval=settings.stats_reconcile_interval_s)
+metrics.register("stats_reconciler", stats_reconciler.stats)
+
+# Bulk deletes by filter, resumed by any worker after a restart
+metrics.register("delete_jobs", delete_job_runner.stats)
+
+# RSS per worker; tracemalloc snapshots and object counts are under /debug/memory
+metrics.register("memory", memory_profiler.stats)
+
+# Set up CORS outside admission, idempotency and compression: their error responses
+# get CORS headers too, and preflights are answered without taking an admission slot
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,  # Use configured origins from environment
@@ -28,23 +140,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# A span per middleware above, inside one trace per request
+instrument_middleware(app, tracer)
+metrics.register("tracing", tracer.stats)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Outermost: request id and DB time for every log line, plus sampled access logs
+access_log_policy = AccessLogPolicy(
+    sample_rate=settings.access_log_sample_rate if settings.access_log_enabled else 0.0,
+    rate_limit=settings.access_log_rate_limit,
+)
+metrics.register("access_log", access_log_policy.stats)
+app.add_middleware(AccessLogMiddleware, policy=access_log_policy)
+
 # Include routers
 app.include_router(
     users.router,
     prefix=f"{settings.api_v1_str}/users",
     tags=["users"]
 )
+app.include_router(
+    debug.router,
+    prefix="/debug",
+    tags=["debug"],
+    dependencies=[Depends(require_debug)],
+    include_in_schema=False
+)
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """Report an exhausted request budget as a gateway timeout"""
+    logger.warning(
+        "Deadline exceeded for %s %s (%sms of %sms)",
+        request.method, request.url.path, exc.elapsed_ms, exc.budget_ms
+    )
+    return JSONResponse(
+        status_code=504,
+        content={
+            "detail": "Request deadline exceeded",
+            "budget_ms": exc.budget_ms,
+            "elapsed_ms": exc.elapsed_ms,
+        },
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    """Fail fast while the database circuit is open"""
+    retry_after = max(1, round(exc.retry_after))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database unavailable, retry later", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection on startup"""
+    """Initialize storage on startup"""
+    health_checker.start()
+    loop_watchdog.start()
+    if settings.storage_backend == "memory":
+        if settings.memory_snapshot_path and os.path.exists(settings.memory_snapshot_path):
+            memory_engine.restore(settings.memory_snapshot_path)
+        return
+
     await connect_to_mongo()
+    await change_feed.start(db.database)
+    delete_job_runner.start(db.database)
+    if settings.stats_reconcile_interval_s > 0:
+        stats_reconciler.start(db.database)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close database connection on shutdown"""
+    """Close storage on shutdown"""
+    await health_checker.stop()
+    await loop_watchdog.stop()
+    await user_pages.stop()
+    if settings.storage_backend == "memory":
+        if settings.memory_snapshot_path:
+            memory_engine.snapshot(settings.memory_snapshot_path)
+        return
+
+    await stats_reconciler.stop()
+    await delete_job_runner.stop()
+    await change_feed.stop()
     await close_mongo_connection()
 
 
@@ -60,5 +242,28 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+    """Cached health report: status, reasons and per-dependency checks"""
+    return health_checker.report()
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and its event loop is answering"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe from the cached report; 503 only when unhealthy"""
+    report = health_checker.report()
+    return JSONResponse(
+        report,
+        status_code=503 if report["status"] == UNHEALTHY else 200,
+        headers={"X-Health-Status": report["status"]},
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Counters from in-process subsystems"""
+    return metrics.collect()
@@ -0,0 +1,70 @@
+"""
+Data migration command.
+
+Run with ``python -m app.migrations status``, ``... run`` or
+``... run --dry-run`` against the configured MongoDB. Safe to run while
+the API is serving: batches are throttled and progress is recorded, so an
+interrupted run picks up where it stopped.
+"""
+
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ..core.config import settings
+from ..core.logs import setup_logging
+from .runner import MigrationFailed, MigrationLocked, MigrationRunner
+from .steps import MIGRATIONS
+
+
+def build_runner(database) -> MigrationRunner:
+    return MigrationRunner(
+        database,
+        MIGRATIONS,
+        target_latency=settings.migration_target_ms / 1000,
+        min_batch=settings.migration_min_batch,
+        max_batch=settings.migration_max_batch,
+        initial_batch=settings.migration_initial_batch,
+        duty_cycle=settings.migration_duty_cycle,
+        lease=settings.migration_lease_s,
+    )
+
+
+async def execute(command: str, target: Optional[int], dry_run: bool) -> List[dict]:
+    client = AsyncIOMotorClient(
+        settings.mongodb_url, serverSelectionTimeoutMS=settings.mongodb_server_selection_timeout_ms
+    )
+    try:
+        runner = build_runner(client[settings.database_name])
+        if command == "status":
+            return await runner.status()
+        if dry_run:
+            return await runner.dry_run(target)
+        return await runner.run(target)
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Apply versioned data migrations to the users database")
+    parser.add_argument("command", choices=["status", "run"])
+    parser.add_argument("--target", type=int, help="Stop after this version (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Count documents each pending migration would change")
+    args = parser.parse_args(argv)
+
+    setup_logging(settings.log_level, settings.log_format, settings.log_queue_size)
+    try:
+        reports = asyncio.run(execute(args.command, args.target, args.dry_run))
+    except (MigrationLocked, MigrationFailed) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(reports, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+from abc import ABC, abstractmethod
+from motor.motor_asyncio import AsyncIOMotorCollection
+from typing import Optional
+
+
+class Migration(ABC):
+    """
+    One versioned change to existing documents, applied in batches.
+
+    ``filter`` selects the documents that still need the change, so a run
+    touches only those and running again is harmless. ``update`` returns the
+    update for one of them (None skips it). Each update is applied only
+    while the document still matches ``filter``, so a document the app
+    already rewrote is left alone. Filters must not constrain ``_id``; the
+    runner does that to resume.
+    """
+
+    version: int
+    name: str
+    collection: str = "users"
+    projection: Optional[dict] = None  # fields ``update`` needs
+
+    @abstractmethod
+    def filter(self) -> dict:
+        """Documents that still need this migration"""
+
+    @abstractmethod
+    def update(self, doc: dict) -> Optional[dict]:
+        """Update document for one matching document"""
+
+    async def prepare(self, collection: AsyncIOMotorCollection) -> None:
+        """Run once before the first batch, e.g. to build an index"""
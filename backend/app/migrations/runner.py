@@ -0,0 +1,218 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence
+import asyncio
+import logging
+import os
+import socket
+import time
+from ..core.breaker import is_failure
+from ..core.consistency import options_for
+from ..core.throttle import AdaptiveThrottle
+from .base import Migration
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class MigrationLocked(Exception):
+    """Another runner holds the migration"""
+
+
+class MigrationFailed(Exception):
+    def __init__(self, migration: Migration, error: Exception):
+        super().__init__(f"Migration {migration.version} ({migration.name}) failed: {error}")
+        self.migration = migration
+
+
+class MigrationRunner:
+    """
+    Apply migrations online, in version order, one batch at a time.
+
+    Each batch reads the next ``_id`` range of documents matching the
+    migration's filter and applies their updates with one unordered
+    ``bulk_write`` (the ``migration`` consistency operation, majority by
+    default). The throttle sizes batches from their latency against
+    ``target_latency`` and pauses between them, so the primary serving
+    requests sets the pace rather than the migration.
+
+    Progress is recorded per version in the ``migrations`` collection after
+    every batch, so an interrupted run resumes after the last ``_id``. A
+    runner holds a migration while it keeps saving progress; another may
+    take over once ``lease`` seconds pass without any.
+    """
+
+    COLLECTION = "migrations"
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        migrations: Sequence[Migration],
+        target_latency: float = 0.1,
+        min_batch: int = 50,
+        max_batch: int = 2000,
+        initial_batch: int = 200,
+        duty_cycle: float = 0.5,
+        lease: float = 60.0,
+        retry_interval: float = 5.0,
+    ):
+        self.database = database
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.records = database[self.COLLECTION]
+        self.target_latency = target_latency
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.initial_batch = initial_batch
+        self.duty_cycle = duty_cycle
+        self.lease = lease
+        self.retry_interval = retry_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+
+    async def status(self) -> List[dict]:
+        """Every known migration with its recorded progress"""
+        records = {record["_id"]: record async for record in self.records.find()}
+        return [self._report(migration, records.get(migration.version)) for migration in self.migrations]
+
+    async def dry_run(self, target: Optional[int] = None) -> List[dict]:
+        """Count the documents each pending migration would still change, without changing any"""
+        reports = []
+        for migration in self._pending(await self.status(), target):
+            collection = self.database[migration.collection]
+            report = self._report(migration, await self.records.find_one({"_id": migration.version}))
+            report["would_modify"] = await collection.count_documents(migration.filter())
+            reports.append(report)
+        return reports
+
+    async def run(self, target: Optional[int] = None) -> List[dict]:
+        """Apply pending migrations up to ``target`` (all by default); stops at the first failure"""
+        reports = []
+        for migration in self._pending(await self.status(), target):
+            reports.append(await self._apply(migration))
+        return reports
+
+    def _pending(self, status: List[dict], target: Optional[int]) -> List[Migration]:
+        done = {report["version"] for report in status if report["status"] == COMPLETED}
+        return [
+            migration for migration in self.migrations
+            if migration.version not in done and (target is None or migration.version <= target)
+        ]
+
+    async def _claim(self, migration: Migration) -> dict:
+        now = datetime.now(timezone.utc)
+        try:
+            return await self.records.find_one_and_update(
+                {
+                    "_id": migration.version,
+                    "status": {"$ne": COMPLETED},
+                    "$or": [{"owner": None}, {"heartbeat_at": {"$lt": now - timedelta(seconds=self.lease)}}],
+                },
+                {
+                    "$set": {"name": migration.name, "status": RUNNING, "owner": self.owner, "heartbeat_at": now},
+                    "$setOnInsert": {
+                        "last_id": None, "scanned": 0, "modified": 0, "batches": 0, "started_at": now,
+                    },
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The record exists but did not match: someone else is running it
+            raise MigrationLocked(f"Migration {migration.version} ({migration.name}) is running elsewhere")
+
+    async def _save(self, migration: Migration, fields: dict) -> dict:
+        record = await self.records.find_one_and_update(
+            {"_id": migration.version, "owner": self.owner},
+            {"$set": {**fields, "heartbeat_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if record is None:
+            raise MigrationLocked(f"Migration {migration.version} ({migration.name}) was taken over")
+        return record
+
+    async def _apply(self, migration: Migration) -> dict:
+        record = await self._claim(migration)
+        collection = self.database.get_collection(migration.collection, **options_for("migration"))
+        throttle = AdaptiveThrottle(
+            target_latency=self.target_latency,
+            min_batch=self.min_batch,
+            max_batch=self.max_batch,
+            initial_batch=record.get("batch_size") or self.initial_batch,
+            duty_cycle=self.duty_cycle,
+        )
+        logger.info("Migration %s (%s) running from _id %s", migration.version, migration.name, record["last_id"])
+
+        try:
+            await migration.prepare(collection)
+            while True:
+                query = migration.filter()
+                if record["last_id"] is not None:
+                    query = {"$and": [query, {"_id": {"$gt": record["last_id"]}}]}
+
+                started = time.perf_counter()
+                try:
+                    cursor = collection.find(query, migration.projection).sort("_id", 1)
+                    docs = await cursor.limit(throttle.batch_size).to_list(length=throttle.batch_size)
+                    if not docs:
+                        break
+                    operations = [
+                        UpdateOne({"$and": [migration.filter(), {"_id": doc["_id"]}]}, update)
+                        for doc in docs
+                        if (update := migration.update(doc)) is not None
+                    ]
+                    modified = 0
+                    if operations:
+                        modified = (await collection.bulk_write(operations, ordered=False)).modified_count
+                except Exception as e:
+                    if not is_failure(e):
+                        raise
+                    logger.warning("Migration %s waiting on MongoDB: %s", migration.version, e)
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+                pause = throttle.record(time.perf_counter() - started)
+
+                record = await self._save(migration, {
+                    "last_id": docs[-1]["_id"],
+                    "scanned": record["scanned"] + len(docs),
+                    "modified": record["modified"] + modified,
+                    "batches": record["batches"] + 1,
+                    "batch_size": throttle.batch_size,
+                })
+                await asyncio.sleep(pause)
+        except MigrationLocked:
+            raise
+        except Exception as e:
+            logger.error("Migration %s (%s) failed: %s", migration.version, migration.name, e)
+            await self._save(migration, {"status": FAILED, "error": str(e), "owner": None})
+            raise MigrationFailed(migration, e) from e
+
+        record = await self._save(migration, {
+            "status": COMPLETED, "error": None, "owner": None, "finished_at": datetime.now(timezone.utc),
+        })
+        logger.info(
+            "Migration %s (%s) completed: %s scanned, %s modified",
+            migration.version, migration.name, record["scanned"], record["modified"]
+        )
+        return self._report(migration, record)
+
+    @staticmethod
+    def _report(migration: Migration, record: Optional[dict]) -> dict:
+        record = record or {}
+        return {
+            "version": migration.version,
+            "name": migration.name,
+            "status": record.get("status", PENDING),
+            "scanned": record.get("scanned", 0),
+            "modified": record.get("modified", 0),
+            "batches": record.get("batches", 0),
+            "last_id": str(record["last_id"]) if record.get("last_id") is not None else None,
+            "error": record.get("error"),
+            "started_at": record.get("started_at"),
+            "finished_at": record.get("finished_at"),
+        }
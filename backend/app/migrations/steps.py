@@ -0,0 +1,57 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from typing import List, Optional
+from ..crud.user import email_fields
+from .base import Migration
+
+
+class AddVersionCounters(Migration):
+    """Users created before ETags have no version; start them at 1"""
+
+    version = 1
+    name = "add_version_counters"
+    projection = {"_id": 1}
+
+    def filter(self) -> dict:
+        return {"version": {"$exists": False}}
+
+    def update(self, doc: dict) -> Optional[dict]:
+        return {"$set": {"version": 1}}
+
+
+class AddNormalizedEmail(Migration):
+    """Lowercased email for case-insensitive lookups"""
+
+    version = 2
+    name = "add_normalized_email"
+    projection = {"email": 1}
+
+    def filter(self) -> dict:
+        return {"email_normalized": {"$exists": False}}
+
+    def update(self, doc: dict) -> Optional[dict]:
+        return {"$set": {"email_normalized": email_fields(doc["email"])["email_normalized"]}}
+
+
+class AddEmailDomain(Migration):
+    """Email domain as its own indexed field, matching the per-domain stats"""
+
+    version = 3
+    name = "add_email_domain"
+    projection = {"email": 1}
+
+    def filter(self) -> dict:
+        return {"email_domain": {"$exists": False}}
+
+    def update(self, doc: dict) -> Optional[dict]:
+        return {"$set": {"email_domain": email_fields(doc["email"])["email_domain"]}}
+
+    async def prepare(self, collection: AsyncIOMotorCollection) -> None:
+        await collection.create_index([("email_domain", 1)])
+
+
+# In version order; never renumber or remove a migration that has shipped
+MIGRATIONS: List[Migration] = [
+    AddVersionCounters(),
+    AddNormalizedEmail(),
+    AddEmailDomain(),
+]
@@ -19,6 +19,7 @@ class UserModel(BaseModel):
     id: str = Field(default="", alias="_id")
     name: str = Field(..., min_length=1, max_length=100)
     email: EmailStr = Field(...)
+    version: int = Field(default=0, ge=0)
 
     @field_validator('id', mode='before')
     @classmethod
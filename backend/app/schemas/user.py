@@ -1,5 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, model_validator
+from datetime import datetime
+from typing import Literal, Optional
+from ..core.config import settings
 
 
 class UserCreate(BaseModel):
@@ -68,3 +70,152 @@ class UserListResponse(BaseModel):
     total: int
     page: int
     size: int
+
+
+class UserBatchGetRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "ids": ["507f1f77bcf86cd799439011", "507f1f77bcf86cd799439012"]
+            }
+        }
+    )
+
+    ids: list[str] = Field(
+        ..., min_length=1, max_length=settings.batch_get_max_ids, description="User IDs to fetch"
+    )
+
+
+class UserBatchGetResult(BaseModel):
+    id: str = Field(..., description="Requested user ID")
+    status: Literal["found", "not_found", "invalid_id"] = Field(..., description="Lookup outcome")
+    user: Optional[UserResponse] = Field(None, description="The user, when found")
+
+
+class UserBatchGetResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "results": [
+                    {
+                        "id": "507f1f77bcf86cd799439011",
+                        "status": "found",
+                        "user": {
+                            "id": "507f1f77bcf86cd799439011",
+                            "name": "John Doe",
+                            "email": "john.doe@example.com"
+                        }
+                    },
+                    {"id": "507f1f77bcf86cd799439012", "status": "not_found", "user": None}
+                ],
+                "found": 1,
+                "not_found": 1
+            }
+        }
+    )
+
+    results: list[UserBatchGetResult]
+    found: int
+    not_found: int
+
+
+class UserStatsResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "total": 3,
+                "domains": {"example.com": 2, "example.org": 1},
+                "updated_at": "2024-01-01T00:00:00Z"
+            }
+        }
+    )
+
+    total: int = Field(..., description="Total number of users")
+    domains: dict[str, int] = Field(..., description="Number of users per email domain")
+    updated_at: Optional[datetime] = Field(None, description="When the totals last changed")
+
+
+class UserStatsReconcileResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "drifted": True,
+                "total_drift": 1,
+                "domain_drift": {"example.com": 1},
+                "stats": {
+                    "total": 3,
+                    "domains": {"example.com": 2, "example.org": 1},
+                    "updated_at": "2024-01-01T00:00:00Z"
+                }
+            }
+        }
+    )
+
+    drifted: bool = Field(..., description="Whether the stored totals differed from the recount")
+    total_drift: int = Field(..., description="Stored total minus recounted total")
+    domain_drift: dict[str, int] = Field(..., description="Stored minus recounted users, for domains that differed")
+    stats: UserStatsResponse = Field(..., description="Totals after reconciliation")
+
+
+class UserDeleteJobRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "email_domain": "churned-customer.example.com",
+                "created_before": "2024-01-01T00:00:00Z"
+            }
+        }
+    )
+
+    email_domain: Optional[str] = Field(
+        None, min_length=1, max_length=253, description="Delete users whose email is at this domain"
+    )
+    created_before: Optional[datetime] = Field(None, description="Delete users created before this time")
+
+    @model_validator(mode="after")
+    def require_criteria(self) -> "UserDeleteJobRequest":
+        if self.email_domain is None and self.created_before is None:
+            raise ValueError("At least one of email_domain or created_before is required")
+        return self
+
+
+class UserDeleteJobResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "id": "65a1f77bcf86cd7994390110",
+                "status": "running",
+                "filter": {"email_domain": "churned-customer.example.com", "created_before": None},
+                "estimated_total": 12000,
+                "deleted": 4500,
+                "chunks": 30,
+                "batch_size": 250,
+                "cancel_requested": False,
+                "error": None,
+                "created_at": "2024-01-01T00:00:00Z",
+                "started_at": "2024-01-01T00:00:01Z",
+                "finished_at": None
+            }
+        }
+    )
+
+    id: str = Field(..., description="Job ID")
+    status: Literal["pending", "running", "completed", "failed", "cancelled"] = Field(..., description="Job state")
+    filter: dict = Field(..., description="Criteria of the users being deleted")
+    estimated_total: Optional[int] = Field(None, description="Users in the email domain when the job was created")
+    deleted: int = Field(..., description="Users deleted so far")
+    chunks: int = Field(..., description="Chunks deleted so far")
+    batch_size: Optional[int] = Field(None, description="Current chunk size chosen by the throttle")
+    cancel_requested: bool = Field(..., description="Whether the job was asked to stop")
+    error: Optional[str] = Field(None, description="Why the job failed")
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @classmethod
+    def from_job(cls, job: dict) -> "UserDeleteJobResponse":
+        return cls(id=str(job["_id"]), **{name: job.get(name) for name in cls.model_fields if name != "id"})
+
+
+class UserDeleteJobListResponse(BaseModel):
+    jobs: list[UserDeleteJobResponse]
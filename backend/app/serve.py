@@ -0,0 +1,267 @@
+"""
+Production server entrypoint.
+
+Run with ``python -m app.serve``. The application is imported once in the
+master process and then forked into worker processes that share a single
+listening socket. Workers are restarted when they exit, recycled after
+``max_requests`` and replaced one by one on SIGHUP.
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import importlib.util
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from .core.config import settings
+from .core.logs import pipeline, setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may use, honouring affinity and cgroup quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on macOS/Windows
+        cpus = os.cpu_count() or 1
+
+    # Containers limited with --cpus expose the quota through cgroup v2
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def resolve_workers(configured: int) -> int:
+    """Use the configured worker count, or one worker per available CPU when 0"""
+    if settings.storage_backend == "memory":
+        # Users live in the worker's memory: several workers would each serve,
+        # and on shutdown snapshot, their own copy
+        if configured != 1:
+            logger.warning("STORAGE_BACKEND=memory runs a single worker (WORKERS=%d ignored)", configured)
+        return 1
+    if configured > 0:
+        return configured
+    return available_cpus()
+
+
+def build_config(host: str, port: int) -> uvicorn.Config:
+    """Create the uvicorn config, preferring uvloop and httptools when installed"""
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+    return uvicorn.Config(
+        "app.main:app",
+        host=host,
+        port=port,
+        loop=loop,
+        http=http,
+        backlog=settings.backlog,
+        timeout_keep_alive=settings.keep_alive_timeout,
+        timeout_graceful_shutdown=settings.graceful_timeout,
+        log_level=settings.log_level.lower(),
+        # Leave handlers to app.core.logs; our access log replaces uvicorn's
+        log_config=None,
+        access_log=not settings.access_log_enabled,
+        proxy_headers=True,
+        server_header=False,
+    )
+
+
+class Arbiter:
+    """
+    Pre-fork master that keeps ``workers`` uvicorn processes alive.
+
+    A worker that dies within ``MIN_UPTIME`` seconds of starting counts as a
+    crash: replacements are then delayed exponentially, up to
+    ``MAX_BACKOFF``, so a broken deploy doesn't fork in a tight loop. A
+    rolling restart replaces one worker per step of the master loop and
+    never blocks it, so other workers are still reaped and replaced.
+    """
+
+    MIN_UPTIME = 5.0
+    BASE_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.num_workers = workers
+        self.sockets: List[socket.socket] = []
+        self.workers: Dict[int, float] = {}
+        # Old workers told to stop during a rolling restart, with their kill deadline
+        self.retiring: Dict[int, float] = {}
+        self.to_replace: List[int] = []
+        self.crashes = 0
+        self.next_spawn = 0.0
+        self.should_exit = False
+        self.should_reload = False
+
+    def run(self) -> None:
+        # Import the app (and everything it pulls in) once, before forking
+        self.config.load()
+        self.sockets = [self.config.bind_socket()]
+
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        logger.info("Starting %d workers", self.num_workers)
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+
+        try:
+            while not self.should_exit:
+                self.reap_workers()
+                if self.should_reload:
+                    self.should_reload = False
+                    self.rolling_restart()
+                self.advance_restart()
+                while (
+                    not self.should_exit
+                    and len(self.workers) - len(self.retiring) < self.num_workers
+                    and time.monotonic() >= self.next_spawn
+                ):
+                    self.spawn_worker()
+                time.sleep(0.1)
+        finally:
+            self.stop()
+
+    def spawn_worker(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+
+        # Worker process: reset master signal handlers and serve until told to stop
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        if settings.max_requests:
+            # Jitter spreads recycling so workers don't all restart together
+            jitter = random.randint(0, settings.max_requests_jitter)
+            self.config.limit_max_requests = settings.max_requests + jitter
+        exit_code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=self.sockets)
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            exit_code = 1
+        finally:
+            # os._exit skips atexit, so flush the log queue (and the crash traceback) first
+            pipeline.stop()
+            os._exit(exit_code)
+
+    def reap_workers(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            started = self.workers.pop(pid, None)
+            if self.retiring.pop(pid, None) is not None or started is None or self.should_exit:
+                continue
+            if time.monotonic() - started < self.MIN_UPTIME:
+                self.crashes += 1
+                backoff = min(self.BASE_BACKOFF * 2 ** (self.crashes - 1), self.MAX_BACKOFF)
+                self.next_spawn = time.monotonic() + backoff
+                logger.warning(
+                    "Worker %d exited (status %d) after %.1fs, replacing in %.1fs",
+                    pid, status, time.monotonic() - started, backoff
+                )
+            else:
+                self.crashes = 0
+                logger.info("Worker %d exited (status %d), replacing", pid, status)
+
+    def rolling_restart(self) -> None:
+        """Replace workers one at a time so the socket is never left unserved"""
+        self.to_replace = [pid for pid in self.workers if pid not in self.retiring]
+
+    def advance_restart(self) -> None:
+        """One step of a rolling restart: kill a stuck old worker, or replace the next one"""
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                self.retiring.pop(pid, None)
+                self._kill(pid)
+        if self.retiring or not self.to_replace:
+            return
+        pid = self.to_replace.pop(0)
+        if pid not in self.workers:
+            return
+        self.spawn_worker()
+        self.retiring[pid] = now + settings.graceful_timeout
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def stop(self) -> None:
+        logger.info("Shutting down %d workers", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+        deadline = time.monotonic() + settings.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap_workers()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            self._kill(pid)
+
+        for sock in self.sockets:
+            sock.close()
+
+    def _kill(self, pid: int) -> None:
+        logger.warning("Worker %d did not stop in time, killing", pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+        self.workers.pop(pid, None)
+
+    def _handle_exit(self, sig, frame) -> None:
+        self.should_exit = True
+
+    def _handle_reload(self, sig, frame) -> None:
+        self.should_reload = True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument(
+        "--workers", type=int, default=settings.workers,
+        help="Number of worker processes (0 = one per available CPU)"
+    )
+    args = parser.parse_args(argv)
+
+    setup_logging(settings.log_level, settings.log_format, settings.log_queue_size)
+    config = build_config(args.host, args.port)
+    workers = resolve_workers(args.workers)
+
+    if workers == 1:
+        uvicorn.Server(config).run()
+    else:
+        Arbiter(config, workers).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
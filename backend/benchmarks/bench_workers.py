@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for ``python -m app.serve`` at different worker counts.
+
+Starts the server once per worker count, drives it with keep-alive HTTP/1.1
+connections from several load-generator processes and prints requests per
+second. The default path (/health) does not touch MongoDB, so the numbers
+show the serving stack itself rather than the database.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+async def _connection(host: str, port: int, path: str, deadline: float) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    completed = 0
+    try:
+        while time.monotonic() < deadline:
+            writer.write(request)
+            headers = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in headers.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            completed += 1
+    finally:
+        writer.close()
+    return completed
+
+
+def _load_process(host: str, port: int, path: str, connections: int, duration: float) -> int:
+    async def run() -> int:
+        deadline = time.monotonic() + duration
+        results = await asyncio.gather(
+            *(_connection(host, port, path, deadline) for _ in range(connections))
+        )
+        return sum(results)
+
+    return asyncio.run(run())
+
+
+def _wait_ready(port: int, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def bench(workers: int, args: argparse.Namespace) -> float:
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--workers", str(workers),
+         "--host", "127.0.0.1", "--port", str(args.port)],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        _wait_ready(args.port)
+        with multiprocessing.Pool(args.clients) as pool:
+            counts = pool.starmap(
+                _load_process,
+                [("127.0.0.1", args.port, args.path, args.connections, args.duration)] * args.clients,
+            )
+        return sum(counts) / args.duration
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 2,
+                        help="Load-generator processes")
+    parser.add_argument("--connections", type=int, default=16,
+                        help="Keep-alive connections per load-generator process")
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--port", type=int, default=8599)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        rps = bench(workers, args)
+        baseline = baseline or rps
+        print(f"{workers:>8} {rps:>10.0f} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,12 @@ db.users.createIndex({ "email": 1 }, { unique: true });
 // Create index on name field for faster searches
 db.users.createIndex({ "name": 1 });
 
+// Per-domain lookups (email_domain is backfilled by migration 3, see app/migrations)
+db.users.createIndex({ "email_domain": 1 });
+
+// Compound index so ETag/version lookups are covered by the index
+db.users.createIndex({ "_id": 1, "version": 1 });
+
+// The idempotency_keys TTL index is created by the app from IDEMPOTENCY_TTL_S
+
 print('Database initialized successfully!');
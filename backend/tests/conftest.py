@@ -1,6 +1,6 @@
 import pytest
 import asyncio
-from typing import AsyncGenerator, Generator
+from typing import AsyncGenerator, Callable, Generator
 from httpx import AsyncClient, ASGITransport
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from mongomock_motor import AsyncMongoMockClient
@@ -9,6 +9,11 @@ from faker import Faker
 from app.main import app
 from app.core.database import get_database
 from app.core.config import settings
+from app.core.page_cache import user_pages
+from app.crud.delete_jobs import DeleteJobRunner
+from app.crud.memory import memory_engine
+from app.migrations.runner import MigrationRunner
+from app.migrations.steps import MIGRATIONS
 from app.models.user import UserModel
 from app.schemas.user import UserCreate, UserUpdate
 
@@ -16,6 +21,9 @@ from app.schemas.user import UserCreate, UserUpdate
 # Configure Faker
 fake = Faker()
 
+# Small, unthrottled batches so batch sizing and resuming show up on a few users
+BATCH_OPTIONS = {"min_batch": 2, "max_batch": 4, "initial_batch": 2, "duty_cycle": 1.0}
+
 
 @pytest.fixture
 async def mock_database() -> AsyncIOMotorDatabase:
@@ -33,14 +41,32 @@ async def test_client(mock_database: AsyncIOMotorDatabase) -> AsyncGenerator[Asy
         return mock_database
 
     app.dependency_overrides[get_database] = override_get_database
+    # Pages cached by earlier tests came from another database
+    user_pages.invalidate()
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
 
+    await user_pages.stop()
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+async def memory_test_client(monkeypatch) -> AsyncGenerator[AsyncClient, None]:
+    """Create a test client served by the in-memory storage backend."""
+    monkeypatch.setattr(settings, "storage_backend", "memory")
+    memory_engine.clear()
+    user_pages.invalidate()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+    await user_pages.stop()
+    memory_engine.clear()
+
+
 @pytest.fixture
 def sample_user_data() -> dict:
     """Generate sample user data for testing."""
@@ -65,6 +91,22 @@ def sample_user_update() -> UserUpdate:
     )
 
 
+@pytest.fixture
+def migration_runner(mock_database: AsyncIOMotorDatabase) -> Callable[..., MigrationRunner]:
+    """Build migration runners over the test database; keyword arguments override the defaults."""
+    def make(migrations=MIGRATIONS, **options) -> MigrationRunner:
+        return MigrationRunner(mock_database, migrations, **{**BATCH_OPTIONS, "retry_interval": 0.01, **options})
+    return make
+
+
+@pytest.fixture
+def delete_job_runner() -> Callable[..., DeleteJobRunner]:
+    """Build bulk delete job runners; keyword arguments override the defaults."""
+    def make(**options) -> DeleteJobRunner:
+        return DeleteJobRunner(**{**BATCH_OPTIONS, "poll_interval": 0.01, **options})
+    return make
+
+
 @pytest.fixture
 async def created_user(mock_database: AsyncIOMotorDatabase, sample_user_data: dict) -> UserModel:
     """Create a user in the test database and return the UserModel."""
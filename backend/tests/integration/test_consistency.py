@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.crud.user import UserCRUD
+from app.schemas.user import UserCreate, UserUpdate
+
+
+REPLICA_SET_URL = os.environ.get("MONGODB_REPLICA_SET_URL")
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not REPLICA_SET_URL, reason="MONGODB_REPLICA_SET_URL not set")
+class TestConsistencyProfilesReplicaSet:
+    """Read-your-writes checks against a local replica set."""
+
+    @pytest.fixture
+    async def database(self):
+        client = AsyncIOMotorClient(REPLICA_SET_URL)
+        database = client["test_consistency"]
+        await database.users.delete_many({})
+        yield database
+        await client.drop_database("test_consistency")
+        client.close()
+
+    async def test_create_then_read_in_same_request(self, database):
+        """Test a request reads its own write even with secondary reads."""
+        user_crud = UserCRUD(database)
+        try:
+            user = await user_crud.create_user(UserCreate(name="Causal", email="causal@example.com"))
+            assert user_crud.session is not None
+
+            users = await user_crud.get_users(limit=100)
+            assert user.id in [listed.id for listed in users]
+            assert await user_crud.get_users_count() == 1
+        finally:
+            await user_crud.close()
+
+    async def test_update_then_read_in_same_request(self, database):
+        """Test updated fields are visible to the writing request."""
+        user_crud = UserCRUD(database)
+        try:
+            user = await user_crud.create_user(UserCreate(name="Before", email="before@example.com"))
+            await user_crud.update_user(user.id, UserUpdate(name="After"))
+
+            assert (await user_crud.get_user(user.id)).name == "After"
+            assert (await user_crud.get_users(limit=100))[0].name == "After"
+        finally:
+            await user_crud.close()
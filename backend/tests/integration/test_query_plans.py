@@ -0,0 +1,205 @@
+import difflib
+import json
+import os
+import re
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.core.slow_queries import EXPLAINABLE, command_shape, explain_summary, explainable
+from app.crud.user import UserCRUD
+from app.schemas.user import UserCreate, UserUpdate
+
+
+MONGODB_TEST_URL = os.environ.get("MONGODB_TEST_URL")
+DATABASE = "test_query_plans"
+INIT_SCRIPT = Path(__file__).resolve().parents[2] / "init-mongo.js"
+
+SEED_USERS = 2000
+PAGE_SIZE = 10
+BATCH_IDS = 50
+
+# Stages that read an index rather than the whole collection
+INDEX_STAGES = {"IXSCAN", "IDHACK", "COUNT_SCAN", "DISTINCT_SCAN"}
+# Unfiltered counts answered from collection metadata
+METADATA_STAGES = {"COUNT", "RECORD_STORE_FAST_COUNT"}
+# Work allowed per document returned; 2x leaves room for the skipped page
+# of a second-page listing and for $in seeks between ranges
+MAX_EXAMINED_PER_RESULT = 2.0
+EXAMINED_SLACK = 1
+# Methods whose queries must be answered from the index alone
+COVERED = {"get_user_version", "get_users_versions"}
+# Methods not exercised: close issues no query, and reconcile_stats recounts
+# every user by design, so its scan is expected to read the whole collection
+NOT_CHECKED = {"reconcile_stats", "close"}
+
+
+def init_script_indexes(script: str):
+    """(collection, keys, options) for every createIndex call in init-mongo.js"""
+    indexes = []
+    for collection, keys, options in re.findall(
+        r"db\.(\w+)\.createIndex\((\{[^}]*\})(?:\s*,\s*(\{[^}]*\}))?\)", script
+    ):
+        as_json = [re.sub(r"(\w+)\s*:", r'"\1":', literal) for literal in (keys, options or "{}")]
+        indexes.append((collection, json.loads(as_json[0]), json.loads(as_json[1])))
+    return indexes
+
+
+def format_plan(plan: dict, depth: int = 0):
+    """Indented one-line-per-stage rendering of a plan tree"""
+    if not plan:
+        return []
+    if "stage" not in plan:
+        return format_plan(plan.get("queryPlan"), depth)
+    details = [
+        f"{key}={json.dumps(plan[key], default=str)}"
+        for key in ("indexName", "keyPattern", "filter", "direction")
+        if key in plan
+    ]
+    lines = ["  " * depth + " ".join([plan["stage"], *details])]
+    for child in [plan.get("inputStage"), *plan.get("inputStages", [])]:
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+def plan_diff(query: "CapturedQuery", summary: dict):
+    """Unified diff of the expected plan properties against the explained plan, or None if it passes"""
+    stages = summary["stages"]
+    returned = max(summary["n_returned"] or 0, 1)
+    budget = int(MAX_EXAMINED_PER_RESULT * returned) + EXAMINED_SLACK
+    docs_budget = 0 if query.label in COVERED else budget
+    metadata_only = bool(stages) and set(stages) <= METADATA_STAGES
+
+    def index_used(stage):
+        return stage in INDEX_STAGES or stage.startswith("EXPRESS_")
+
+    expected = [
+        "no COLLSCAN",
+        "index scan (IXSCAN, IDHACK, COUNT_SCAN, EXPRESS_*) or metadata count",
+        f"keys examined <= {budget}",
+        f"docs examined <= {docs_budget}",
+    ]
+    keys, docs = summary["keys_examined"] or 0, summary["docs_examined"] or 0
+    indexed = metadata_only or any(index_used(stage) for stage in stages)
+    actual = [
+        "no COLLSCAN" if "COLLSCAN" not in stages else "COLLSCAN",
+        expected[1] if indexed else " -> ".join(stages) or "no winning plan",
+        expected[2] if keys <= budget else f"keys examined {keys} for {returned} returned",
+        expected[3] if docs <= docs_budget else f"docs examined {docs} for {returned} returned",
+    ]
+    if actual == expected:
+        return None
+
+    header = f"{query.label}: {query.command_name} {query.collection} {json.dumps(query.shape, default=str)}"
+    diff = difflib.unified_diff(expected, actual, "expected", "actual", lineterm="")
+    return "\n".join([header, *diff, "winning plan:", *format_plan(summary["winning_plan"], 1)])
+
+
+class CapturedQuery:
+    __slots__ = ("label", "database", "collection", "command_name", "command", "shape")
+
+    def __init__(self, label: str, database: str, command_name: str, command: dict):
+        self.label = label
+        self.database = database
+        self.collection = str(command.get(command_name, ""))
+        self.command_name = command_name
+        self.command = command
+        self.shape = command_shape(command_name, command)
+
+    @property
+    def key(self):
+        return (self.label, self.collection, self.command_name, json.dumps(self.shape, sort_keys=True, default=str))
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Keep every plannable command, tagged with the UserCRUD method being exercised."""
+
+    def __init__(self):
+        self.label = None
+        self.queries = {}
+
+    def started(self, event):
+        if self.label is None or event.command_name not in EXPLAINABLE:
+            return
+        query = CapturedQuery(self.label, event.database_name, event.command_name, dict(event.command))
+        self.queries.setdefault(query.key, query)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not MONGODB_TEST_URL, reason="MONGODB_TEST_URL not set")
+class TestUserQueryPlans:
+    """Check every query UserCRUD issues, other than NOT_CHECKED methods, is planned as an index scan."""
+
+    @pytest.fixture
+    def recorder(self):
+        return QueryRecorder()
+
+    @pytest.fixture
+    async def database(self, recorder):
+        client = AsyncIOMotorClient(MONGODB_TEST_URL, event_listeners=[recorder])
+        await client.drop_database(DATABASE)
+        database = client[DATABASE]
+        for collection, keys, options in init_script_indexes(INIT_SCRIPT.read_text()):
+            await database[collection].create_index(list(keys.items()), **options)
+        await database.users.insert_many([
+            {"name": f"User {i}", "email": f"user{i}@domain{i % 20}.example.com", "version": 1}
+            for i in range(SEED_USERS)
+        ])
+        yield database
+        await client.drop_database(DATABASE)
+        client.close()
+
+    async def exercise(self, database, recorder):
+        """Call every UserCRUD method once, each with its own instance like a request would"""
+        ids = [str(doc["_id"]) async for doc in database.users.find({}, {"_id": 1}).limit(BATCH_IDS)]
+        calls = {
+            "create_user": lambda crud: crud.create_user(UserCreate(name="New", email="new@example.com")),
+            "get_user": lambda crud: crud.get_user(ids[0]),
+            "get_user_by_email": lambda crud: crud.get_user_by_email("user7@domain7.example.com"),
+            "get_users": lambda crud: crud.get_users(skip=PAGE_SIZE, limit=PAGE_SIZE),
+            "get_user_version": lambda crud: crud.get_user_version(ids[1]),
+            "get_users_versions": lambda crud: crud.get_users_versions(skip=PAGE_SIZE, limit=PAGE_SIZE),
+            "get_users_by_ids": lambda crud: crud.get_users_by_ids(ids + [str(ObjectId())]),
+            "get_users_count": lambda crud: crud.get_users_count(),
+            "update_user": lambda crud: crud.update_user(ids[2], UserUpdate(name="Renamed", email="moved@example.org")),
+            "delete_user": lambda crud: crud.delete_user(ids[3]),
+            "get_stats": lambda crud: crud.get_stats(),
+        }
+        for label, call in calls.items():
+            recorder.label = label
+            crud = UserCRUD(database)
+            try:
+                await call(crud)
+            finally:
+                await crud.close()
+        recorder.label = None
+        # A new UserCRUD method must be exercised here or excluded explicitly
+        public = {name for name in vars(UserCRUD) if not name.startswith("_") and callable(getattr(UserCRUD, name))}
+        assert public == set(calls) | NOT_CHECKED
+        return set(calls)
+
+    async def test_every_query_uses_an_index(self, database, recorder):
+        """Test no query shape scans the collection or examines far more than it returns."""
+        methods = await self.exercise(database, recorder)
+
+        failures = []
+        for query in recorder.queries.values():
+            result = await database.client[query.database].command(
+                {"explain": explainable(query.command), "verbosity": "executionStats"}
+            )
+            failure = plan_diff(query, explain_summary(result))
+            if failure:
+                failures.append(failure)
+
+        # A method that stops issuing queries would otherwise pass unchecked
+        assert {query.label for query in recorder.queries.values()} == methods
+        assert not failures, "Query plan regressions:\n\n" + "\n\n".join(failures)
@@ -2,6 +2,7 @@ import pytest
 from httpx import AsyncClient
 
 from app.core.config import settings
+from app.core.health import health_checker
 
 
 class TestMainApplication:
@@ -18,12 +19,23 @@ class TestMainApplication:
         assert data["docs"] == f"{settings.api_v1_str}/docs"
 
     async def test_health_check_endpoint(self, test_client: AsyncClient):
-        """Test health check endpoint."""
+        """Test health check endpoint serves the cached report."""
+        await health_checker.check()
+
         response = await test_client.get("/health")
         
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "healthy"
+        assert "event_loop" in data["checks"]
+
+    async def test_metrics_endpoint(self, test_client: AsyncClient):
+        """Test metrics endpoint reports subsystem counters."""
+        response = await test_client.get("/metrics")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert "coalesced" in data["user_reads"]
 
     async def test_openapi_docs_endpoint(self, test_client: AsyncClient):
         """Test OpenAPI documentation endpoint."""
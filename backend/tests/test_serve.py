@@ -0,0 +1,133 @@
+import pytest
+
+from app import serve
+
+
+class TestServe:
+    """Test cases for the production server entrypoint."""
+
+    def test_available_cpus_is_positive(self):
+        """Test CPU detection returns at least one CPU."""
+        assert serve.available_cpus() >= 1
+
+    def test_resolve_workers_uses_setting(self):
+        """Test an explicit worker count is used as-is."""
+        assert serve.resolve_workers(3) == 3
+
+    def test_resolve_workers_defaults_to_cpus(self, monkeypatch):
+        """Test a worker count of 0 means one per available CPU."""
+        monkeypatch.setattr(serve, "available_cpus", lambda: 6)
+
+        assert serve.resolve_workers(0) == 6
+
+    def test_memory_backend_runs_one_worker(self, monkeypatch):
+        """Test the memory backend is never split across workers."""
+        monkeypatch.setattr(serve.settings, "storage_backend", "memory")
+        monkeypatch.setattr(serve, "available_cpus", lambda: 6)
+
+        assert serve.resolve_workers(0) == 1
+        assert serve.resolve_workers(4) == 1
+
+    def test_build_config_tuning(self, monkeypatch):
+        """Test config carries backlog and keep-alive settings."""
+        monkeypatch.setattr(serve.settings, "backlog", 4096)
+        monkeypatch.setattr(serve.settings, "keep_alive_timeout", 15)
+
+        config = serve.build_config("127.0.0.1", 9000)
+
+        assert config.backlog == 4096
+        assert config.timeout_keep_alive == 15
+        assert config.port == 9000
+        assert config.reload is False
+
+    def test_build_config_prefers_fast_implementations(self, monkeypatch):
+        """Test uvloop/httptools are chosen only when importable."""
+        monkeypatch.setattr(serve.importlib.util, "find_spec", lambda name: None)
+
+        config = serve.build_config("127.0.0.1", 9000)
+
+        assert config.loop == "asyncio"
+        assert config.http == "h11"
+
+
+class TestArbiter:
+    """Test cases for worker respawn backoff and rolling restarts."""
+
+    @pytest.fixture
+    def arbiter(self, monkeypatch):
+        """Arbiter whose forks, signals and waits are faked."""
+        arbiter = serve.Arbiter(config=None, workers=2)
+        arbiter.pids = iter(range(100, 200))
+        arbiter.exited = []
+        arbiter.signals = []
+
+        def waitpid(pid, options):
+            if arbiter.exited:
+                return arbiter.exited.pop(0), 256
+            return 0, 0
+
+        monkeypatch.setattr(serve.os, "fork", lambda: next(arbiter.pids))
+        monkeypatch.setattr(serve.os, "waitpid", waitpid)
+        monkeypatch.setattr(serve.os, "kill", lambda pid, sig: arbiter.signals.append((pid, sig)))
+        return arbiter
+
+    def test_crashing_worker_backs_off(self, arbiter):
+        """Test workers dying right after start are replaced after a growing delay."""
+        pid = arbiter.spawn_worker()
+        delays = []
+        for _ in range(4):
+            arbiter.exited.append(pid)
+            arbiter.reap_workers()
+            delays.append(arbiter.next_spawn - serve.time.monotonic())
+            pid = arbiter.spawn_worker()
+
+        assert [round(delay, 1) for delay in delays] == [0.5, 1.0, 2.0, 4.0]
+
+    def test_backoff_capped_and_reset(self, arbiter):
+        """Test the delay stops growing at the cap and resets after a healthy run."""
+        arbiter.crashes = 20
+        pid = arbiter.spawn_worker()
+        arbiter.exited.append(pid)
+        arbiter.reap_workers()
+        assert arbiter.next_spawn - serve.time.monotonic() <= arbiter.MAX_BACKOFF
+
+        pid = arbiter.spawn_worker()
+        arbiter.workers[pid] -= arbiter.MIN_UPTIME
+        arbiter.exited.append(pid)
+        arbiter.reap_workers()
+
+        assert arbiter.crashes == 0
+
+    def test_rolling_restart_one_step_at_a_time(self, arbiter, monkeypatch):
+        """Test each step replaces one worker and returns without waiting for it."""
+        monkeypatch.setattr(serve.settings, "graceful_timeout", 30)
+        old = [arbiter.spawn_worker(), arbiter.spawn_worker()]
+        arbiter.rolling_restart()
+
+        arbiter.advance_restart()
+        arbiter.advance_restart()
+
+        assert arbiter.signals == [(old[0], serve.signal.SIGTERM)]
+        assert list(arbiter.retiring) == [old[0]]
+        assert len(arbiter.workers) - len(arbiter.retiring) == 2
+
+        arbiter.exited.append(old[0])
+        arbiter.reap_workers()
+        arbiter.advance_restart()
+
+        assert arbiter.signals[-1] == (old[1], serve.signal.SIGTERM)
+        assert arbiter.crashes == 0
+        assert old[0] not in arbiter.workers
+
+    def test_stuck_worker_killed_after_timeout(self, arbiter, monkeypatch):
+        """Test a replaced worker still running after the graceful timeout is killed."""
+        monkeypatch.setattr(serve.settings, "graceful_timeout", 0)
+        old = arbiter.spawn_worker()
+        arbiter.rolling_restart()
+
+        arbiter.advance_restart()
+        arbiter.advance_restart()
+
+        assert arbiter.signals == [(old, serve.signal.SIGTERM), (old, serve.signal.SIGKILL)]
+        assert old not in arbiter.workers
+        assert not arbiter.retiring
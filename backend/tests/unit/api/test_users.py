@@ -130,6 +130,63 @@ class TestUsersAPI:
         
         assert response.status_code == 404
 
+    async def test_get_user_returns_etag(self, test_client: AsyncClient, api_url, created_user):
+        """Test user retrieval includes an ETag header."""
+        response = await test_client.get(f"{api_url}/{created_user.id}")
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] == f'"{created_user.id}-0"'
+
+    async def test_get_user_not_modified(self, test_client: AsyncClient, api_url, created_user):
+        """Test conditional GET with matching ETag returns 304."""
+        first = await test_client.get(f"{api_url}/{created_user.id}")
+        etag = first.headers["etag"]
+        
+        response = await test_client.get(
+            f"{api_url}/{created_user.id}", headers={"If-None-Match": etag}
+        )
+        
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    async def test_get_user_not_modified_with_upper_case_id(self, test_client: AsyncClient, api_url, created_user):
+        """Test the ETag does not depend on the case of the hex id in the path."""
+        user_id = created_user.id.upper()
+        etag = (await test_client.get(f"{api_url}/{user_id}")).headers["etag"]
+
+        response = await test_client.get(f"{api_url}/{user_id}", headers={"If-None-Match": etag})
+
+        assert etag == f'"{created_user.id}-0"'
+        assert response.status_code == 304
+
+    async def test_get_user_modified_after_update(self, test_client: AsyncClient, api_url, created_user):
+        """Test conditional GET after an update returns the new document."""
+        first = await test_client.get(f"{api_url}/{created_user.id}")
+        etag = first.headers["etag"]
+        await test_client.put(f"{api_url}/{created_user.id}", json={"name": "Renamed"})
+        
+        response = await test_client.get(
+            f"{api_url}/{created_user.id}", headers={"If-None-Match": etag}
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["name"] == "Renamed"
+        assert response.headers["etag"] != etag
+
+    async def test_get_users_not_modified(self, test_client: AsyncClient, api_url, multiple_users):
+        """Test conditional list GET returns 304 until the page changes."""
+        first = await test_client.get(api_url + "/")
+        etag = first.headers["etag"]
+        
+        response = await test_client.get(api_url + "/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        
+        await test_client.delete(f"{api_url}/{multiple_users[0].id}")
+        response = await test_client.get(api_url + "/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
     async def test_update_user_success(self, test_client: AsyncClient, api_url, created_user):
         """Test successful user update."""
         update_data = {
@@ -211,3 +268,96 @@ class TestUsersAPI:
         response = await test_client.delete(f"{api_url}/{invalid_id}")
         
         assert response.status_code == 404
+
+    async def test_batch_get_users_in_request_order(self, test_client: AsyncClient, api_url, multiple_users):
+        """Test batch-get returns users in request order with not-found markers."""
+        missing_id = str(ObjectId())
+        ids = [multiple_users[2].id, missing_id, "invalid-id", multiple_users[0].id]
+        
+        response = await test_client.post(f"{api_url}/batch-get", json={"ids": ids})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [result["id"] for result in data["results"]] == ids
+        assert [result["status"] for result in data["results"]] == [
+            "found", "not_found", "invalid_id", "found"
+        ]
+        assert data["results"][0]["user"]["email"] == multiple_users[2].email
+        assert data["results"][1]["user"] is None
+        assert data["found"] == 2
+        assert data["not_found"] == 2
+
+    async def test_batch_get_users_duplicate_ids(self, test_client: AsyncClient, api_url, created_user):
+        """Test duplicate IDs each get a result."""
+        response = await test_client.post(
+            f"{api_url}/batch-get", json={"ids": [created_user.id, created_user.id]}
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["found"] == 2
+
+    async def test_batch_get_users_validation(self, test_client: AsyncClient, api_url):
+        """Test batch-get rejects empty and oversized requests."""
+        empty = await test_client.post(f"{api_url}/batch-get", json={"ids": []})
+        too_many = await test_client.post(
+            f"{api_url}/batch-get", json={"ids": [str(ObjectId()) for _ in range(settings.batch_get_max_ids + 1)]}
+        )
+        
+        assert empty.status_code == 422
+        assert too_many.status_code == 422
+
+    async def test_exhausted_deadline_returns_504(self, test_client: AsyncClient, api_url, created_user):
+        """Test a spent request budget returns 504 with timing details."""
+        response = await test_client.get(
+            f"{api_url}/{created_user.id}", headers={"X-Request-Timeout": "0"}
+        )
+        
+        assert response.status_code == 504
+        data = response.json()
+        assert data["detail"] == "Request deadline exceeded"
+        assert data["budget_ms"] == 0
+        assert "elapsed_ms" in data
+
+    async def test_user_stats_follow_creates_and_deletes(self, test_client: AsyncClient, api_url):
+        """Test the stats endpoint reflects creates and deletes by domain."""
+        first = await test_client.post(api_url + "/", json={"name": "A", "email": "a@example.com"})
+        await test_client.post(api_url + "/", json={"name": "B", "email": "b@example.org"})
+        await test_client.delete(f"{api_url}/{first.json()['id']}")
+        
+        response = await test_client.get(f"{api_url}/stats")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        assert data["domains"] == {"example.org": 1}
+
+    async def test_reconcile_user_stats(self, test_client: AsyncClient, api_url, multiple_users):
+        """Test reconciliation reports drift for users written outside the API and fixes it."""
+        dry_run = await test_client.post(f"{api_url}/stats/reconcile", params={"dry_run": True})
+        response = await test_client.post(f"{api_url}/stats/reconcile")
+        stats = await test_client.get(f"{api_url}/stats")
+        
+        assert dry_run.status_code == 200
+        assert dry_run.json()["total_drift"] == -5
+        assert dry_run.json()["stats"]["total"] == 0
+        assert response.json()["drifted"] is True
+        assert response.json()["stats"]["total"] == 5
+        assert stats.json()["total"] == 5
+
+    async def test_memory_backend_round_trip(self, memory_test_client: AsyncClient, api_url):
+        """Test the API works end to end on the in-memory storage backend."""
+        created = await memory_test_client.post(api_url + "/", json={"name": "A", "email": "a@example.com"})
+        user_id = created.json()["id"]
+        
+        updated = await memory_test_client.put(f"{api_url}/{user_id}", json={"name": "B"})
+        listed = await memory_test_client.get(api_url + "/")
+        stats = await memory_test_client.get(f"{api_url}/stats")
+        deleted = await memory_test_client.delete(f"{api_url}/{user_id}")
+        missing = await memory_test_client.get(f"{api_url}/{user_id}")
+        
+        assert created.status_code == 201
+        assert updated.json()["name"] == "B"
+        assert listed.json()["total"] == 1
+        assert stats.json()["domains"] == {"example.com": 1}
+        assert deleted.status_code == 204
+        assert missing.status_code == 404
@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from app.core.admission import (
+    AdaptiveLimiter, AdmissionControlMiddleware, Rejected, BULK, INTERACTIVE
+)
+from app.core.config import settings
+from app.main import limiter
+
+
+class TestAdaptiveLimiter:
+    """Test cases for the AIMD concurrency limiter."""
+
+    async def test_admits_up_to_limit(self):
+        """Test requests under the limit are admitted immediately."""
+        limiter = AdaptiveLimiter(initial_limit=2, queue_timeout=0.01)
+
+        await limiter.acquire(INTERACTIVE, "a")
+        await limiter.acquire(INTERACTIVE, "a")
+
+        assert limiter.total_in_flight == 2
+        with pytest.raises(Rejected) as exc:
+            await limiter.acquire(INTERACTIVE, "a")
+        assert exc.value.status_code == 503
+        assert limiter.stats()["rejected"]["queue_timeout"] == 1
+
+    async def test_queued_request_admitted_on_release(self):
+        """Test a waiting request gets the slot freed by a completion."""
+        limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=1)
+        await limiter.acquire(INTERACTIVE, "a")
+
+        waiter = asyncio.ensure_future(limiter.acquire(INTERACTIVE, "b"))
+        await asyncio.sleep(0)
+        limiter.release(INTERACTIVE, 0.01, failed=False)
+        await asyncio.wait_for(waiter, 1)
+
+        assert limiter.total_in_flight == 1
+
+    async def test_additive_increase_and_multiplicative_decrease(self):
+        """Test fast completions grow the limit and slow ones shrink it."""
+        limiter = AdaptiveLimiter(initial_limit=10, target_latency=0.1, backoff_ratio=0.5)
+
+        for _ in range(10):
+            await limiter.acquire(INTERACTIVE, "a")
+            limiter.release(INTERACTIVE, 0.01, failed=False)
+        assert 10.9 < limiter.limit < 11
+
+        await limiter.acquire(INTERACTIVE, "a")
+        limiter.release(INTERACTIVE, 0.5, failed=False)
+        assert limiter.limit < 6
+
+    async def test_limit_respects_bounds(self):
+        """Test the limit never drops below min_limit."""
+        limiter = AdaptiveLimiter(initial_limit=4, min_limit=3, target_latency=0, backoff_ratio=0.1)
+
+        await limiter.acquire(INTERACTIVE, "a")
+        limiter.release(INTERACTIVE, 1.0, failed=True)
+
+        assert limiter.limit == 3
+
+    async def test_bulk_limited_to_share(self):
+        """Test bulk work can only use its share of the limit."""
+        limiter = AdaptiveLimiter(initial_limit=8, bulk_share=0.25, queue_timeout=0.01)
+
+        await limiter.acquire(BULK, "a")
+        await limiter.acquire(BULK, "a")
+        with pytest.raises(Rejected):
+            await limiter.acquire(BULK, "a")
+        await limiter.acquire(INTERACTIVE, "a")
+
+        assert limiter.in_flight == {INTERACTIVE: 1, BULK: 2}
+
+    async def test_interactive_dispatched_before_bulk(self):
+        """Test freed slots go to interactive waiters first."""
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, bulk_share=1.0, queue_timeout=1)
+        await limiter.acquire(INTERACTIVE, "a")
+
+        bulk = asyncio.ensure_future(limiter.acquire(BULK, "b"))
+        interactive = asyncio.ensure_future(limiter.acquire(INTERACTIVE, "c"))
+        await asyncio.sleep(0)
+        limiter.release(INTERACTIVE, 0.01, failed=False)
+        await asyncio.wait_for(interactive, 1)
+
+        assert not bulk.done()
+        limiter.release(INTERACTIVE, 0.01, failed=False)
+        await asyncio.wait_for(bulk, 1)
+
+    async def test_fair_share_round_robin(self):
+        """Test a noisy client can't starve others."""
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, queue_timeout=1)
+        await limiter.acquire(INTERACTIVE, "holder")
+
+        order = []
+
+        async def request(client):
+            await limiter.acquire(INTERACTIVE, client)
+            order.append(client)
+
+        tasks = [asyncio.ensure_future(request(client)) for client in ["noisy", "noisy", "noisy", "quiet"]]
+        await asyncio.sleep(0)
+        for _ in range(4):
+            limiter.release(INTERACTIVE, 0.01, failed=False)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+        assert order.index("quiet") == 1
+
+    async def test_client_queue_limit_returns_429(self):
+        """Test a client exceeding its queue share gets 429."""
+        limiter = AdaptiveLimiter(initial_limit=1, client_queue_limit=1, queue_timeout=1)
+        await limiter.acquire(INTERACTIVE, "a")
+        waiter = asyncio.ensure_future(limiter.acquire(INTERACTIVE, "a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Rejected) as exc:
+            await limiter.acquire(INTERACTIVE, "a")
+
+        assert exc.value.status_code == 429
+        waiter.cancel()
+
+
+class TestAdmissionControlMiddleware:
+    """Test cases for the admission control middleware."""
+
+    async def test_overload_returns_503_with_retry_after(self):
+        """Test excess requests are shed quickly with Retry-After."""
+        app = FastAPI()
+        release = asyncio.Event()
+
+        @app.get("/api/slow")
+        async def slow():
+            await release.wait()
+            return {"ok": True}
+
+        @app.get("/other")
+        async def other():
+            return {"ok": True}
+
+        limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=0.01)
+        app.add_middleware(AdmissionControlMiddleware, limiter=limiter, path_prefix="/api", retry_after=2)
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.ensure_future(client.get("/api/slow"))
+            await asyncio.sleep(0.01)
+
+            shed = await client.get("/api/slow")
+            unaffected = await client.get("/other")
+            release.set()
+            assert (await first).status_code == 200
+
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == "2"
+        assert unaffected.status_code == 200
+        assert limiter.total_in_flight == 0
+
+    async def test_bulk_shed_while_degraded(self):
+        """Test bulk requests are turned away while health is degraded, interactive ones are not."""
+        app = FastAPI()
+        degraded = True
+
+        @app.post("/api/users/batch-get")
+        async def batch_get():
+            return {"ok": True}
+
+        @app.get("/api/users")
+        async def users():
+            return {"ok": True}
+
+        limiter = AdaptiveLimiter()
+        app.add_middleware(AdmissionControlMiddleware, limiter=limiter, path_prefix="/api", degraded=lambda: degraded)
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            shed = await client.post("/api/users/batch-get")
+            interactive = await client.get("/api/users")
+            degraded = False
+            recovered = await client.post("/api/users/batch-get")
+
+        assert shed.status_code == 503
+        assert shed.json()["reason"] == "degraded"
+        assert interactive.status_code == 200
+        assert recovered.status_code == 200
+        assert limiter.stats()["rejected"]["degraded"] == 1
+
+    async def test_preflight_not_admitted(self, test_client: AsyncClient):
+        """Test CORS preflights are answered outside admission control."""
+        admitted = limiter.admitted
+
+        response = await test_client.options(f"{settings.api_v1_str}/users/", headers={
+            "Origin": settings.cors_origins[0],
+            "Access-Control-Request-Method": "POST",
+        })
+
+        assert response.status_code == 200
+        assert response.headers["access-control-allow-origin"] == settings.cors_origins[0]
+        assert limiter.admitted == admitted
@@ -0,0 +1,206 @@
+import time
+
+import pytest
+from httpx import AsyncClient
+from pymongo.errors import AutoReconnect, DuplicateKeyError, ServerSelectionTimeoutError
+
+from app.core import deadline as deadline_module
+from app.core.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, is_failure, mongo_breaker
+from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.changes import UPDATED, change_feed
+from app.core.health import HealthChecker
+from app.crud.user import UserCRUD
+from app.schemas.user import UserUpdate
+
+
+def make_breaker(**kwargs):
+    return CircuitBreaker("test", **{"window": 4, "min_calls": 4, "retry_base_delay": 0.001, **kwargs})
+
+
+async def fail(exc):
+    raise exc
+
+
+async def succeed():
+    return "ok"
+
+
+async def run_failures(breaker, count, exc=None):
+    for _ in range(count):
+        with pytest.raises(Exception):
+            await breaker.call(lambda: fail(exc or AutoReconnect("connection refused")))
+
+
+class TestCircuitBreaker:
+    """Test cases for the circuit breaker state machine."""
+
+    def test_failure_classification(self):
+        """Test only unreachable-database errors count as failures."""
+        timed_out = DeadlineExceeded(Deadline(1.0))
+        timed_out.__cause__ = ServerSelectionTimeoutError("no servers")
+
+        assert is_failure(AutoReconnect("reset"))
+        assert is_failure(timed_out)
+        assert not is_failure(DeadlineExceeded(Deadline(1.0)))
+        assert not is_failure(DuplicateKeyError("dup"))
+        assert not is_failure(ValueError("Email already registered"))
+
+    async def test_opens_on_failure_rate(self):
+        """Test the circuit opens once enough calls in the window fail."""
+        breaker = make_breaker(failure_rate=0.5)
+
+        await breaker.call(succeed)
+        await breaker.call(succeed)
+        await run_failures(breaker, 2)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpen) as exc:
+            await breaker.call(succeed)
+        assert 0 < exc.value.retry_after <= breaker.open_duration
+        assert breaker.stats()["rejected"] == 1
+
+    async def test_application_errors_do_not_open(self):
+        """Test errors from a healthy database leave the circuit closed."""
+        breaker = make_breaker()
+
+        await run_failures(breaker, 8, DuplicateKeyError("dup"))
+
+        assert breaker.state == CLOSED
+
+    async def test_opens_on_slow_calls(self):
+        """Test the circuit opens when most calls are slower than the threshold."""
+        breaker = make_breaker(slow_call=-1, slow_call_rate=1.0)
+
+        for _ in range(4):
+            await breaker.call(succeed)
+
+        assert breaker.state == OPEN
+
+    async def test_untimed_calls_never_slow(self):
+        """Test calls judged only on errors are not counted as slow."""
+        breaker = make_breaker(slow_call=-1, slow_call_rate=1.0)
+
+        for _ in range(4):
+            await breaker.call(succeed, timed=False)
+
+        assert breaker.state == CLOSED
+
+    async def test_half_open_trials_close_circuit(self):
+        """Test successful trial calls after the open period close the circuit."""
+        breaker = make_breaker(open_duration=0, half_open_calls=2)
+        await run_failures(breaker, 4)
+        assert breaker.state == OPEN
+
+        await breaker.call(succeed)
+        assert breaker.state == HALF_OPEN
+        await breaker.call(succeed)
+
+        assert breaker.state == CLOSED
+
+    async def test_half_open_limits_trials(self):
+        """Test only half_open_calls trial calls are let through at once."""
+        breaker = make_breaker(open_duration=0, half_open_calls=1)
+        await run_failures(breaker, 4)
+
+        assert breaker.before_call() is True
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+    async def test_half_open_failure_reopens(self):
+        """Test a failed trial call opens the circuit again."""
+        breaker = make_breaker(open_duration=0)
+        await run_failures(breaker, 4)
+
+        await run_failures(breaker, 1)
+
+        assert breaker.state == OPEN
+        assert breaker.opened == 2
+
+    async def test_retries_transient_errors(self):
+        """Test retryable errors are retried with backoff when asked."""
+        breaker = make_breaker(retry_attempts=2)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise AutoReconnect("reset")
+            return "ok"
+
+        assert await breaker.call(flaky, retry=True) == "ok"
+        assert breaker.retries == 2
+
+    async def test_no_retry_without_opt_in(self):
+        """Test writes (retry=False) fail on the first error."""
+        breaker = make_breaker()
+
+        await run_failures(breaker, 1)
+
+        assert breaker.retries == 0
+
+    async def test_no_retry_past_deadline(self, monkeypatch):
+        """Test a retry is not attempted when the request budget cannot cover the backoff."""
+        breaker = make_breaker(retry_base_delay=10, retry_max_delay=10)
+        monkeypatch.setattr("app.core.breaker.random.uniform", lambda low, high: high)
+        token = deadline_module._current.set(Deadline(0.5))
+        try:
+            await run_failures(breaker, 1)
+        finally:
+            deadline_module._current.reset(token)
+
+        assert breaker.retries == 0
+
+    async def test_disabled_passes_through(self):
+        """Test a disabled breaker never opens."""
+        breaker = make_breaker(enabled=False)
+
+        await run_failures(breaker, 8)
+
+        assert breaker.state == CLOSED
+
+    async def test_reported_in_health(self):
+        """Test an open circuit degrades the health report."""
+        breaker = make_breaker()
+        await run_failures(breaker, 4)
+
+        report = await HealthChecker(breaker=breaker).check()
+
+        assert report["status"] == "degraded"
+        assert report["checks"]["circuit_breaker"]["state"] == OPEN
+
+
+class TestCircuitBreakerAPI:
+    """Test cases for requests while the database circuit is open."""
+
+    async def test_open_circuit_returns_503(self, test_client: AsyncClient, created_user, monkeypatch):
+        """Test user requests fail fast with 503 and Retry-After while the circuit is open."""
+        monkeypatch.setattr(mongo_breaker, "state", OPEN)
+        monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+        monkeypatch.setattr(mongo_breaker, "open_duration", 5.0)
+
+        response = await test_client.get(f"{settings.api_v1_str}/users/{created_user.id}")
+        metrics = await test_client.get("/metrics")
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        assert metrics.json()["circuit_breaker"]["state"] == OPEN
+
+    async def test_update_takes_one_trial_slot(self, mock_database, created_user, monkeypatch):
+        """Test an update in half-open state reads the user back without a second breaker call."""
+        monkeypatch.setattr(mongo_breaker, "state", HALF_OPEN)
+        monkeypatch.setattr(mongo_breaker, "half_open_calls", 1)
+        monkeypatch.setattr(mongo_breaker, "_trials", 0)
+        monkeypatch.setattr(mongo_breaker, "_trial_successes", 0)
+        published = []
+
+        async def user_changed(kind, user):
+            published.append((kind, user.name))
+
+        monkeypatch.setattr(change_feed, "user_changed", user_changed)
+
+        user = await UserCRUD(mock_database).update_user(str(created_user.id), UserUpdate(name="Renamed"))
+
+        assert user.name == "Renamed"
+        assert published == [(UPDATED, "Renamed")]
+        assert mongo_breaker.state == CLOSED
@@ -0,0 +1,259 @@
+import asyncio
+import json
+
+import pytest
+from bson import Timestamp
+from httpx import AsyncClient
+
+from app.api.routes.users import user_changes
+from app.core.changes import (
+    CREATED, DELETED, RESET, UPDATED, Broadcaster, ChangeFeed, ChangeRecord, change_feed, format_token, parse_token
+)
+from app.core.config import settings
+from app.crud.user import UserCRUD
+from app.main import app
+from app.schemas.user import UserCreate, UserUpdate
+
+
+async def take(subscription, count, timeout=1.0):
+    """Next ``count`` items from a subscription"""
+    return [await asyncio.wait_for(subscription.__anext__(), timeout) for _ in range(count)]
+
+
+async def settle():
+    """Let started subscribers reach their wait"""
+    await asyncio.sleep(0.01)
+
+
+def event(op="created", user_id="1"):
+    return {"op": op, "id": user_id, "user": None, "at": None}
+
+
+class TestBroadcaster:
+    """Test cases for in-process change fan-out."""
+
+    async def test_fan_out_serializes_once(self):
+        """Test every subscriber receives the same pre-serialized record."""
+        broadcaster = Broadcaster(history=10)
+        subscriptions = [broadcaster.subscribe() for _ in range(3)]
+        waiting = [asyncio.ensure_future(take(subscription, 1)) for subscription in subscriptions]
+        await settle()
+
+        record = broadcaster.broadcast((100, 1), event())
+
+        received = [(await waiter)[0] for waiter in waiting]
+        assert all(item is record for item in received)
+        assert record.sse.startswith(b"id: 100.1\nevent: created\ndata: {")
+        assert broadcaster.stats()["subscribers"] == 3
+
+    async def test_resume_from_history(self):
+        """Test a resume token replays only the changes after it."""
+        broadcaster = Broadcaster(history=10)
+        broadcaster.floor = (0, 0)
+        for counter in range(1, 4):
+            broadcaster.broadcast((100, counter), event(user_id=str(counter)))
+
+        records = await take(broadcaster.subscribe("100.1"), 2)
+
+        assert [record.event["id"] for record in records] == ["2", "3"]
+
+    async def test_resume_past_history_resets(self):
+        """Test a token older than history yields RESET when nothing can backfill."""
+        broadcaster = Broadcaster(history=2)
+        for counter in range(1, 5):
+            broadcaster.broadcast((100, counter), event())
+
+        assert await take(broadcaster.subscribe("100.1"), 1) == [RESET]
+
+    async def test_backfill_then_live_without_duplicates(self):
+        """Test changes older than history come from backfill, then live ones follow once."""
+        broadcaster = Broadcaster(history=2)
+        for counter in range(1, 5):
+            broadcaster.broadcast((100, counter), event(user_id=str(counter)))
+
+        async def backfill(after):
+            return [ChangeRecord((100, counter), event(user_id=str(counter))) for counter in range(after[1] + 1, 5)]
+
+        subscription = broadcaster.subscribe("100.1", backfill=backfill)
+        replayed = await take(subscription, 3)
+        broadcaster.broadcast((100, 5), event(user_id="5"))
+        live = await take(subscription, 1)
+
+        assert [record.event["id"] for record in replayed + live] == ["2", "3", "4", "5"]
+
+    async def test_slow_subscriber_reset(self):
+        """Test a subscriber that falls behind history gets RESET and continues live."""
+        broadcaster = Broadcaster(history=2)
+        subscription = broadcaster.subscribe()
+        waiter = asyncio.ensure_future(take(subscription, 1))
+        await settle()
+        broadcaster.broadcast((100, 1), event())
+        await waiter
+
+        for counter in range(2, 6):
+            broadcaster.broadcast((100, counter), event())
+
+        assert await take(subscription, 1) == [RESET]
+        assert broadcaster.lagged == 1
+
+    async def test_heartbeat(self):
+        """Test a quiet subscription yields None every heartbeat interval."""
+        broadcaster = Broadcaster()
+
+        assert await take(broadcaster.subscribe(heartbeat=0.01), 1) == [None]
+
+    def test_listeners_see_every_record(self):
+        """Test listeners are called with each broadcast record."""
+        broadcaster = Broadcaster(history=10)
+        seen = []
+        broadcaster.listeners.append(seen.append)
+
+        record = broadcaster.broadcast((1, 1), event())
+
+        assert seen == [record]
+
+    def test_tokens(self):
+        """Test tokens round-trip and malformed ones are rejected."""
+        assert parse_token(format_token((1700000000, 7))) == (1700000000, 7)
+        with pytest.raises(ValueError):
+            parse_token("not-a-token")
+
+
+class TestChangeFeed:
+    """Test cases for publishing user changes."""
+
+    async def test_local_publish(self):
+        """Test without a shared collection changes are broadcast directly with increasing tokens."""
+        feed = ChangeFeed(Broadcaster())
+        subscription = feed.subscribe()
+        waiter = asyncio.ensure_future(take(subscription, 2))
+        await settle()
+
+        await feed.publish(CREATED, "a", {"name": "A"})
+        await feed.publish(DELETED, "a")
+
+        first, second = await waiter
+        assert first.event["op"] == CREATED
+        assert first.event["user"] == {"name": "A"}
+        assert second.key > first.key
+
+    async def test_shared_publish_inserts_server_timestamp(self, mocker):
+        """Test with a shared collection the event is inserted for the tailers, with an empty ts."""
+        collection = mocker.MagicMock()
+        collection.insert_one = mocker.AsyncMock()
+        feed = ChangeFeed(Broadcaster(), get_collection=lambda: collection)
+
+        await feed.publish(UPDATED, "a")
+
+        document = collection.insert_one.await_args.args[0]
+        assert next(iter(document)) == "ts"
+        assert document["ts"] == Timestamp(0, 0)
+        assert feed.broadcaster.seq == 0
+
+    async def test_backfill_detects_evicted_changes(self, mocker):
+        """Test backfill gives up when the capped collection no longer holds the resume point."""
+        collection = mocker.MagicMock()
+        collection.find_one = mocker.AsyncMock(return_value={"ts": Timestamp(200, 1)})
+        feed = ChangeFeed(Broadcaster(), get_collection=lambda: collection)
+
+        assert await feed.backfill((100, 1)) is None
+
+    async def test_tail_keeps_idle_cursor(self, mocker):
+        """Test an empty getMore does not end the tail or send a new query."""
+        docs = [StopAsyncIteration(), {"ts": Timestamp(101, 1), **event()}, StopAsyncIteration()]
+
+        class TailableCursor:
+            alive = True
+
+            async def next(self):
+                result = docs.pop(0)
+                if not docs:
+                    TailableCursor.alive = False
+                if isinstance(result, StopAsyncIteration):
+                    raise result
+                return result
+
+        collection = mocker.MagicMock()
+        collection.find_one = mocker.AsyncMock(return_value={"ts": Timestamp(100, 1)})
+        collection.find.return_value = TailableCursor()
+        feed = ChangeFeed(Broadcaster(), get_collection=lambda: collection, retry_interval=10)
+        subscription = feed.subscribe()
+        waiter = asyncio.ensure_future(take(subscription, 1))
+        await settle()
+
+        tail = asyncio.ensure_future(feed._tail())
+        try:
+            record = (await waiter)[0]
+            await settle()
+        finally:
+            tail.cancel()
+
+        assert record.key == (101, 1)
+        assert collection.find.call_count == 1
+        assert docs == []
+
+    async def test_user_crud_publishes(self, mock_database, monkeypatch):
+        """Test UserCRUD creates, updates and deletes are published."""
+        monkeypatch.setattr(change_feed, "broadcaster", Broadcaster())
+        subscription = change_feed.subscribe()
+        waiter = asyncio.ensure_future(take(subscription, 3))
+        await settle()
+        crud = UserCRUD(mock_database)
+
+        user = await crud.create_user(UserCreate(name="Feed", email="feed@example.com"))
+        await crud.update_user(user.id, UserUpdate(name="Fed"))
+        await crud.delete_user(user.id)
+
+        records = await waiter
+        assert [record.event["op"] for record in records] == [CREATED, UPDATED, DELETED]
+        assert records[1].event["user"]["name"] == "Fed"
+        assert records[2].event["id"] == user.id
+
+
+class TestChangeEndpoints:
+    """Test cases for the SSE and WebSocket change streams."""
+
+    async def test_invalid_token_rejected(self, test_client: AsyncClient):
+        """Test a malformed resume token is a 400."""
+        response = await test_client.get(f"{settings.api_v1_str}/users/changes", params={"since": "nope"})
+
+        assert response.status_code == 400
+
+    async def test_sse_stream(self, monkeypatch):
+        """Test the event stream sends a retry hint and then each change."""
+        monkeypatch.setattr(change_feed, "broadcaster", Broadcaster())
+        response = await user_changes(since=None, last_event_id=None)
+        body = response.body_iterator
+
+        assert response.media_type == "text/event-stream"
+        assert await body.__anext__() == b"retry: 2000\n\n"
+        waiter = asyncio.ensure_future(body.__anext__())
+        await settle()
+        await change_feed.publish(CREATED, "a")
+        assert (await asyncio.wait_for(waiter, 1)).startswith(b"id: ")
+        await body.aclose()
+
+    async def test_websocket_stream(self, memory_test_client: AsyncClient, monkeypatch):
+        """Test WebSocket subscribers receive changes made through the API as JSON."""
+        monkeypatch.setattr(change_feed, "broadcaster", Broadcaster())
+        received, sent = asyncio.Queue(), asyncio.Queue()
+        scope = {
+            "type": "websocket", "path": f"{settings.api_v1_str}/users/changes/ws", "root_path": "",
+            "query_string": b"", "headers": [], "scheme": "ws", "subprotocols": [],
+            "server": ("test", 80), "client": ("test", 1234),
+        }
+        await received.put({"type": "websocket.connect"})
+        connection = asyncio.ensure_future(app(scope, received.get, sent.put))
+
+        accepted = await asyncio.wait_for(sent.get(), 1)
+        await settle()
+        created = await memory_test_client.post(
+            f"{settings.api_v1_str}/users/", json={"name": "Ws", "email": "ws@example.com"}
+        )
+        message = json.loads((await asyncio.wait_for(sent.get(), 1))["text"])
+        connection.cancel()
+
+        assert accepted["type"] == "websocket.accept"
+        assert message["op"] == CREATED
+        assert message["id"] == created.json()["id"]
+        assert message["user"]["email"] == "ws@example.com"
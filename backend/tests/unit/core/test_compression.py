@@ -0,0 +1,144 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from httpx import AsyncClient, ASGITransport
+
+from app.core.compression import (
+    CompressionMiddleware, SUPPORTED_ENCODINGS, negotiate_encoding, compress_bytes
+)
+
+
+LARGE_TEXT = "user-management " * 200
+
+
+class TestNegotiateEncoding:
+    """Test cases for Accept-Encoding negotiation."""
+
+    def test_prefers_server_order_on_ties(self):
+        """Test equal quality picks the first supported encoding."""
+        assert negotiate_encoding("gzip, br, zstd") == SUPPORTED_ENCODINGS[0]
+
+    def test_respects_quality_values(self):
+        """Test q-values override server preference."""
+        assert negotiate_encoding("br;q=0.5, gzip;q=1.0") == "gzip"
+
+    def test_rejects_zero_quality(self):
+        """Test q=0 disables an encoding."""
+        assert negotiate_encoding("gzip;q=0") is None
+
+    def test_wildcard(self):
+        """Test wildcard matches any supported encoding."""
+        assert negotiate_encoding("*") == SUPPORTED_ENCODINGS[0]
+
+    def test_identity_only(self):
+        """Test no supported encoding returns None."""
+        assert negotiate_encoding("identity") is None
+        assert negotiate_encoding("") is None
+
+    @pytest.mark.parametrize("encoding", SUPPORTED_ENCODINGS)
+    def test_compress_bytes_shrinks_repetitive_data(self, encoding):
+        """Test each available codec compresses data."""
+        data = LARGE_TEXT.encode()
+        assert len(compress_bytes(encoding, data, 3)) < len(data)
+
+
+class TestCompressionMiddleware:
+    """Test cases for the compression middleware."""
+
+    @pytest.fixture
+    def app(self):
+        app = FastAPI()
+        app.add_middleware(
+            CompressionMiddleware, minimum_size=100, cacheable_paths=["/static"]
+        )
+
+        @app.get("/small")
+        async def small():
+            return {"message": "hi"}
+
+        @app.get("/large")
+        async def large():
+            return {"message": LARGE_TEXT}
+
+        @app.get("/static")
+        async def static():
+            return {"message": LARGE_TEXT}
+
+        @app.get("/etagged")
+        async def etagged(response: Response):
+            response.headers["ETag"] = '"v1"'
+            return {"message": LARGE_TEXT}
+
+        @app.get("/stream")
+        async def stream():
+            async def chunks():
+                for _ in range(5):
+                    yield LARGE_TEXT.encode()
+            return StreamingResponse(chunks(), media_type="text/plain")
+
+        return app
+
+    @pytest.fixture
+    async def client(self, app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+    def _middleware(self, app) -> CompressionMiddleware:
+        stack = app.middleware_stack
+        while not isinstance(stack, CompressionMiddleware):
+            stack = stack.app
+        return stack
+
+    async def test_small_response_not_compressed(self, client):
+        """Test responses below the threshold are sent as-is."""
+        response = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+    async def test_large_response_gzip(self, client):
+        """Test large responses are gzip-compressed when requested."""
+        response = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json()["message"] == LARGE_TEXT
+
+    async def test_no_accept_encoding(self, client):
+        """Test clients without Accept-Encoding get identity responses."""
+        response = await client.get("/large", headers={"Accept-Encoding": "identity"})
+
+        assert "content-encoding" not in response.headers
+        assert response.json()["message"] == LARGE_TEXT
+
+    async def test_streaming_response_compressed(self, client):
+        """Test streaming responses are compressed incrementally."""
+        async with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert gzip.decompress(raw) == LARGE_TEXT.encode() * 5
+
+    async def test_etagged_response_cached_and_weakened(self, app, client):
+        """Test ETagged responses reuse cached compressed bytes."""
+        first = await client.get("/etagged", headers={"Accept-Encoding": "gzip"})
+        second = await client.get("/etagged", headers={"Accept-Encoding": "gzip"})
+
+        middleware = self._middleware(app)
+        assert first.headers["etag"] == 'W/"v1"'
+        assert second.json() == first.json()
+        assert middleware.cache_hits >= 1
+
+    async def test_cacheable_path_cached(self, app, client):
+        """Test configured static paths are cached by content hash."""
+        await client.get("/static", headers={"Accept-Encoding": "gzip"})
+        await client.get("/static", headers={"Accept-Encoding": "gzip"})
+        await client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        middleware = self._middleware(app)
+        assert middleware.cache_hits >= 1
+        assert all(key[1] != "/large" for key in middleware.cache)
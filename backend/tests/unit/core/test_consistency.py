@@ -0,0 +1,45 @@
+import pytest
+from pymongo import ReadPreference
+
+from app.core import consistency
+from app.core.consistency import collection_options, options_for
+
+
+class TestConsistencyProfiles:
+    """Test cases for consistency profile resolution."""
+
+    def test_collection_options_write_concern(self):
+        """Test write concern fields map to a WriteConcern."""
+        options = collection_options({"w": "majority", "j": True, "wtimeout_ms": 500})
+
+        assert options["write_concern"].document == {"w": "majority", "j": True, "wtimeout": 500}
+
+    def test_collection_options_reads(self):
+        """Test read preference and read concern are mapped."""
+        options = collection_options({"read_preference": "secondaryPreferred", "read_concern": "majority"})
+
+        assert options["read_preference"] == ReadPreference.SECONDARY_PREFERRED
+        assert options["read_concern"].level == "majority"
+
+    def test_empty_profile_uses_client_defaults(self):
+        """Test an empty profile produces no overrides."""
+        assert collection_options({}) == {}
+
+    def test_default_operation_profiles(self):
+        """Test list reads go to secondaries, batched creates use w=1 and other writes majority."""
+        assert options_for("list")["read_preference"] == ReadPreference.SECONDARY_PREFERRED
+        assert options_for("create")["write_concern"].document == {"w": "majority"}
+        assert options_for("bulk_create")["write_concern"].document == {"w": 1}
+        assert options_for("bulk_delete")["write_concern"].document == {"w": "majority"}
+        assert options_for("migration")["write_concern"].document == {"w": "majority"}
+        assert options_for("unknown") == {}
+
+    def test_invalid_settings_fall_back_to_defaults(self, monkeypatch):
+        """Test malformed JSON or unknown profiles don't break operations."""
+        monkeypatch.setattr(consistency.settings, "consistency_profiles", "not json")
+        assert options_for("list") == {}
+
+        monkeypatch.setattr(consistency.settings, "consistency_profiles", '{"a": {"w": 1}}')
+        monkeypatch.setattr(consistency.settings, "consistency_operations", '{"list": "missing", "create": "a"}')
+        assert options_for("list") == {}
+        assert options_for("create")["write_concern"].document == {"w": 1}
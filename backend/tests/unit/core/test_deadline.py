@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from pymongo import _csot
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from app.core import deadline as deadline_module
+from app.core.deadline import (
+    Deadline, DeadlineExceeded, DeadlineMiddleware, deadline_scope, parse_route_defaults
+)
+
+
+def http_scope(path="/api/users", method="GET", headers=()):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    }
+
+
+class TestDeadlineScope:
+    """Test cases for deadline propagation into MongoDB calls."""
+
+    def test_no_deadline_is_unbounded(self):
+        """Test code outside a request runs without a timeout."""
+        with deadline_scope():
+            assert _csot.get_timeout() is None
+
+    def test_applies_remaining_budget_to_pymongo(self):
+        """Test the remaining budget becomes the pymongo operation timeout."""
+        token = deadline_module._current.set(Deadline(5.0))
+        try:
+            with deadline_scope():
+                assert 0 < _csot.get_timeout() <= 5.0
+        finally:
+            deadline_module._current.reset(token)
+
+    def test_exhausted_budget_raises(self):
+        """Test no database work starts once the budget is spent."""
+        token = deadline_module._current.set(Deadline(0.0))
+        try:
+            with pytest.raises(DeadlineExceeded) as exc:
+                with deadline_scope():
+                    pass
+            assert exc.value.budget_ms == 0
+        finally:
+            deadline_module._current.reset(token)
+
+    def test_pymongo_timeout_maps_to_deadline_exceeded(self):
+        """Test driver timeouts surface as DeadlineExceeded."""
+        token = deadline_module._current.set(Deadline(5.0))
+        try:
+            with pytest.raises(DeadlineExceeded):
+                with deadline_scope():
+                    raise ExecutionTimeout("operation exceeded time limit", code=50)
+            with pytest.raises(OperationFailure):
+                with deadline_scope():
+                    raise OperationFailure("other failure", code=2)
+        finally:
+            deadline_module._current.reset(token)
+
+    def test_parse_route_defaults(self):
+        """Test route defaults are parsed to seconds."""
+        assert parse_route_defaults('{"GET /a": 1500}') == {"GET /a": 1.5}
+        assert parse_route_defaults("not json") == {}
+
+
+class TestDeadlineMiddleware:
+    """Test cases for the deadline middleware."""
+
+    def test_budget_from_header_route_or_default(self):
+        """Test budget precedence and the max cap."""
+        middleware = DeadlineMiddleware(
+            None, default_budget=10, max_budget=20, route_budgets={"POST /api/users/batch-get": 30}
+        )
+
+        assert middleware.budget_for(http_scope(headers=[("x-request-timeout", "250")])) == 0.25
+        assert middleware.budget_for(http_scope(headers=[("x-request-timeout", "999999")])) == 20
+        assert middleware.budget_for(http_scope("/api/users/batch-get", "POST")) == 30
+        assert middleware.budget_for(http_scope()) == 10
+
+    async def test_client_disconnect_cancels_work(self):
+        """Test the handler is cancelled when the client goes away."""
+        cancelled = asyncio.Event()
+
+        async def app(scope, receive, send):
+            assert deadline_module.current_deadline() is not None
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.01)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        middleware = DeadlineMiddleware(app, path_prefix="/api")
+        await asyncio.wait_for(middleware(http_scope(), receive, send), 1)
+
+        assert cancelled.is_set()
+        assert middleware.disconnect_cancellations == 1
@@ -0,0 +1,39 @@
+import pytest
+
+from app.core.etag import user_etag, list_etag, etag_matches
+
+
+class TestETag:
+    """Test cases for ETag helpers."""
+
+    def test_user_etag_changes_with_version(self):
+        """Test user ETag differs between versions."""
+        assert user_etag("abc", 1) != user_etag("abc", 2)
+        assert user_etag("abc", 1) == '"abc-1"'
+
+    def test_list_etag_is_stable(self):
+        """Test list ETag is deterministic for the same page."""
+        entries = [("a", 1), ("b", 2)]
+
+        assert list_etag(entries, 2, 1, 10) == list_etag(list(entries), 2, 1, 10)
+
+    def test_list_etag_changes_with_contents(self):
+        """Test list ETag changes when versions, total or paging change."""
+        base = list_etag([("a", 1)], 1, 1, 10)
+
+        assert list_etag([("a", 2)], 1, 1, 10) != base
+        assert list_etag([("a", 1)], 2, 1, 10) != base
+        assert list_etag([("a", 1)], 1, 2, 10) != base
+
+    @pytest.mark.parametrize("header,expected", [
+        ('"abc-1"', True),
+        ('W/"abc-1"', True),
+        ('"xyz-1", "abc-1"', True),
+        ("*", True),
+        ('"abc-2"', False),
+        ("", False),
+        (None, False),
+    ])
+    def test_etag_matches(self, header, expected):
+        """Test If-None-Match parsing."""
+        assert etag_matches(header, '"abc-1"') is expected
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.health import DEGRADED, HEALTHY, UNHEALTHY, HealthChecker, PoolMonitor, health_checker
+
+
+ADDRESS = ("localhost", 27017)
+
+
+def fake_client(mocker, ping):
+    """Client whose admin.command("ping") runs ``ping``"""
+    client = mocker.MagicMock()
+    client.admin.command = mocker.AsyncMock(side_effect=ping)
+    return client
+
+
+class TestPoolMonitor:
+    """Test cases for connection pool accounting."""
+
+    def test_saturation_from_events(self, mocker):
+        """Test checked-out connections are measured against the pool's max size."""
+        monitor = PoolMonitor()
+        monitor.pool_created(mocker.Mock(address=ADDRESS, options={"maxPoolSize": 4}))
+        for _ in range(3):
+            monitor.connection_check_out_started(mocker.Mock(address=ADDRESS))
+            monitor.connection_checked_out(mocker.Mock(address=ADDRESS))
+        monitor.connection_checked_in(mocker.Mock(address=ADDRESS))
+        monitor.connection_check_out_started(mocker.Mock(address=ADDRESS))
+
+        assert monitor.stats() == {"in_use": 2, "waiting": 1, "saturation": 0.5}
+
+    def test_closed_pool_forgotten(self, mocker):
+        """Test a closed pool no longer counts."""
+        monitor = PoolMonitor()
+        monitor.connection_checked_out(mocker.Mock(address=ADDRESS))
+        monitor.pool_closed(mocker.Mock(address=ADDRESS))
+
+        assert monitor.stats()["in_use"] == 0
+
+
+class TestHealthChecker:
+    """Test cases for the background health checker."""
+
+    async def test_unhealthy_before_first_check(self):
+        """Test readiness is not reported before anything was checked."""
+        checker = HealthChecker()
+
+        assert checker.status == UNHEALTHY
+        assert checker.degraded is False
+
+    async def test_healthy_ping(self, mocker):
+        """Test a fast ping with an idle pool is healthy."""
+        checker = HealthChecker(get_client=lambda: fake_client(mocker, lambda *a: {"ok": 1}), pool=PoolMonitor())
+
+        report = await checker.check()
+
+        assert report["status"] == HEALTHY
+        assert report["checks"]["mongo"]["status"] == "ok"
+
+    async def test_slow_ping_degraded(self, mocker):
+        """Test a ping over the latency threshold degrades readiness."""
+        async def slow_ping(*args):
+            await asyncio.sleep(0.02)
+
+        checker = HealthChecker(degraded_ping=0.01, get_client=lambda: fake_client(mocker, slow_ping))
+
+        report = await checker.check()
+
+        assert report["status"] == DEGRADED
+        assert "mongo ping" in report["reasons"][0]
+        assert checker.degraded is True
+
+    async def test_unhealthy_after_consecutive_failures(self, mocker):
+        """Test one failed ping degrades and repeated failures make it unhealthy."""
+        client = fake_client(mocker, ConnectionError("refused"))
+        checker = HealthChecker(failure_threshold=2, get_client=lambda: client)
+
+        assert (await checker.check())["status"] == DEGRADED
+        assert (await checker.check())["status"] == UNHEALTHY
+
+        client.admin.command.side_effect = None
+        assert (await checker.check())["status"] == HEALTHY
+        assert checker.transitions == 2
+
+    async def test_hanging_ping_not_repeated(self, mocker):
+        """Test a ping still waiting from an earlier check is not sent again."""
+        release = asyncio.Event()
+
+        async def hanging_ping(*args):
+            await release.wait()
+
+        client = fake_client(mocker, hanging_ping)
+        checker = HealthChecker(ping_timeout=0.01, get_client=lambda: client)
+
+        await checker.check()
+        report = await checker.check()
+        release.set()
+
+        assert report["checks"]["mongo"]["error"] == "no reply in 0.01s"
+        assert client.admin.command.await_count == 1
+
+    async def test_saturated_pool_degraded(self, mocker):
+        """Test a nearly exhausted connection pool degrades readiness."""
+        monitor = PoolMonitor()
+        monitor.pool_created(mocker.Mock(address=ADDRESS, options={"maxPoolSize": 1}))
+        monitor.connection_checked_out(mocker.Mock(address=ADDRESS))
+        checker = HealthChecker(pool=monitor)
+
+        report = await checker.check()
+
+        assert report["status"] == DEGRADED
+        assert report["checks"]["mongo"] == {"status": "skipped"}
+
+    async def test_loop_lag_degraded(self):
+        """Test lag read from the loop watchdog over the threshold degrades readiness."""
+        lags = iter([0.5, 0.0])
+        checker = HealthChecker(degraded_loop_lag=0.2, get_loop_lag=lambda: next(lags))
+
+        report = await checker.check()
+
+        assert report["status"] == DEGRADED
+        assert report["checks"]["event_loop"] == {"lag_ms": 500.0}
+        assert (await checker.check())["status"] == HEALTHY
+
+    async def test_stale_report_unhealthy(self, monkeypatch):
+        """Test a report that stopped being refreshed is not trusted."""
+        checker = HealthChecker(interval=1, ping_timeout=1)
+        await checker.check()
+        monkeypatch.setattr(checker, "_checked_at", checker._checked_at - 10)
+
+        assert checker.status == UNHEALTHY
+
+    async def test_background_task(self):
+        """Test the started task checks periodically until stopped."""
+        checker = HealthChecker(interval=0.01)
+
+        checker.start()
+        await asyncio.sleep(0.05)
+        await checker.stop()
+
+        assert checker.checks >= 2
+
+
+class TestHealthEndpoints:
+    """Test cases for the liveness and readiness probes."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_checker(self, monkeypatch):
+        """Forget reports from other tests."""
+        monkeypatch.setattr(health_checker, "_report", None)
+
+    async def test_liveness(self, test_client: AsyncClient):
+        """Test liveness does not depend on any check."""
+        response = await test_client.get("/health/live")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "alive"}
+
+    async def test_not_ready_before_first_check(self, test_client: AsyncClient):
+        """Test readiness fails until the checker has run."""
+        response = await test_client.get("/health/ready")
+
+        assert response.status_code == 503
+        assert response.headers["x-health-status"] == UNHEALTHY
+
+    async def test_ready_serves_cached_report(self, test_client: AsyncClient, mocker, monkeypatch):
+        """Test readiness reports degradation without querying the database itself."""
+        ping = mocker.AsyncMock()
+        client = mocker.MagicMock()
+        client.admin.command = ping
+        monkeypatch.setattr(health_checker, "get_client", lambda: client)
+        monkeypatch.setattr(health_checker, "degraded_ping", -1)
+        await health_checker.check()
+
+        for _ in range(3):
+            response = await test_client.get("/health/ready")
+
+        assert response.status_code == 200
+        assert response.headers["x-health-status"] == DEGRADED
+        assert ping.await_count == 1
@@ -0,0 +1,285 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from pymongo.errors import OperationFailure
+
+from app.core import idempotency
+from app.core.config import settings
+from app.core.idempotency import IdempotencyStore, KeyInProgress, KeyReused, StoredResponse
+from app.main import idempotency_store
+
+
+def response(fingerprint="fp", status=201, body=b'{"id": "1"}'):
+    return StoredResponse(fingerprint, status, [(b"content-type", b"application/json")], body)
+
+
+class TestIdempotencyStore:
+    """Test cases for the idempotency key store."""
+
+    @pytest.fixture
+    def collection(self, mock_database):
+        """Idempotency collection in the mock database."""
+        return mock_database.idempotency_keys
+
+    @pytest.fixture
+    def store(self, collection):
+        """Create a store persisting to the mock collection."""
+        return IdempotencyStore(lambda: collection, lock_timeout=0.2, poll_interval=0.01)
+
+    async def test_first_attempt_owns_key(self, store, collection):
+        """Test the first attempt becomes owner and leaves a pending document."""
+        assert await store.begin("k", "fp") is None
+
+        document = await collection.find_one({"_id": "k"})
+        assert document["state"] == "pending"
+        assert store.stats()["in_flight"] == 1
+
+    async def test_replay_from_memory(self, store):
+        """Test a completed key replays from the in-process cache."""
+        await store.begin("k", "fp")
+        await store.complete("k", response())
+
+        stored = await store.begin("k", "fp")
+
+        assert stored.status == 201
+        assert stored.body == b'{"id": "1"}'
+        assert store.replays == {"memory": 1, "mongo": 0}
+
+    async def test_replay_from_mongo(self, store, collection):
+        """Test another process (fresh store) replays the persisted response."""
+        await store.begin("k", "fp")
+        await store.complete("k", response())
+        other = IdempotencyStore(lambda: collection)
+
+        stored = await other.begin("k", "fp")
+
+        assert stored.status == 201
+        assert stored.headers == [(b"content-type", b"application/json")]
+        assert stored.body == b'{"id": "1"}'
+        assert other.replays == {"memory": 0, "mongo": 1}
+
+    async def test_reused_key_rejected(self, store):
+        """Test a key cannot be replayed for a different request."""
+        await store.begin("k", "fp")
+        await store.complete("k", response())
+
+        with pytest.raises(KeyReused):
+            await store.begin("k", "other")
+
+    async def test_concurrent_duplicate_waits_for_owner(self, store):
+        """Test a duplicate in the same process waits and gets the owner's response."""
+        await store.begin("k", "fp")
+        duplicate = asyncio.ensure_future(store.begin("k", "fp"))
+        await asyncio.sleep(0)
+
+        assert not duplicate.done()
+        await store.complete("k", response())
+        stored = await duplicate
+
+        assert stored.status == 201
+        assert store.waits == 1
+
+    async def test_abandoned_key_passes_to_duplicate(self, store, collection):
+        """Test a duplicate takes over when the owner gives up."""
+        await store.begin("k", "fp")
+        duplicate = asyncio.ensure_future(store.begin("k", "fp"))
+        await asyncio.sleep(0)
+
+        await store.abandon("k")
+
+        assert await duplicate is None
+        assert (await collection.find_one({"_id": "k"}))["state"] == "pending"
+
+    async def test_pending_in_other_process_times_out(self, store, collection):
+        """Test a duplicate in another process gives up after the lock timeout."""
+        await store.begin("k", "fp")
+        other = IdempotencyStore(lambda: collection, lock_timeout=0.05, poll_interval=0.01)
+
+        with pytest.raises(KeyInProgress):
+            await other.begin("k", "fp")
+
+    async def test_expired_lock_taken_over(self, store, collection):
+        """Test a pending key whose owner died is taken over."""
+        await store.begin("k", "fp")
+        await collection.update_one({"_id": "k"}, {"$set": {"lock_expires": 0}})
+        other = IdempotencyStore(lambda: collection)
+
+        assert await other.begin("k", "fp") is None
+
+    @pytest.fixture
+    def conflicting_collection(self, mocker):
+        """Collection whose TTL index already exists with another expiry."""
+        collection = mocker.Mock()
+        collection.name = "idempotency_keys"
+        collection.create_index = mocker.AsyncMock(side_effect=OperationFailure("IndexOptionsConflict", code=85))
+        collection.database.command = mocker.AsyncMock(return_value={"ok": 1})
+        collection.insert_one = mocker.AsyncMock()
+        return collection
+
+    async def test_ttl_index_with_other_expiry_is_changed(self, conflicting_collection):
+        """Test an existing TTL index built with another TTL is modified rather than disabling the store."""
+        store = IdempotencyStore(lambda: conflicting_collection, ttl=3600)
+
+        assert await store.begin("k", "fp") is None
+        await store.begin("other", "fp")
+
+        conflicting_collection.database.command.assert_awaited_once_with({
+            "collMod": "idempotency_keys",
+            "index": {"keyPattern": {"created_at": 1}, "expireAfterSeconds": 3600},
+        })
+        assert conflicting_collection.insert_one.await_count == 2
+        assert store.stats()["errors"] == 0
+
+    async def test_ttl_change_refused_keeps_storing(self, conflicting_collection):
+        """Test keys are still stored when the TTL index cannot be changed."""
+        conflicting_collection.database.command.side_effect = OperationFailure("unauthorized", code=13)
+        store = IdempotencyStore(lambda: conflicting_collection, ttl=3600)
+
+        await store.begin("k", "fp")
+        await store.begin("other", "fp")
+
+        assert conflicting_collection.database.command.await_count == 1
+        assert conflicting_collection.insert_one.await_count == 2
+        assert store.stats()["errors"] == 1
+
+    async def test_in_process_only_without_collection(self):
+        """Test the store works without MongoDB."""
+        store = IdempotencyStore(lambda: None)
+
+        assert await store.begin("k", "fp") is None
+        await store.complete("k", response())
+
+        assert (await store.begin("k", "fp")).status == 201
+
+    async def test_lru_evicts_oldest(self):
+        """Test the in-process cache is bounded."""
+        store = IdempotencyStore(lambda: None, cache_size=2)
+        for key in ("a", "b", "c"):
+            await store.begin(key, "fp")
+            await store.complete(key, response())
+
+        assert store.stats()["cached"] == 2
+        assert await store.begin("a", "fp") is None
+
+    async def test_cache_bounded_by_bytes(self):
+        """Test responses are evicted to stay under cache_bytes, and larger ones are not kept in memory."""
+        store = IdempotencyStore(lambda: None, cache_bytes=300)
+        for key in ("a", "b"):
+            await store.begin(key, "fp")
+            await store.complete(key, response(body=b"x" * 100))
+        await store.begin("big", "fp")
+        await store.complete("big", response(body=b"x" * 400))
+
+        assert store.stats()["cached"] == 2
+        await store.begin("c", "fp")
+        await store.complete("c", response(body=b"x" * 100))
+
+        stats = store.stats()
+        assert stats["cached"] == 2
+        assert stats["cached_bytes"] <= 300
+        assert await store.begin("a", "fp") is None
+
+    async def test_cached_response_expires(self, monkeypatch):
+        """Test a key is not replayed from memory after the TTL, as MongoDB would have dropped it."""
+        store = IdempotencyStore(lambda: None, ttl=60)
+        await store.begin("k", "fp")
+        await store.complete("k", response())
+        now = time.monotonic()
+        monkeypatch.setattr(idempotency.time, "monotonic", lambda: now + 61)
+
+        assert await store.begin("k", "fp") is None
+        assert store.stats()["cached_bytes"] == 0
+
+    async def test_mongo_replay_keeps_remaining_ttl(self, store, collection):
+        """Test a response loaded from MongoDB is cached only for what is left of its TTL."""
+        await store.begin("k", "fp")
+        await store.complete("k", response())
+        await collection.update_one({"_id": "k"}, {"$set": {"created_at": datetime.now(timezone.utc) - timedelta(hours=23)}})
+        other = IdempotencyStore(lambda: collection)
+        await other.begin("k", "fp")
+
+        first_used, _ = other._cache["k"]
+        assert time.monotonic() - first_used == pytest.approx(23 * 3600, abs=5)
+
+
+class TestIdempotencyMiddleware:
+    """Test cases for Idempotency-Key handling on the users API."""
+
+    @pytest.fixture(autouse=True)
+    def clear_store(self):
+        """Start each test with an empty in-process store."""
+        idempotency_store._cache.clear()
+        yield
+        idempotency_store._cache.clear()
+
+    @pytest.fixture
+    def api_url(self):
+        """Base URL for users API."""
+        return f"{settings.api_v1_str}/users"
+
+    async def test_retry_replays_create(self, test_client: AsyncClient, api_url, sample_user_data, mock_database):
+        """Test a retried create returns the first response without creating again."""
+        headers = {"Idempotency-Key": "create-1"}
+
+        first = await test_client.post(api_url + "/", json=sample_user_data, headers=headers)
+        retry = await test_client.post(api_url + "/", json=sample_user_data, headers=headers)
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.json() == first.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        assert await mock_database.users.count_documents({}) == 1
+
+    async def test_concurrent_duplicates_run_once(self, test_client: AsyncClient, api_url, sample_user_data, mock_database):
+        """Test simultaneous duplicates share one execution."""
+        headers = {"Idempotency-Key": "create-2"}
+
+        responses = await asyncio.gather(*(
+            test_client.post(api_url + "/", json=sample_user_data, headers=headers) for _ in range(3)
+        ))
+
+        assert {response.status_code for response in responses} == {201}
+        assert len({response.json()["id"] for response in responses}) == 1
+        assert await mock_database.users.count_documents({}) == 1
+
+    async def test_key_reused_for_different_body(self, test_client: AsyncClient, api_url, sample_user_data):
+        """Test reusing a key with a different request is rejected."""
+        headers = {"Idempotency-Key": "create-3"}
+        await test_client.post(api_url + "/", json=sample_user_data, headers=headers)
+
+        response = await test_client.post(
+            api_url + "/", json={"name": "Other", "email": "other@example.com"}, headers=headers
+        )
+
+        assert response.status_code == 422
+
+    async def test_without_key_not_stored(self, test_client: AsyncClient, api_url, sample_user_data):
+        """Test requests without a key run normally."""
+        first = await test_client.post(api_url + "/", json=sample_user_data)
+        second = await test_client.post(api_url + "/", json=sample_user_data)
+
+        assert first.status_code == 201
+        assert second.status_code == 400
+        assert idempotency_store.stats()["cached"] == 0
+
+    async def test_invalid_key(self, test_client: AsyncClient, api_url, sample_user_data):
+        """Test an over-long key is rejected."""
+        response = await test_client.post(
+            api_url + "/", json=sample_user_data, headers={"Idempotency-Key": "x" * 256}
+        )
+
+        assert response.status_code == 400
+
+    async def test_rejection_carries_cors_headers(self, test_client: AsyncClient, api_url, sample_user_data):
+        """Test browsers can read idempotency rejections from an allowed origin."""
+        origin = settings.cors_origins[0]
+
+        response = await test_client.post(
+            api_url + "/", json=sample_user_data, headers={"Idempotency-Key": "x" * 256, "Origin": origin}
+        )
+
+        assert response.status_code == 400
+        assert response.headers["access-control-allow-origin"] == origin
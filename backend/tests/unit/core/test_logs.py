@@ -0,0 +1,128 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+from httpx import AsyncClient
+
+from app.core import logs as logs_module
+from app.core.logs import (
+    AccessLogPolicy, JsonFormatter, NonBlockingQueueHandler, RequestContext, db_timer
+)
+
+
+def make_record(msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+@pytest.fixture
+def request_context():
+    """Make a request context current for the test."""
+    context = RequestContext("req-1", "GET", "/api/v1/users/")
+    token = logs_module._context.set(context)
+    yield context
+    logs_module._context.reset(token)
+
+
+class TestLogRecords:
+    """Test cases for queueing and formatting log records."""
+
+    def test_json_formatter_fields(self):
+        """Test records become one JSON object with context and extra fields."""
+        record = make_record(context={"request_id": "req-1"}, status=200)
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert entry["msg"] == "hello world"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "app.test"
+        assert entry["request_id"] == "req-1"
+        assert entry["status"] == 200
+
+    def test_json_formatter_exception(self):
+        """Test tracebacks are included."""
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            record = logging.LogRecord("app.test", logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert "RuntimeError: boom" in entry["exc"]
+
+    def test_queue_handler_does_not_format(self, request_context):
+        """Test the caller only enqueues; message formatting is left to the listener."""
+        handler = NonBlockingQueueHandler(queue.Queue())
+
+        handler.handle(make_record())
+        queued = handler.queue.get_nowait()
+
+        assert queued.msg == "hello %s"
+        assert queued.args == ("world",)
+        assert queued.context["request_id"] == "req-1"
+
+    def test_queue_handler_drops_when_full(self):
+        """Test a full queue drops records instead of blocking."""
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+
+        handler.handle(make_record())
+        handler.handle(make_record())
+
+        assert handler.dropped == 1
+
+    def test_db_time_recorded_in_context(self, request_context, mocker):
+        """Test MongoDB command durations accumulate on the request context."""
+        db_timer.succeeded(mocker.Mock(duration_micros=1500))
+        db_timer.failed(mocker.Mock(duration_micros=500))
+
+        assert request_context.fields()["db_time_ms"] == 2.0
+        assert request_context.fields()["db_calls"] == 2
+
+
+class TestAccessLogPolicy:
+    """Test cases for access log sampling and rate limiting."""
+
+    def test_sampling_keeps_errors(self, request_context, mocker):
+        """Test sampled-out successes are skipped but 5xx are always logged."""
+        info = mocker.patch.object(logs_module.access_logger, "info")
+        policy = AccessLogPolicy(sample_rate=0.0)
+
+        policy.log(request_context, 200, 0.01)
+        policy.log(request_context, 503, 0.01)
+
+        assert policy.stats() == {"logged": 1, "sampled_out": 1, "rate_limited": 0}
+        assert info.call_args.kwargs["extra"]["status"] == 503
+
+    def test_rate_limit_reports_suppressed(self, request_context, mocker):
+        """Test lines over the rate limit are counted and reported on the next line."""
+        info = mocker.patch.object(logs_module.access_logger, "info")
+        policy = AccessLogPolicy(rate_limit=1.0)
+
+        policy.log(request_context, 200, 0.01)
+        policy.log(request_context, 200, 0.01)
+        policy._tokens = 1.0
+        policy.log(request_context, 200, 0.01)
+
+        assert policy.rate_limited == 1
+        assert info.call_count == 2
+        assert info.call_args.kwargs["extra"]["suppressed"] == 1
+
+
+class TestAccessLogMiddleware:
+    """Test cases for request ids on API responses."""
+
+    async def test_request_id_echoed(self, test_client: AsyncClient):
+        """Test a client-supplied request id comes back on the response."""
+        response = await test_client.get("/health", headers={"X-Request-ID": "abc123"})
+
+        assert response.headers["x-request-id"] == "abc123"
+
+    async def test_request_id_generated(self, test_client: AsyncClient):
+        """Test a request id is generated when the client sends none."""
+        response = await test_client.get("/health")
+
+        assert len(response.headers["x-request-id"]) == 32
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.core.logs import AccessLogMiddleware, AccessLogPolicy
+from app.core.loop_watchdog import LagHistogram, LoopWatchdog
+
+
+def block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def blocking_app(scope, receive, send):
+    block_the_loop(0.15)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class TestLagHistogram:
+    """Test cases for the loop lag histogram."""
+
+    def test_samples_fall_into_buckets(self):
+        """Test each sample is counted in the first bucket that holds it."""
+        histogram = LagHistogram(buckets_ms=(1, 10, float("inf")))
+
+        for lag in (0.5, 0.9, 5.0, 250.0):
+            histogram.observe(lag)
+
+        data = histogram.to_dict()
+        assert [bucket["count"] for bucket in data["buckets"]] == [2, 1, 1]
+        assert data["buckets"][-1]["le_ms"] == "inf"
+        assert data["max_ms"] == 250.0
+
+    def test_quantiles(self):
+        """Test quantiles report the bucket bound, capped at the maximum seen."""
+        histogram = LagHistogram(buckets_ms=(1, 10, float("inf")))
+        for _ in range(98):
+            histogram.observe(0.2)
+        histogram.observe(7.0)
+        histogram.observe(40.0)
+
+        assert histogram.quantile(0.5) == 1
+        assert histogram.quantile(0.99) == 10
+        assert histogram.quantile(1.0) == 40.0
+        assert LagHistogram().quantile(0.99) == 0.0
+
+
+class TestLoopWatchdog:
+    """Test cases for detecting and locating event-loop stalls."""
+
+    @pytest.fixture
+    async def watchdog(self):
+        """Watchdog sampling fast on the test's loop."""
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+        watchdog.start()
+        await asyncio.sleep(0.03)
+        yield watchdog
+        await watchdog.stop()
+
+    async def test_lag_is_sampled(self, watchdog):
+        """Test wake-ups are recorded in the histogram without stalls."""
+        await asyncio.sleep(0.05)
+
+        stats = watchdog.stats()
+        assert stats["lag"]["count"] >= 2
+        assert stats["stalls"] == 0
+
+    async def test_blocking_code_is_captured(self, watchdog):
+        """Test the stack of code blocking the loop is captured once, with the full duration."""
+        block_the_loop(0.2)
+        await asyncio.sleep(0.03)
+
+        stalls = watchdog.recent(10)
+        assert len(stalls) == 1
+        assert stalls[0]["site"].endswith("in block_the_loop")
+        assert any("test_blocking_code_is_captured" in line for line in stalls[0]["stack"])
+        assert stalls[0]["blocked_ms"] >= 150
+        assert stalls[0]["route"] is None
+        assert watchdog.by_site(1) == [{"site": stalls[0]["site"], "stalls": 1}]
+        assert watchdog.stats()["lag"]["max_ms"] >= 150
+        assert watchdog.peak_lag() >= 0.15
+        assert watchdog.peak_lag() < 0.15
+
+    async def test_route_is_recorded(self, watchdog):
+        """Test a stall inside a request names its route and request id."""
+        app = AccessLogMiddleware(blocking_app, AccessLogPolicy(sample_rate=0.0))
+        scope = {
+            "type": "http", "method": "GET", "path": "/slow",
+            "headers": [(b"x-request-id", b"req-1")],
+        }
+
+        async def send(message):
+            pass
+
+        await app(scope, None, send)
+        await asyncio.sleep(0.03)
+
+        stall = watchdog.recent(1)[0]
+        assert stall["route"] == "GET /slow"
+        assert stall["request_id"] == "req-1"
+
+    async def test_disabled(self):
+        """Test a disabled watchdog starts nothing."""
+        watchdog = LoopWatchdog(enabled=False)
+
+        watchdog.start()
+
+        assert watchdog._task is None
+        await watchdog.stop()
+
+
+class TestLoopStallsEndpoint:
+    """Test cases for the loop stall debug endpoint."""
+
+    async def test_stalls_served(self, test_client: AsyncClient, monkeypatch):
+        """Test stalls and lag stats are served when DEBUG is set."""
+        monkeypatch.setattr(settings, "debug", True)
+
+        response = await test_client.get("/debug/loop-stalls")
+
+        data = response.json()
+        assert response.status_code == 200
+        assert set(data) == {"stalls", "sites", "stats"}
+        assert "lag" in data["stats"]
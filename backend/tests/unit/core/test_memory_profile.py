@@ -0,0 +1,153 @@
+import os
+import tracemalloc
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.core import memory_profile
+from app.core.memory_profile import MemoryProfiler, SnapshotNotFound, memory_profiler, rss_bytes
+from app.models.user import UserModel
+
+
+class TestMemoryProfiler:
+    """Test cases for tracemalloc snapshots, object counts and GC stats."""
+
+    @pytest.fixture
+    def profiler(self):
+        """Profiler that leaves tracemalloc off afterwards."""
+        profiler = MemoryProfiler(max_snapshots=2)
+        yield profiler
+        profiler.stop()
+
+    def test_snapshot_requires_tracing(self, profiler):
+        """Test snapshots are refused until tracemalloc is started."""
+        with pytest.raises(RuntimeError):
+            profiler.snapshot()
+
+    def test_start_and_stop(self, profiler):
+        """Test start turns tracing on and stop turns it off and drops snapshots."""
+        assert profiler.start(frames=3)["tracing"] is True
+        assert tracemalloc.get_traceback_limit() == 3
+        profiler.snapshot()
+
+        status = profiler.stop()
+
+        assert status["tracing"] is False
+        assert status["snapshots"] == []
+
+    def test_diff_finds_growth_by_line(self, profiler):
+        """Test a diff points at the line that allocated in between."""
+        profiler.start()
+        base = profiler.snapshot()["id"]
+        kept = [bytearray(1024) for _ in range(200)]  # noqa: F841
+
+        diff = profiler.diff(base, group_by="lineno")
+
+        assert diff["target"] == base + 1
+        top = diff["stats"][0]
+        assert top["file"] == __file__
+        assert top["size_diff_bytes"] >= 200 * 1024
+        assert top["count_diff"] >= 200
+
+    def test_diff_by_filename(self, profiler):
+        """Test a diff can be grouped by file."""
+        profiler.start()
+        base = profiler.snapshot()["id"]
+        kept = [bytearray(1024) for _ in range(50)]  # noqa: F841
+
+        diff = profiler.diff(base, group_by="filename")
+
+        assert any(stat["file"] == __file__ for stat in diff["stats"])
+
+    def test_oldest_snapshot_dropped(self, profiler):
+        """Test only max_snapshots snapshots are kept."""
+        profiler.start()
+        first = profiler.snapshot()["id"]
+        profiler.snapshot()
+        profiler.snapshot()
+
+        assert [snapshot["id"] for snapshot in profiler.status()["snapshots"]] == [first + 1, first + 2]
+        with pytest.raises(SnapshotNotFound):
+            profiler.diff(first)
+
+    def test_object_counts_watch_users(self):
+        """Test live UserModel instances are counted."""
+        before = MemoryProfiler.object_counts()["watched"]["app.models.user.UserModel"]
+        users = [UserModel(name=f"User {i}", email=f"user{i}@example.com") for i in range(5)]  # noqa: F841
+
+        counts = MemoryProfiler.object_counts()
+
+        assert counts["watched"]["app.models.user.UserModel"] == before + 5
+        assert counts["pid"] == os.getpid()
+
+    def test_gc_stats(self):
+        """Test GC stats cover every generation."""
+        stats = MemoryProfiler.gc_stats()
+
+        assert len(stats["generations"]) == 3
+        assert stats["rss_bytes"] > 0
+
+    @pytest.mark.parametrize("platform,expected", [("linux", 2048 * 1024), ("darwin", 2048)])
+    def test_rss_fallback_units(self, monkeypatch, platform, expected):
+        """Test peak RSS is converted from kilobytes except on macOS, where it is bytes."""
+        def no_proc(*args, **kwargs):
+            raise OSError
+
+        monkeypatch.setattr("builtins.open", no_proc)
+        monkeypatch.setattr(memory_profile.sys, "platform", platform)
+        monkeypatch.setattr(
+            memory_profile.resource, "getrusage", lambda who: type("Usage", (), {"ru_maxrss": 2048})()
+        )
+
+        assert rss_bytes() == expected
+
+
+class TestMemoryEndpoints:
+    """Test cases for the memory profiling debug endpoints."""
+
+    @pytest.fixture(autouse=True)
+    def debug(self, monkeypatch):
+        monkeypatch.setattr(settings, "debug", True)
+        yield
+        memory_profiler.stop()
+
+    async def test_snapshot_and_diff(self, test_client: AsyncClient):
+        """Test snapshots taken over HTTP can be diffed and downloaded."""
+        assert (await test_client.post("/debug/memory/snapshots")).status_code == 409
+
+        await test_client.post("/debug/memory/tracemalloc/start")
+        base = (await test_client.post("/debug/memory/snapshots")).json()["id"]
+        response = await test_client.get(
+            "/debug/memory/diff", params={"base": base, "group_by": "filename", "download": "true"}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["base"] == base
+        assert response.headers["content-disposition"].startswith('attachment; filename="memory-diff-')
+
+    async def test_unknown_snapshot(self, test_client: AsyncClient):
+        """Test a snapshot this worker does not have is 404 naming the worker."""
+        memory_profiler.start()
+
+        response = await test_client.get("/debug/memory/diff", params={"base": 999})
+
+        assert response.status_code == 404
+        assert str(os.getpid()) in response.json()["detail"]
+
+    async def test_report(self, test_client: AsyncClient):
+        """Test the combined report includes objects and GC stats."""
+        response = await test_client.get("/debug/memory")
+
+        data = response.json()
+        assert response.status_code == 200
+        assert "app.schemas.user.UserResponse" in data["objects"]["watched"]
+        assert data["gc"]["pid"] == os.getpid()
+
+    async def test_hidden_without_debug(self, test_client: AsyncClient, monkeypatch):
+        """Test the endpoints are not served when DEBUG is off."""
+        monkeypatch.setattr(settings, "debug", False)
+
+        response = await test_client.get("/debug/memory/gc")
+
+        assert response.status_code == 404
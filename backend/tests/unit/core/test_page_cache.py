@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.page_cache import CachedPage, PageCache, user_pages
+
+
+def rendered(cache: PageCache, body: bytes = b"{}", total: int = 10) -> CachedPage:
+    return CachedPage(cache.generation, body, '"etag"', total)
+
+
+class TestPageCache:
+    """Test cases for the generation-invalidated page cache."""
+
+    def test_hit_after_put(self):
+        """Test a stored page is served until something changes."""
+        cache = PageCache()
+        assert cache.get((1, 10)) is None
+
+        page = rendered(cache)
+        cache.put((1, 10), page)
+
+        assert cache.get((1, 10)) is page
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_invalidate_drops_every_page(self):
+        """Test one generation bump hides all cached pages."""
+        cache = PageCache()
+        cache.put((1, 10), rendered(cache))
+        cache.put((2, 10), rendered(cache))
+
+        cache.invalidate()
+
+        assert cache.get((1, 10)) is None
+        assert cache.get((2, 10)) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_page_rendered_across_a_write_is_not_stored(self):
+        """Test a page read before a write cannot be cached after it."""
+        cache = PageCache()
+        page = rendered(cache)
+
+        cache.invalidate()
+        cache.put((1, 10), page)
+
+        assert cache.get((1, 10)) is None
+
+    def test_expired_page_is_a_miss(self):
+        """Test pages older than the TTL are not served."""
+        cache = PageCache(ttl=0.0)
+        cache.put((1, 10), rendered(cache))
+
+        assert cache.get((1, 10)) is None
+
+    def test_least_recently_used_page_is_evicted(self):
+        """Test the cache keeps at most max_entries pages."""
+        cache = PageCache(max_entries=2)
+        cache.put((1, 10), rendered(cache))
+        cache.put((2, 10), rendered(cache))
+        cache.get((1, 10))
+        cache.put((3, 10), rendered(cache))
+
+        assert cache.get((2, 10)) is None
+        assert cache.get((1, 10)) is not None
+        assert cache.get((3, 10)) is not None
+
+    def test_disabled_cache_stores_nothing(self):
+        """Test a size of 0 turns the cache off."""
+        cache = PageCache(max_entries=0)
+        cache.put((1, 10), rendered(cache))
+
+        assert not cache.enabled
+        assert cache.get((1, 10)) is None
+
+    async def test_prefetch_stores_page(self):
+        """Test a prefetched page is cached and its first hit is counted."""
+        cache = PageCache()
+        renders = 0
+
+        async def render(generation):
+            nonlocal renders
+            renders += 1
+            return CachedPage(generation, b"page 2", '"etag"', 20)
+
+        cache.prefetch((2, 10), render)
+        cache.prefetch((2, 10), render)
+        await asyncio.sleep(0.01)
+
+        assert renders == 1
+        assert cache.get((2, 10)).body == b"page 2"
+        assert cache.stats()["prefetches"] == 1
+        assert cache.stats()["prefetch_hits"] == 1
+
+        cache.prefetch((2, 10), render)
+        await asyncio.sleep(0.01)
+        assert renders == 1
+
+    async def test_prefetch_errors_are_counted(self):
+        """Test a failed prefetch is swallowed and counted."""
+        cache = PageCache()
+
+        async def render(generation):
+            raise RuntimeError("boom")
+
+        cache.prefetch((2, 10), render)
+        await asyncio.sleep(0.01)
+
+        assert cache.get((2, 10)) is None
+        assert cache.stats()["prefetch_errors"] == 1
+        assert cache.stats()["prefetching"] == 0
+
+    async def test_stop_cancels_prefetches(self):
+        """Test stop() cancels prefetches still running."""
+        cache = PageCache()
+
+        async def render(generation):
+            await asyncio.sleep(10)
+
+        cache.prefetch((2, 10), render)
+        await cache.stop()
+
+        assert cache.stats()["prefetching"] == 0
+
+
+class TestUsersPageCache:
+    """Test cases for GET /users served through the page cache."""
+
+    @pytest.fixture
+    def api_url(self):
+        return f"{settings.api_v1_str}/users"
+
+    async def test_list_reflects_writes(self, memory_test_client, api_url):
+        """Test a write through the API invalidates the cached page."""
+        first = await memory_test_client.get(api_url + "/")
+        assert first.json()["total"] == 0
+
+        await memory_test_client.post(api_url + "/", json={"name": "Ada", "email": "ada@example.com"})
+        second = await memory_test_client.get(api_url + "/")
+
+        assert second.json()["total"] == 1
+        assert second.headers["etag"] != first.headers["etag"]
+
+    async def test_cached_page_revalidates(self, memory_test_client, api_url):
+        """Test If-None-Match against a cached page returns 304."""
+        await memory_test_client.post(api_url + "/", json={"name": "Ada", "email": "ada@example.com"})
+        first = await memory_test_client.get(api_url + "/")
+        hits = user_pages.hits
+
+        second = await memory_test_client.get(api_url + "/", headers={"If-None-Match": first.headers["etag"]})
+
+        assert second.status_code == 304
+        assert user_pages.hits == hits + 1
+
+    async def test_next_page_is_prefetched(self, memory_test_client, api_url):
+        """Test serving page 1 renders page 2 in the background."""
+        for i in range(3):
+            await memory_test_client.post(api_url + "/", json={"name": f"User {i}", "email": f"u{i}@example.com"})
+
+        await memory_test_client.get(api_url + "/", params={"page": 1, "size": 2})
+        await asyncio.sleep(0.01)
+        prefetch_hits = user_pages.prefetch_hits
+        response = await memory_test_client.get(api_url + "/", params={"page": 2, "size": 2})
+
+        assert [user["name"] for user in response.json()["users"]] == ["User 2"]
+        assert user_pages.prefetch_hits == prefetch_hits + 1
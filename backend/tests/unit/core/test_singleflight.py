@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from app.core import deadline as deadline_module
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Test cases for single-flight call coalescing."""
+
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test concurrent callers with the same key run the call once."""
+        group = SingleFlight()
+        executions = 0
+
+        async def fetch():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(group.do("key", fetch) for _ in range(10)))
+
+        assert results == ["value"] * 10
+        assert executions == 1
+        assert group.stats() == {"calls": 10, "executions": 1, "coalesced": 9, "in_flight": 0}
+
+    async def test_different_keys_run_separately(self):
+        """Test different keys are not coalesced."""
+        group = SingleFlight()
+
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(group.do("a", lambda: fetch(1)), group.do("b", lambda: fetch(2)))
+
+        assert results == [1, 2]
+        assert group.coalesced == 0
+
+    async def test_sequential_calls_are_not_cached(self):
+        """Test a finished call is not reused by later callers."""
+        group = SingleFlight()
+
+        async def fetch():
+            return object()
+
+        first = await group.do("key", fetch)
+        second = await group.do("key", fetch)
+
+        assert first is not second
+
+    async def test_errors_propagate_to_all_callers(self):
+        """Test every waiter sees the shared exception."""
+        group = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(*(group.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        """Test cancelling the first caller leaves the shared call running."""
+        group = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "value"
+
+        first = asyncio.ensure_future(group.do("key", fetch))
+        second = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "value"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    async def test_forget_starts_fresh_call(self):
+        """Test callers after forget() don't join the stale in-flight call."""
+        group = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return object()
+
+        first = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        group.forget()
+        second = await group.do("key", fetch)
+
+        assert await first is not second
+
+    async def test_joiner_waits_within_its_own_deadline(self):
+        """Test a caller with a shorter budget gets DeadlineExceeded without cancelling the shared call."""
+        group = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "value"
+
+        async def joiner():
+            deadline_module._current.set(Deadline(0.02))
+            return await group.do("key", fetch)
+
+        first = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.wait_for(joiner(), 1.0)
+
+        release.set()
+        assert await first == "value"
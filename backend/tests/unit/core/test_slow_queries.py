@@ -0,0 +1,194 @@
+import time
+
+import pytest
+from bson import ObjectId
+from httpx import AsyncClient
+
+from app.core import logs as logs_module
+from app.core.config import settings
+from app.core.logs import RequestContext
+from app.core.slow_queries import (
+    SlowQueryLog, command_shape, explain_summary, normalize, plan_stages, slow_query_log
+)
+
+EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "email_1"}}
+    },
+    "executionStats": {
+        "nReturned": 1, "totalKeysExamined": 1, "totalDocsExamined": 1, "executionTimeMillis": 0
+    },
+}
+
+
+def command_events(mocker, command, duration_micros, request_id=1):
+    name = next(iter(command))
+    started = mocker.Mock(
+        command_name=name, command=command, database_name="db",
+        connection_id=("localhost", 27017), request_id=request_id
+    )
+    succeeded = mocker.Mock(
+        command_name=name, database_name="db", duration_micros=duration_micros,
+        connection_id=("localhost", 27017), request_id=request_id
+    )
+    return started, succeeded
+
+
+def wait_for(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestQueryShapes:
+    """Test cases for query normalization and explain parsing."""
+
+    def test_normalize_replaces_values(self):
+        """Test literal values are hidden but operators and structure kept."""
+        query = {"email": "a@example.com", "_id": {"$in": [ObjectId(), ObjectId()]}, "$or": [{"a": 1}, {"b": 2}]}
+
+        assert normalize(query) == {"email": "?", "_id": {"$in": ["?"]}, "$or": [{"a": "?"}, {"b": "?"}]}
+
+    def test_find_shape(self):
+        """Test find shapes carry the filter and sort."""
+        command = {"find": "users", "filter": {"email": "x"}, "sort": {"_id": 1}, "limit": 10, "$db": "db"}
+
+        assert command_shape("find", command) == {"filter": {"email": "?"}, "sort": {"_id": 1}}
+
+    def test_write_shapes(self):
+        """Test update and delete shapes come from the first statement's filter."""
+        update = {"update": "users", "updates": [{"q": {"_id": ObjectId()}, "u": {"$set": {"name": "x"}}}]}
+        delete = {"delete": "users", "deletes": [{"q": {"email": "x"}, "limit": 1}]}
+
+        assert command_shape("update", update) == {"filter": {"_id": "?"}}
+        assert command_shape("delete", delete) == {"filter": {"email": "?"}}
+
+    def test_aggregate_shape(self):
+        """Test aggregate shapes normalize each stage."""
+        command = {"aggregate": "users", "pipeline": [{"$match": {"version": {"$gt": 3}}}, {"$limit": 5}]}
+
+        assert command_shape("aggregate", command) == {
+            "pipeline": [{"$match": {"version": {"$gt": "?"}}}, {"$limit": "?"}]
+        }
+
+    def test_explain_summary(self):
+        """Test the winning plan stages and work counters are extracted."""
+        summary = explain_summary(EXPLAIN)
+
+        assert summary["stages"] == ["FETCH", "IXSCAN"]
+        assert summary["keys_examined"] == 1
+        assert summary["docs_examined"] == 1
+
+    def test_plan_stages_query_plan(self):
+        """Test plans nested under queryPlan (slot-based engine) are followed."""
+        plan = {"queryPlan": {"stage": "COLLSCAN"}, "slotBasedPlan": {}}
+
+        assert plan_stages(plan) == ["COLLSCAN"]
+
+    def test_plan_stages_every_input(self):
+        """Test every branch of a multi-input stage is included, in order."""
+        plan = {"stage": "OR", "inputStages": [
+            {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+            {"stage": "COLLSCAN"},
+        ]}
+
+        assert plan_stages(plan) == ["OR", "FETCH", "IXSCAN", "COLLSCAN"]
+
+
+class TestSlowQueryLog:
+    """Test cases for recording slow MongoDB commands."""
+
+    @pytest.fixture
+    def request_context(self):
+        """Make a request context current for the test."""
+        context = RequestContext("req-1", "GET", "/api/v1/users/abc")
+        token = logs_module._context.set(context)
+        yield context
+        logs_module._context.reset(token)
+
+    def test_fast_commands_ignored(self, mocker):
+        """Test commands under the threshold are not recorded."""
+        log = SlowQueryLog(threshold=0.1, explain_sample_rate=0.0)
+        started, succeeded = command_events(mocker, {"find": "users", "filter": {}}, 50_000)
+
+        log.started(started)
+        log.succeeded(succeeded)
+
+        assert log.recent(10) == []
+
+    def test_slow_commands_recorded_by_shape(self, mocker, request_context):
+        """Test slow commands are kept with their route and aggregated by shape."""
+        log = SlowQueryLog(threshold=0.1, explain_sample_rate=0.0)
+        for request_id, email in enumerate(["a@example.com", "b@example.com"]):
+            started, succeeded = command_events(
+                mocker, {"find": "users", "filter": {"email": email}}, 150_000 + request_id * 100_000, request_id
+            )
+            log.started(started)
+            log.succeeded(succeeded)
+
+        recent = log.recent(10)
+        shapes = log.by_shape(10)
+
+        assert [entry["duration_ms"] for entry in recent] == [250.0, 150.0]
+        assert recent[0]["route"] == "GET /api/v1/users/abc"
+        assert recent[0]["request_id"] == "req-1"
+        assert len(shapes) == 1
+        assert shapes[0]["count"] == 2
+        assert shapes[0]["max_ms"] == 250.0
+        assert shapes[0]["shape"] == {"filter": {"email": "?"}}
+        assert shapes[0]["routes"] == {"GET /api/v1/users/abc": 2}
+
+    def test_inserts_ignored(self, mocker):
+        """Test commands that cannot be explained are not tracked."""
+        log = SlowQueryLog(threshold=0.0)
+        started, succeeded = command_events(mocker, {"insert": "users", "documents": [{}]}, 500_000)
+
+        log.started(started)
+        log.succeeded(succeeded)
+
+        assert log.stats()["recorded"] == 0
+
+    def test_sampled_explain_off_thread(self, mocker):
+        """Test sampled slow commands are explained in the background, once per interval."""
+        client = mocker.MagicMock()
+        client.__getitem__.return_value.command.return_value = EXPLAIN
+        log = SlowQueryLog(threshold=0.0, explain_sample_rate=1.0, explain_interval=60, get_client=lambda: client)
+        command = {"find": "users", "filter": {"email": "x"}, "lsid": {"id": 1}, "$db": "db"}
+
+        entry = log.record("find", "db", command, 5.0)
+        log.record("find", "db", command, 5.0)
+        wait_for(lambda: log.explained == 1)
+
+        assert entry["explain"]["stages"] == ["FETCH", "IXSCAN"]
+        assert log.by_shape(1)[0]["explain"]["keys_examined"] == 1
+        client.__getitem__.return_value.command.assert_called_once_with(
+            {"explain": {"find": "users", "filter": {"email": "x"}}, "verbosity": "executionStats"}
+        )
+
+    def test_shapes_bounded(self, monkeypatch):
+        """Test the per-shape table evicts the cheapest shape when full."""
+        monkeypatch.setattr(SlowQueryLog, "MAX_SHAPES", 2)
+        log = SlowQueryLog(threshold=0.0, explain_sample_rate=0.0)
+
+        log.record("find", "db", {"find": "users", "filter": {"a": 1}}, 10.0)
+        log.record("find", "db", {"find": "users", "filter": {"b": 1}}, 1.0)
+        log.record("find", "db", {"find": "users", "filter": {"c": 1}}, 5.0)
+
+        assert [shape["shape"]["filter"] for shape in log.by_shape(10)] == [{"a": "?"}, {"c": "?"}]
+
+
+class TestSlowQueryEndpoint:
+    """Test cases for the slow-query debug endpoint."""
+
+    async def test_slow_queries_served(self, test_client: AsyncClient, monkeypatch):
+        """Test recent slow queries and shapes are served when DEBUG is set."""
+        monkeypatch.setattr(settings, "debug", True)
+        monkeypatch.setattr(slow_query_log, "explain_sample_rate", 0.0)
+        slow_query_log.record("find", "db", {"find": "users", "filter": {"name": "x"}}, 321.0)
+
+        response = await test_client.get("/debug/slow-queries")
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["queries"][0]["duration_ms"] == 321.0
+        assert any(shape["shape"] == {"filter": {"name": "?"}} for shape in data["shapes"])
@@ -0,0 +1,40 @@
+from app.core.throttle import AdaptiveThrottle
+
+
+class TestAdaptiveThrottle:
+    """Test cases for latency-steered batch sizing."""
+
+    def test_slow_batches_halve_the_size(self):
+        """Test a batch over the target latency halves the next one, down to the minimum."""
+        throttle = AdaptiveThrottle(target_latency=0.1, min_batch=10, max_batch=1000, initial_batch=100)
+
+        throttle.record(0.5)
+        assert throttle.batch_size == 50
+
+        for _ in range(10):
+            throttle.record(0.5)
+        assert throttle.batch_size == 10
+        assert throttle.stats()["slow_batches"] == 11
+
+    def test_fast_batches_grow_additively(self):
+        """Test a batch under the target grows the next by min_batch, up to the maximum."""
+        throttle = AdaptiveThrottle(target_latency=0.1, min_batch=10, max_batch=120, initial_batch=100)
+
+        throttle.record(0.01)
+        assert throttle.batch_size == 110
+
+        throttle.record(0.01)
+        throttle.record(0.01)
+        assert throttle.batch_size == 120
+
+    def test_pause_keeps_the_duty_cycle(self):
+        """Test the pause after a batch scales with its latency and is capped."""
+        throttle = AdaptiveThrottle(duty_cycle=0.25, max_pause=1.0)
+
+        assert throttle.record(0.1) == 0.1 * 3
+        assert throttle.record(2.0) == 1.0
+
+    def test_initial_batch_is_clamped(self):
+        """Test a resumed batch size outside the bounds is brought within them."""
+        assert AdaptiveThrottle(min_batch=10, max_batch=100, initial_batch=5000).batch_size == 100
+        assert AdaptiveThrottle(min_batch=10, max_batch=100, initial_batch=1).batch_size == 10
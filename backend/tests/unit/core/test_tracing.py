@@ -0,0 +1,189 @@
+import json
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.core.tracing import (
+    FileExporter, MongoCommandTracer, RingBufferExporter, Tracer, KIND_CLIENT, STATUS_ERROR
+)
+from app.core import tracing as tracing_module
+
+
+def spans_of(otlp):
+    return otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+class TestTracer:
+    """Test cases for span recording and sampling."""
+
+    @pytest.fixture
+    def buffer(self):
+        """In-memory exporter."""
+        return RingBufferExporter(capacity=10)
+
+    def make_tracer(self, buffer, **kwargs):
+        return Tracer(exporters=[buffer], **{"sample_rate": 1.0, **kwargs})
+
+    def test_span_outside_trace_is_noop(self, buffer):
+        """Test spans outside a trace record nothing."""
+        tracer = self.make_tracer(buffer)
+
+        with tracer.span("orphan") as span:
+            assert span is None
+
+        assert len(buffer.traces) == 0
+
+    def test_nested_spans(self, buffer):
+        """Test child spans point at their parents."""
+        tracer = self.make_tracer(buffer)
+
+        with tracer.trace("GET /users") as root:
+            with tracer.span("outer") as outer:
+                with tracer.span("inner", key="value"):
+                    pass
+
+        spans = {span["name"]: span for span in spans_of(buffer.recent(1)[0])}
+        assert spans["outer"]["parentSpanId"] == root.span_id
+        assert spans["inner"]["parentSpanId"] == outer.span_id
+        assert spans["inner"]["attributes"] == [{"key": "key", "value": {"stringValue": "value"}}]
+        assert "parentSpanId" not in spans["GET /users"]
+
+    def test_unsampled_fast_trace_dropped(self, buffer):
+        """Test traces that are not head-sampled, slow or failed are not exported."""
+        tracer = self.make_tracer(buffer, sample_rate=0.0)
+
+        with tracer.trace("GET /users"):
+            pass
+
+        assert len(buffer.traces) == 0
+        assert tracer.stats()["started"] == 1
+
+    def test_error_trace_kept(self, buffer):
+        """Test tail sampling keeps traces with errors."""
+        tracer = self.make_tracer(buffer, sample_rate=0.0)
+
+        with pytest.raises(RuntimeError):
+            with tracer.trace("GET /users"):
+                with tracer.span("work"):
+                    raise RuntimeError("boom")
+
+        spans = spans_of(buffer.recent(1)[0])
+        assert spans[1]["status"] == {"code": STATUS_ERROR, "message": "RuntimeError: boom"}
+        assert tracer.exported["error"] == 1
+
+    def test_slow_trace_kept(self, buffer):
+        """Test tail sampling keeps traces over the slow threshold."""
+        tracer = self.make_tracer(buffer, sample_rate=0.0, slow_threshold=0.001)
+
+        with tracer.trace("GET /users"):
+            time.sleep(0.002)
+
+        assert tracer.exported["slow"] == 1
+        root = spans_of(buffer.recent(1)[0])[0]
+        assert {"key": "sampling.reason", "value": {"stringValue": "slow"}} in root["attributes"]
+
+    def test_traceparent_continues_trace(self, buffer):
+        """Test an incoming W3C traceparent sets the trace id, parent and sampling."""
+        tracer = self.make_tracer(buffer, sample_rate=0.0)
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+        with tracer.trace("GET /users", traceparent=f"00-{trace_id}-00f067aa0ba902b7-01"):
+            pass
+
+        root = spans_of(buffer.get(trace_id))[0]
+        assert root["traceId"] == trace_id
+        assert root["parentSpanId"] == "00f067aa0ba902b7"
+
+    def test_span_limit(self, buffer):
+        """Test spans beyond the per-trace limit are dropped and counted."""
+        tracer = self.make_tracer(buffer, max_spans=2)
+
+        with tracer.trace("GET /users"):
+            for _ in range(3):
+                with tracer.span("work"):
+                    pass
+
+        spans = spans_of(buffer.recent(1)[0])
+        assert len(spans) == 2
+        assert {"key": "spans.dropped", "value": {"intValue": "2"}} in spans[0]["attributes"]
+
+    async def test_traced_decorator(self, buffer):
+        """Test decorated coroutines run inside a span."""
+        tracer = self.make_tracer(buffer)
+
+        @tracer.traced("load")
+        async def load():
+            return 42
+
+        with tracer.trace("GET /users"):
+            assert await load() == 42
+
+        assert [span["name"] for span in spans_of(buffer.recent(1)[0])] == ["GET /users", "load"]
+
+    def test_mongo_commands_become_client_spans(self, buffer, mocker, monkeypatch):
+        """Test command monitoring events are recorded under the issuing span."""
+        tracer = self.make_tracer(buffer)
+        listener = MongoCommandTracer()
+        event = mocker.Mock(
+            command_name="find", database_name="db", command={"find": "users"},
+            connection_id=("localhost", 27017), request_id=1
+        )
+
+        with tracer.trace("GET /users") as root:
+            listener.started(event)
+            listener.succeeded(event)
+
+        span = spans_of(buffer.recent(1)[0])[1]
+        assert span["name"] == "mongodb.find"
+        assert span["kind"] == KIND_CLIENT
+        assert span["parentSpanId"] == root.span_id
+        assert {"key": "db.mongodb.collection", "value": {"stringValue": "users"}} in span["attributes"]
+
+    def test_file_exporter(self, tmp_path):
+        """Test traces are appended as JSON lines in the background."""
+        path = tmp_path / "traces.jsonl"
+        exporter = FileExporter(str(path))
+
+        exporter.export("abc", {"resourceSpans": []})
+        for _ in range(100):
+            if path.exists() and path.read_text():
+                break
+            time.sleep(0.01)
+
+        assert json.loads(path.read_text()) == {"resourceSpans": []}
+
+
+class TestTraceEndpoints:
+    """Test cases for the trace debug endpoints."""
+
+    async def test_hidden_without_debug(self, test_client: AsyncClient, monkeypatch):
+        """Test debug endpoints are not exposed unless DEBUG is set."""
+        monkeypatch.setattr(settings, "debug", False)
+
+        response = await test_client.get("/debug/traces")
+
+        assert response.status_code == 404
+
+    async def test_request_trace_served(self, test_client: AsyncClient, monkeypatch, created_user):
+        """Test a sampled request's span tree is served by route name."""
+        monkeypatch.setattr(settings, "debug", True)
+        monkeypatch.setattr(tracing_module.tracer, "sample_rate", 1.0)
+
+        await test_client.get(f"{settings.api_v1_str}/users/{created_user.id}")
+        response = await test_client.get("/debug/traces", params={"limit": 2})
+
+        user_trace = next(
+            trace for trace in response.json()["traces"]
+            if spans_of(trace)[0]["name"] == f"GET {settings.api_v1_str}/users/{{user_id}}"
+        )
+        names = [span["name"] for span in spans_of(user_trace)]
+        assert "route.get_user" in names
+        assert "deps.get_user_crud" in names
+        assert "UserCRUD.get_user" in names
+        assert "middleware.DeadlineMiddleware" in names
+
+        trace_id = spans_of(user_trace)[0]["traceId"]
+        single = await test_client.get(f"/debug/traces/{trace_id}")
+        assert single.json() == user_trace
@@ -0,0 +1,335 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from app.core.config import settings
+from app.core.page_cache import user_pages
+from app.crud.delete_jobs import (
+    CANCELLED, COMPLETED, FAILED, PENDING, RUNNING, DeleteJobCRUD, chunk_filter, user_filter
+)
+from app.crud.stats import UserStatsCRUD
+from app.crud.user import UserCRUD
+from app.schemas.user import UserCreate
+
+
+async def seed(database, domains):
+    """Create users through UserCRUD so the stats count them"""
+    crud = UserCRUD(database)
+    for i, domain in enumerate(domains):
+        await crud.create_user(UserCreate(name=f"User {i}", email=f"user{i}@{domain}"))
+
+
+class TestDeleteJobFilters:
+    """Test cases for building bulk delete filters."""
+
+    def test_email_domain_uses_field(self):
+        """Test the domain is matched on the indexed email_domain field."""
+        assert user_filter({"email_domain": "example.com"}) == {"email_domain": "example.com"}
+
+    def test_email_domain_regex_is_anchored_and_escaped(self):
+        """Test the fallback regex matches the end of the email only."""
+        query = user_filter({"email_domain": "example.com"}, domain_field=False)
+
+        assert query == {"email": {"$regex": r"@example\.com$", "$options": "i"}}
+
+    def test_chunk_filter_keeps_created_before(self):
+        """Test the resume point is combined with the creation bound on _id."""
+        before = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        last_id = ObjectId.from_datetime(datetime(2023, 1, 1, tzinfo=timezone.utc))
+
+        query = chunk_filter({"created_before": before}, last_id)
+
+        assert query == {"_id": {"$lt": ObjectId.from_datetime(before), "$gt": last_id}}
+
+
+class TestDeleteJobRunner:
+    """Test cases for running bulk delete jobs."""
+
+    async def test_deletes_matching_users_in_chunks(self, mock_database, delete_job_runner):
+        """Test a job removes only matching users, chunk by chunk, and keeps stats right."""
+        await seed(mock_database, ["gone.example.com"] * 5 + ["kept.example.com"] * 2)
+        jobs = DeleteJobCRUD(mock_database)
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None}, estimated_total=5)
+        generation = user_pages.generation
+
+        job_runner = delete_job_runner()
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert job["status"] == COMPLETED
+        assert job["deleted"] == 5
+        assert job["chunks"] == 2
+        assert job["owner"] is None
+        remaining = await mock_database.users.find().to_list(None)
+        assert {user["email"].split("@")[1] for user in remaining} == {"kept.example.com"}
+        stats = await UserCRUD(mock_database).get_stats()
+        assert stats["total"] == 2
+        assert stats["domains"] == {"kept.example.com": 2}
+        assert user_pages.generation > generation
+
+    async def test_domain_field_used_once_migrated(self, mock_database, delete_job_runner):
+        """Test users are matched by email regex until migration 3 completes, then by email_domain."""
+        legacy = {"name": "Legacy", "email": "legacy@gone.example.com"}
+        await seed(mock_database, ["gone.example.com"])
+        await mock_database.users.insert_one(dict(legacy))
+        jobs = DeleteJobCRUD(mock_database)
+        await mock_database.migrations.insert_one({"_id": 3, "status": COMPLETED})
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+
+        job_runner = delete_job_runner()
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert job["deleted"] == 1
+        assert await mock_database.users.find_one({"email": legacy["email"]}) is not None
+
+        await mock_database.migrations.delete_many({})
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert job["deleted"] == 1
+        assert await mock_database.users.count_documents({}) == 0
+
+    async def test_resumes_after_last_id(self, mock_database, delete_job_runner):
+        """Test a job claimed from a dead worker continues where it stopped."""
+        await seed(mock_database, ["gone.example.com"] * 3)
+        first = await mock_database.users.find_one(sort=[("_id", 1)])
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        stale = datetime.now(timezone.utc) - timedelta(minutes=5)
+        await jobs.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": RUNNING, "owner": "dead-worker", "heartbeat_at": stale, "last_id": first["_id"]}}
+        )
+
+        job_runner = delete_job_runner()
+        claimed = await jobs.claim(job_runner.owner, lease=30)
+        job = await job_runner.run(jobs, claimed)
+
+        assert job["status"] == COMPLETED
+        assert job["deleted"] == 2
+        assert await mock_database.users.find_one({"_id": first["_id"]}) is not None
+
+    async def test_live_lease_is_not_claimed(self, mock_database):
+        """Test a job whose owner still heartbeats is left alone."""
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "example.com", "created_before": None})
+        await jobs.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": RUNNING, "owner": "other", "heartbeat_at": datetime.now(timezone.utc)}}
+        )
+
+        assert await jobs.claim("me", lease=30) is None
+
+    async def test_cancel_pending_job(self, mock_database):
+        """Test cancelling a job nobody runs yet stops it at once."""
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "example.com", "created_before": None})
+
+        cancelled = await jobs.cancel(str(job["_id"]))
+
+        assert cancelled["status"] == CANCELLED
+        assert await jobs.claim("me", lease=30) is None
+
+    async def test_cancel_running_job(self, mock_database, delete_job_runner):
+        """Test a running job stops after the chunk in progress."""
+        await seed(mock_database, ["gone.example.com"] * 6)
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        await jobs.collection.update_one({"_id": job["_id"]}, {"$set": {"started_at": datetime.now(timezone.utc)}})
+        job_runner = delete_job_runner()
+        claimed = await jobs.claim(job_runner.owner, lease=30)
+
+        # Requested while the runner holds its copy of the job from before
+        cancelled = await jobs.cancel(str(job["_id"]))
+        assert cancelled["status"] == RUNNING
+        job = await job_runner.run(jobs, claimed)
+
+        assert job["status"] == CANCELLED
+        assert job["deleted"] == 2
+
+    async def test_concurrent_single_delete_not_counted_twice(self, mock_database, delete_job_runner):
+        """Test a user deleted through the API while its chunk is being deleted is counted once."""
+        await seed(mock_database, ["gone.example.com"] * 3 + ["kept.example.com"])
+        racer = await mock_database.users.find_one({"email": "user1@gone.example.com"})
+        jobs = DeleteJobCRUD(mock_database)
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job_runner = delete_job_runner(max_batch=10, initial_batch=10)
+        retry = job_runner._retry
+        raced = []
+
+        async def racing_retry(job, operation, *args):
+            if not raced and operation.__name__ == "delete_many":
+                raced.append(await UserCRUD(mock_database).delete_user(str(racer["_id"])))
+            return await retry(job, operation, *args)
+
+        job_runner._retry = racing_retry
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert raced == [True]
+        assert job["deleted"] == 2
+        stats = await UserCRUD(mock_database).get_stats()
+        assert stats["total"] == 1
+        assert stats["domains"] == {"kept.example.com": 1}
+
+    async def test_chunk_deleted_with_one_command(self, mock_database, delete_job_runner):
+        """Test each chunk is deleted with a single delete_many rather than one delete per user."""
+        await seed(mock_database, ["gone.example.com"] * 5)
+        jobs = DeleteJobCRUD(mock_database)
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job_runner = delete_job_runner(max_batch=10, initial_batch=10)
+        retry = job_runner._retry
+        operations = []
+
+        async def recording_retry(job, operation, *args):
+            operations.append(operation.__name__)
+            return await retry(job, operation, *args)
+
+        job_runner._retry = recording_retry
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert job["deleted"] == 5
+        assert operations.count("delete_many") == 1
+        assert "_find_ids" not in operations
+
+    async def test_interrupted_chunk_delete_counted(self, mock_database, delete_job_runner):
+        """Test users deleted by an attempt whose reply was lost are still counted after the retry."""
+        await seed(mock_database, ["gone.example.com"] * 3)
+        jobs = DeleteJobCRUD(mock_database)
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job_runner = delete_job_runner(max_batch=10, initial_batch=10)
+        retry = job_runner._retry
+        replies = []
+
+        async def lossy_retry(job, operation, *args):
+            if operation.__name__ != "delete_many":
+                return await retry(job, operation, *args)
+
+            async def delete_many():
+                replies.append(await operation())
+                if len(replies) == 1:
+                    raise AutoReconnect("connection reset")
+                return replies[-1]
+            return await retry(job, delete_many)
+
+        job_runner._retry = lossy_retry
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert [reply.deleted_count for reply in replies] == [3, 0]
+        assert job["deleted"] == 3
+        assert (await UserCRUD(mock_database).get_stats())["total"] == 0
+
+    async def test_bookkeeping_retried_after_chunk_deleted(self, mock_database, monkeypatch, delete_job_runner):
+        """Test a transient error after a chunk is deleted retries the stats update instead of losing it."""
+        await seed(mock_database, ["gone.example.com"] * 3)
+        record_deletes = UserStatsCRUD.record_deletes
+        failures = [AutoReconnect("primary stepped down")]
+
+        async def flaky_record_deletes(self, emails, session=None):
+            if failures:
+                raise failures.pop()
+            await record_deletes(self, emails, session)
+
+        monkeypatch.setattr(UserStatsCRUD, "record_deletes", flaky_record_deletes)
+        jobs = DeleteJobCRUD(mock_database)
+        await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+
+        job_runner = delete_job_runner(max_batch=10, initial_batch=10)
+        job = await job_runner.run(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        assert job["status"] == COMPLETED
+        assert job["deleted"] == 3
+        assert (await UserCRUD(mock_database).get_stats())["total"] == 0
+
+    async def test_unexpected_error_marks_job_failed(self, mock_database, monkeypatch, delete_job_runner):
+        """Test an error outside the chunk handling is logged and fails the job instead of leaving it running."""
+        await seed(mock_database, ["gone.example.com"])
+
+        async def broken_record_deletes(self, emails, session=None):
+            raise ValueError("bad increment")
+
+        monkeypatch.setattr(UserStatsCRUD, "record_deletes", broken_record_deletes)
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job_runner = delete_job_runner()
+
+        await job_runner._run_job(jobs, await jobs.claim(job_runner.owner, lease=30))
+
+        job = await jobs.get(str(job["_id"]))
+        assert job["status"] == FAILED
+        assert job["error"] == "bad increment"
+        assert job["owner"] is None
+        assert job_runner.stats()["failed"] == 1
+
+    async def test_started_runner_picks_up_jobs(self, mock_database, delete_job_runner):
+        """Test the background runner claims new jobs when notified."""
+        await seed(mock_database, ["gone.example.com"] * 3)
+        jobs = DeleteJobCRUD(mock_database)
+        job = await jobs.create({"email_domain": "gone.example.com", "created_before": None})
+        job_runner = delete_job_runner(poll_interval=10)
+        job_runner.start(mock_database)
+        try:
+            job_runner.notify()
+            for _ in range(100):
+                if (await jobs.get(str(job["_id"])))["status"] == COMPLETED:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await job_runner.stop()
+
+        assert (await jobs.get(str(job["_id"])))["deleted"] == 3
+        assert job_runner.stats()["completed"] == 1
+
+
+class TestDeleteJobsAPI:
+    """Test cases for the bulk delete job endpoints."""
+
+    @pytest.fixture
+    def api_url(self):
+        return f"{settings.api_v1_str}/users/delete-jobs"
+
+    async def test_create_and_get_job(self, test_client, api_url, mock_database):
+        """Test a job is created pending with an estimate and can be read back."""
+        await seed(mock_database, ["Gone.example.com", "gone.example.com"])
+
+        response = await test_client.post(api_url, json={"email_domain": "GONE.example.com"})
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == PENDING
+        assert job["filter"]["email_domain"] == "gone.example.com"
+        assert job["estimated_total"] == 2
+
+        response = await test_client.get(f"{api_url}/{job['id']}")
+        assert response.status_code == 200
+        assert response.json()["id"] == job["id"]
+
+        response = await test_client.get(api_url)
+        assert [listed["id"] for listed in response.json()["jobs"]] == [job["id"]]
+
+    async def test_cancel_job(self, test_client, api_url):
+        """Test cancelling returns the cancelled job."""
+        job = (await test_client.post(api_url, json={"email_domain": "example.com"})).json()
+
+        response = await test_client.post(f"{api_url}/{job['id']}/cancel")
+
+        assert response.status_code == 200
+        assert response.json()["status"] == CANCELLED
+
+    async def test_unknown_job(self, test_client, api_url):
+        """Test unknown and malformed job IDs are 404."""
+        assert (await test_client.get(f"{api_url}/{ObjectId()}")).status_code == 404
+        assert (await test_client.post(f"{api_url}/not-an-id/cancel")).status_code == 404
+
+    async def test_criteria_required(self, test_client, api_url):
+        """Test a job without any criteria is rejected."""
+        response = await test_client.post(api_url, json={})
+
+        assert response.status_code == 422
+
+    async def test_memory_backend_not_supported(self, memory_test_client, api_url):
+        """Test the endpoints explain they need MongoDB."""
+        response = await memory_test_client.post(api_url, json={"email_domain": "example.com"})
+
+        assert response.status_code == 501
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app.core import deadline as deadline_module
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.crud.loader import UserLoader
+
+
+class TestUserLoader:
+    """Test cases for the micro-batching user loader."""
+
+    @pytest.fixture
+    def collection(self, mock_database):
+        return mock_database.users
+
+    async def test_same_tick_lookups_share_one_query(self, collection, multiple_users, mocker):
+        """Test lookups issued together are resolved by one $in query in order."""
+        loader = UserLoader()
+        find = mocker.spy(collection, "find")
+        ids = [ObjectId(user.id) for user in reversed(multiple_users)]
+
+        docs = await asyncio.gather(*(loader.load(collection, user_id) for user_id in ids))
+
+        assert [doc["_id"] for doc in docs] == ids
+        assert find.call_count == 1
+        assert loader.stats()["batches"] == 1
+        assert loader.stats()["max_batch_size"] == len(ids)
+
+    async def test_missing_ids_resolve_to_none(self, collection, created_user):
+        """Test ids without a document resolve to None."""
+        loader = UserLoader()
+
+        found, missing = await asyncio.gather(
+            loader.load(collection, ObjectId(created_user.id)),
+            loader.load(collection, ObjectId())
+        )
+
+        assert found["email"] == created_user.email
+        assert missing is None
+
+    async def test_max_batch_size_splits_batches(self, collection, multiple_users):
+        """Test full batches are dispatched immediately."""
+        loader = UserLoader(max_batch_size=2)
+
+        await asyncio.gather(*(loader.load(collection, ObjectId(user.id)) for user in multiple_users))
+
+        stats = loader.stats()
+        assert stats["batches"] == 3
+        assert stats["keys"] == len(multiple_users)
+        assert stats["max_batch_size"] == 2
+
+    async def test_window_collects_later_lookups(self, collection, multiple_users):
+        """Test a batching window collects lookups issued across ticks."""
+        loader = UserLoader(window=0.02)
+
+        async def delayed(user):
+            await asyncio.sleep(0.005)
+            return await loader.load(collection, ObjectId(user.id))
+
+        await asyncio.gather(
+            loader.load(collection, ObjectId(multiple_users[0].id)),
+            delayed(multiple_users[1])
+        )
+
+        assert loader.stats()["batches"] == 1
+
+    async def test_query_error_propagates(self, collection, mocker):
+        """Test a failing batch query fails every waiter."""
+        loader = UserLoader()
+        mocker.patch.object(collection, "find", side_effect=RuntimeError("db down"))
+
+        results = await asyncio.gather(
+            loader.load(collection, ObjectId()), loader.load(collection, ObjectId()),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def test_wait_bounded_by_own_deadline(self, collection, created_user):
+        """Test a lookup waiting on a batch gives up when its own budget runs out."""
+        loader = UserLoader(window=0.2)
+
+        async def short_budget():
+            deadline_module._current.set(Deadline(0.02))
+            return await loader.load(collection, ObjectId(created_user.id))
+
+        first = asyncio.ensure_future(loader.load(collection, ObjectId(created_user.id)))
+
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.wait_for(short_budget(), 1.0)
+        assert (await first)["email"] == created_user.email
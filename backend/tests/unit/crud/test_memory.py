@@ -0,0 +1,189 @@
+import pytest
+from bson import ObjectId
+
+from app.crud.memory import MemoryEngine, MemoryUserCRUD, UserRecord
+from app.models.user import UserModel, UserUpdate
+from app.schemas.user import UserCreate
+
+
+class TestMemoryEngine:
+    """Test cases for the in-memory storage engine."""
+
+    @pytest.fixture
+    def engine(self):
+        """Create an engine with three users."""
+        engine = MemoryEngine()
+        for i in range(3):
+            engine.insert(f"User {i}", f"user{i}@example.com")
+        return engine
+
+    async def test_records_use_slots(self, engine):
+        """Test records carry no per-instance dict."""
+        record = engine.page(0, 1)[0]
+        
+        assert not hasattr(record, "__dict__")
+
+    async def test_email_index(self, engine):
+        """Test lookups and uniqueness go through the email index."""
+        assert engine.get_by_email("user1@example.com").name == "User 1"
+        assert engine.get_by_email("missing@example.com") is None
+        with pytest.raises(ValueError, match="Email already registered"):
+            engine.insert("Other", "user1@example.com")
+
+    async def test_page_in_id_order(self, engine):
+        """Test pages come from the ordered _id index, including out-of-order inserts."""
+        early = engine.insert("Early", "early@example.com", object_id=ObjectId("000000000000000000000001"))
+        
+        page = engine.page(0, 2)
+        rest = engine.page(2, 10)
+        
+        assert page[0] is early
+        ids = [record.id for record in page + rest]
+        assert ids == sorted(ids)
+        assert len(ids) == 4
+
+    async def test_update_moves_email_and_domain(self, engine):
+        """Test an email change re-keys the index and domain counts."""
+        record = engine.get_by_email("user0@example.com")
+        
+        engine.update(record.id, {"email": "user0@example.org"})
+        
+        assert record.version == 2
+        assert engine.get_by_email("user0@example.com") is None
+        assert engine.get_by_email("user0@example.org") is record
+        assert engine.domains == {"example.com": 2, "example.org": 1}
+
+    async def test_update_email_conflict(self, engine):
+        """Test an update to a taken email fails without changing the record."""
+        record = engine.get_by_email("user0@example.com")
+        
+        with pytest.raises(ValueError, match="Email already registered"):
+            engine.update(record.id, {"email": "user1@example.com"})
+        assert record.email == "user0@example.com"
+        assert record.version == 1
+
+    async def test_delete_removes_from_indexes(self, engine):
+        """Test a delete removes the record from every index."""
+        record = engine.get_by_email("user1@example.com")
+        
+        assert engine.delete(record.id) is record
+        assert engine.delete(record.id) is None
+        assert engine.get(record.id) is None
+        assert engine.get_by_email("user1@example.com") is None
+        assert [r.name for r in engine.page(0, 10)] == ["User 0", "User 2"]
+        assert engine.domains == {"example.com": 2}
+
+    async def test_snapshot_restore_round_trip(self, engine, tmp_path):
+        """Test a snapshot restores the same records and indexes."""
+        path = str(tmp_path / "users.json")
+        engine.update(engine.get_by_email("user2@example.com").id, {"name": "Renamed"})
+        
+        written = engine.snapshot(path)
+        restored = MemoryEngine()
+        loaded = restored.restore(path)
+        
+        assert written == loaded == 3
+        assert [(r.id, r.name, r.email, r.version) for r in restored.page(0, 10)] == [
+            (r.id, r.name, r.email, r.version) for r in engine.page(0, 10)
+        ]
+        assert restored.get_by_email("user2@example.com").version == 2
+        assert restored.domains == engine.domains
+        assert not (tmp_path / "users.json.tmp").exists()
+
+    async def test_restore_rejects_unknown_format(self, tmp_path):
+        """Test restoring a snapshot of an unknown format fails."""
+        path = tmp_path / "users.json"
+        path.write_text('{"format": 99, "users": []}')
+        
+        with pytest.raises(ValueError, match="Unsupported snapshot format"):
+            MemoryEngine().restore(str(path))
+
+    async def test_load_rejects_duplicate_emails(self):
+        """Test loading records with a repeated email fails."""
+        records = [
+            UserRecord(ObjectId(), "A", "same@example.com", 1),
+            UserRecord(ObjectId(), "B", "same@example.com", 1),
+        ]
+        
+        with pytest.raises(ValueError, match="Duplicate email"):
+            MemoryEngine().load(records)
+
+
+class TestMemoryUserCRUD:
+    """Test cases for MemoryUserCRUD."""
+
+    @pytest.fixture
+    def user_crud(self):
+        """Create MemoryUserCRUD over an empty engine."""
+        return MemoryUserCRUD(MemoryEngine())
+
+    async def test_create_and_get_user(self, user_crud, sample_user_create):
+        """Test a created user can be read back by ID and email."""
+        user = await user_crud.create_user(sample_user_create)
+        
+        assert isinstance(user, UserModel)
+        assert user.version == 1
+        assert await user_crud.get_user(user.id) == user
+        assert await user_crud.get_user_by_email(user.email) == user
+        assert await user_crud.get_user("invalid-id") is None
+
+    async def test_create_user_duplicate_email(self, user_crud, sample_user_create):
+        """Test creating a user with a taken email raises ValueError."""
+        await user_crud.create_user(sample_user_create)
+        
+        with pytest.raises(ValueError, match="Email already registered"):
+            await user_crud.create_user(sample_user_create)
+
+    async def test_pagination_versions_and_count(self, user_crud):
+        """Test list, version and count reads agree."""
+        for i in range(5):
+            await user_crud.create_user(UserCreate(name=f"User {i}", email=f"user{i}@example.com"))
+        
+        users = await user_crud.get_users(skip=1, limit=2)
+        versions = await user_crud.get_users_versions(skip=1, limit=2)
+        
+        assert [user.name for user in users] == ["User 1", "User 2"]
+        assert versions == [(user.id, 1) for user in users]
+        assert await user_crud.get_users_count() == 5
+
+    async def test_update_user(self, user_crud, sample_user_create):
+        """Test updates bump the version and missing users return None."""
+        user = await user_crud.create_user(sample_user_create)
+        
+        updated = await user_crud.update_user(user.id, UserUpdate(name="New Name"))
+        unchanged = await user_crud.update_user(user.id, UserUpdate())
+        
+        assert updated.name == "New Name"
+        assert updated.version == 2
+        assert unchanged == updated
+        assert await user_crud.get_user_version(user.id) == 2
+        assert await user_crud.update_user(str(ObjectId()), UserUpdate(name="X")) is None
+
+    async def test_delete_user(self, user_crud, sample_user_create):
+        """Test delete reports whether a user was removed."""
+        user = await user_crud.create_user(sample_user_create)
+        
+        assert await user_crud.delete_user(user.id) is True
+        assert await user_crud.delete_user(user.id) is False
+        assert await user_crud.delete_user("invalid-id") is False
+
+    async def test_get_users_by_ids(self, user_crud, sample_user_create):
+        """Test bulk lookups skip missing and invalid IDs."""
+        user = await user_crud.create_user(sample_user_create)
+        
+        docs = await user_crud.get_users_by_ids([user.id, str(ObjectId()), "bad"])
+        
+        assert list(docs) == [user.id]
+        assert docs[user.id]["email"] == user.email
+
+    async def test_stats_and_reconcile(self, user_crud):
+        """Test totals are maintained on writes and reconcile finds no drift."""
+        await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        await user_crud.create_user(UserCreate(name="B", email="b@example.org"))
+        
+        stats = await user_crud.get_stats()
+        report = await user_crud.reconcile_stats()
+        
+        assert stats["total"] == 2
+        assert stats["domains"] == {"example.com": 1, "example.org": 1}
+        assert report["drifted"] is False
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.crud.stats import UserStatsCRUD, StatsReconciler, email_domain
+from app.crud.user import UserCRUD
+from app.models.user import UserUpdate
+from app.schemas.user import UserCreate
+
+
+class TestUserStatsCRUD:
+    """Test cases for the materialized user stats."""
+
+    @pytest.fixture
+    async def user_crud(self, mock_database):
+        """Create UserCRUD instance with mock database."""
+        return UserCRUD(mock_database)
+
+    async def test_email_domain(self):
+        """Test domains are taken after the last @ and lowercased."""
+        assert email_domain("John.Doe@Example.COM") == "example.com"
+
+    async def test_empty_stats(self, mock_database):
+        """Test stats before any write are zero."""
+        stats = await UserStatsCRUD(mock_database).get_stats()
+        
+        assert stats == {"total": 0, "domains": {}, "updated_at": None}
+
+    async def test_create_and_delete_update_counts(self, user_crud):
+        """Test creates and deletes keep total and per-domain counts."""
+        first = await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        await user_crud.create_user(UserCreate(name="B", email="b@example.com"))
+        await user_crud.create_user(UserCreate(name="C", email="c@mail.example.org"))
+        await user_crud.delete_user(str(first.id))
+        
+        stats = await user_crud.get_stats()
+        
+        assert stats["total"] == 2
+        assert stats["domains"] == {"example.com": 1, "mail.example.org": 1}
+        assert stats["updated_at"] is not None
+
+    async def test_failed_writes_leave_counts(self, user_crud):
+        """Test duplicate creates and missing deletes do not change counts."""
+        await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        with pytest.raises(ValueError):
+            await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        await user_crud.delete_user("507f1f77bcf86cd799439011")
+        
+        stats = await user_crud.get_stats()
+        
+        assert stats["total"] == 1
+
+    async def test_email_change_moves_domain(self, user_crud):
+        """Test changing a user's email domain moves them between domain counts."""
+        user = await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        await user_crud.update_user(str(user.id), UserUpdate(email="a@example.org"))
+        
+        stats = await user_crud.get_stats()
+        
+        assert stats["total"] == 1
+        assert stats["domains"] == {"example.org": 1}
+
+    async def test_reconcile_reports_and_fixes_drift(self, user_crud, multiple_users):
+        """Test reconciliation recounts users written behind the stats' back."""
+        await user_crud.create_user(UserCreate(name="A", email="a@example.com"))
+        
+        report = await user_crud.reconcile_stats()
+        clean = await user_crud.reconcile_stats()
+        
+        assert report["drifted"] is True
+        assert report["total_drift"] == -5
+        assert report["stats"]["total"] == 6
+        assert sum(report["stats"]["domains"].values()) == 6
+        assert clean["drifted"] is False
+        assert clean["domain_drift"] == {}
+
+    async def test_reconcile_dry_run_keeps_stored_stats(self, user_crud, multiple_users):
+        """Test a dry run reports drift without rewriting the stats."""
+        report = await user_crud.reconcile_stats(apply=False)
+        
+        assert report["drifted"] is True
+        assert report["stats"]["total"] == 0
+        assert (await user_crud.get_stats())["total"] == 0
+
+    async def test_reconcile_keeps_writes_made_during_scan(self, user_crud, mock_database, multiple_users):
+        """Test a create landing during the scan is not overwritten by the recount."""
+        stats = UserStatsCRUD(mock_database)
+        recount = stats._recount
+        scans = []
+
+        async def racing_recount():
+            counted = await recount()
+            if not scans:
+                await user_crud.create_user(UserCreate(name="Racer", email="racer@example.com"))
+            scans.append(counted)
+            return counted
+
+        stats._recount = racing_recount
+        await stats.reconcile()
+
+        assert len(scans) == 2
+        assert (await stats.get_stats())["total"] == await mock_database.users.count_documents({}) == 6
+
+    async def test_reconcile_gives_up_while_writes_continue(self, user_crud, mock_database, multiple_users):
+        """Test the stored stats are left alone if every scan races a write."""
+        stats = UserStatsCRUD(mock_database)
+        recount = stats._recount
+
+        async def always_racing_recount():
+            counted = await recount()
+            await stats.record_create("racer@example.com")
+            return counted
+
+        stats._recount = always_racing_recount
+        report = await stats.reconcile(attempts=2)
+
+        assert report["stats"]["total"] == 2
+        assert (await stats.get_stats())["total"] == 2
+
+    async def test_reconciler_runs_periodically(self, mock_database, multiple_users):
+        """Test the background reconciler rebuilds stats on its interval."""
+        reconciler = StatsReconciler(interval=0.01)
+        reconciler.start(mock_database)
+        while reconciler.runs == 0:
+            await asyncio.sleep(0.01)
+        await reconciler.stop()
+        
+        assert reconciler.drifted_runs == 1
+        assert (await UserStatsCRUD(mock_database).get_stats())["total"] == 5
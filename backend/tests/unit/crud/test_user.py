@@ -1,7 +1,9 @@
+import asyncio
+
 import pytest
 from bson import ObjectId
 
-from app.crud.user import UserCRUD
+from app.crud.user import UserCRUD, user_reads
 from app.schemas.user import UserCreate, UserUpdate
 from app.models.user import UserModel
 
@@ -57,6 +59,15 @@ class TestUserCRUD:
         
         assert user is None
 
+    async def test_get_user_concurrent_reads_coalesced(self, user_crud, created_user):
+        """Test concurrent reads of the same user share one query."""
+        before = user_reads.coalesced
+        
+        users = await asyncio.gather(*(user_crud.get_user(created_user.id) for _ in range(5)))
+        
+        assert all(user.id == created_user.id for user in users)
+        assert user_reads.coalesced - before == 4
+
     async def test_get_user_by_email_success(self, user_crud, created_user):
         """Test successful user retrieval by email."""
         user = await user_crud.get_user_by_email(created_user.email)
@@ -97,6 +108,16 @@ class TestUserCRUD:
         
         assert count == 0
 
+    async def test_writes_store_derived_email_fields(self, user_crud, mock_database):
+        """Test creates and email changes keep the normalized email and domain up to date."""
+        user = await user_crud.create_user(UserCreate(name="Ada", email="Ada@Example.COM"))
+        doc = await mock_database.users.find_one({"_id": ObjectId(user.id)})
+        assert (doc["email_normalized"], doc["email_domain"]) == ("ada@example.com", "example.com")
+
+        await user_crud.update_user(user.id, UserUpdate(email="ada@Other.org"))
+        doc = await mock_database.users.find_one({"_id": ObjectId(user.id)})
+        assert (doc["email_normalized"], doc["email_domain"]) == ("ada@other.org", "other.org")
+
     async def test_update_user_success(self, user_crud, created_user):
         """Test successful user update."""
         update_data = UserUpdate(
@@ -111,6 +132,28 @@ class TestUserCRUD:
         assert updated_user.name == update_data.name
         assert updated_user.email == update_data.email
 
+    async def test_update_user_increments_version(self, user_crud, sample_user_create):
+        """Test writes keep a monotonically increasing version."""
+        user = await user_crud.create_user(sample_user_create)
+        assert user.version == 1
+        
+        updated_user = await user_crud.update_user(user.id, UserUpdate(name="Updated Name"))
+        
+        assert updated_user.version == 2
+        assert await user_crud.get_user_version(user.id) == 2
+
+    async def test_get_user_version_not_found(self, user_crud):
+        """Test version lookup for missing or invalid IDs returns None."""
+        assert await user_crud.get_user_version(str(ObjectId())) is None
+        assert await user_crud.get_user_version("invalid-id") is None
+
+    async def test_get_users_versions(self, user_crud, multiple_users):
+        """Test version listing matches the order of get_users."""
+        versions = await user_crud.get_users_versions(skip=1, limit=3)
+        users = await user_crud.get_users(skip=1, limit=3)
+        
+        assert versions == [(user.id, user.version) for user in users]
+
     async def test_update_user_partial_update(self, user_crud, created_user):
         """Test partial user update (only name)."""
         update_data = UserUpdate(name="Updated Name Only")
@@ -183,3 +226,56 @@ class TestUserCRUD:
         result = await user_crud.delete_user(invalid_id)
         
         assert result is False
+
+    async def test_get_users_by_ids_chunks_queries(self, user_crud, multiple_users, monkeypatch):
+        """Test bulk lookup splits IDs into chunked $in queries."""
+        from app.crud import user as user_module
+        monkeypatch.setattr(user_module.settings, "batch_get_chunk_size", 2)
+        ids = [user.id for user in multiple_users] + [str(ObjectId()), "invalid-id"]
+        
+        docs = await user_crud.get_users_by_ids(ids)
+        
+        assert set(docs) == {user.id for user in multiple_users}
+        assert docs[multiple_users[0].id]["email"] == multiple_users[0].email
+
+    async def test_operations_use_consistency_profiles(self, user_crud):
+        """Test list reads and single-user writes get their profile's options."""
+        from pymongo import ReadPreference
+        
+        assert user_crud._for("list").read_preference == ReadPreference.SECONDARY_PREFERRED
+        assert user_crud._for("create").write_concern.document == {"w": "majority"}
+        assert user_crud._for("list") is user_crud._for("list")
+
+    async def test_write_opens_causal_session(self, user_crud, created_user, mocker):
+        """Test a write starts a causally consistent session used by later reads."""
+        session = mocker.MagicMock()
+        session.end_session = mocker.AsyncMock()
+        start_session = mocker.patch.object(
+            user_crud.database.client, "start_session", mocker.AsyncMock(return_value=session)
+        )
+        # mongomock rejects sessions, so stand in for the session-aware calls
+        update_one = mocker.patch.object(
+            user_crud._for("update"), "update_one", mocker.AsyncMock(return_value=mocker.Mock(modified_count=1))
+        )
+        find_one = mocker.patch.object(
+            user_crud._for("get"), "find_one",
+            mocker.AsyncMock(return_value=created_user.model_dump(by_alias=True))
+        )
+        
+        await user_crud.update_user(created_user.id, UserUpdate(name="Updated Name"))
+        await user_crud.close()
+        
+        start_session.assert_awaited_once_with(causal_consistency=True)
+        assert update_one.call_args.kwargs["session"] is session
+        assert find_one.call_args.kwargs["session"] is session
+        session.end_session.assert_awaited_once()
+        assert user_crud.session is None
+
+    async def test_reads_do_not_open_session(self, user_crud, created_user, mocker):
+        """Test read-only requests never start a session."""
+        start_session = mocker.patch.object(user_crud.database.client, "start_session")
+        
+        await user_crud.get_user(created_user.id)
+        await user_crud.get_users()
+        
+        start_session.assert_not_called()
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.crud.user import UserCRUD
+from app.crud.write_behind import WriteBehindBuffer
+from app.schemas.user import UserCreate
+
+
+class TestWriteBehindBuffer:
+    """Test cases for the write-behind insert buffer."""
+
+    @pytest.fixture
+    async def collection(self, mock_database):
+        collection = mock_database.users
+        await collection.create_index("email", unique=True)
+        return collection
+
+    async def test_concurrent_inserts_flush_as_one_batch(self, collection, mocker):
+        """Test concurrent inserts are written with a single insert_many."""
+        buffer = WriteBehindBuffer(flush_interval=0.01)
+        insert_many = mocker.spy(collection, "insert_many")
+
+        ids = await asyncio.gather(*(
+            buffer.insert(collection, {"name": f"User {i}", "email": f"user{i}@example.com"})
+            for i in range(10)
+        ))
+
+        assert len(set(ids)) == 10
+        assert insert_many.call_count == 1
+        assert await collection.count_documents({}) == 10
+        assert buffer.stats()["flushes"] == 1
+        assert buffer.stats()["inserted"] == 10
+
+    async def test_size_trigger_flushes_early(self, collection):
+        """Test a full batch is flushed without waiting for the timer."""
+        buffer = WriteBehindBuffer(max_batch_size=3, flush_interval=10)
+
+        await asyncio.wait_for(asyncio.gather(*(
+            buffer.insert(collection, {"name": "User", "email": f"user{i}@example.com"})
+            for i in range(3)
+        )), timeout=1)
+
+        assert buffer.stats()["flushes"] == 1
+
+    async def test_duplicate_key_maps_to_caller(self, collection):
+        """Test only the caller whose document collided gets the error."""
+        await collection.insert_one({"name": "Existing", "email": "taken@example.com"})
+        buffer = WriteBehindBuffer(flush_interval=0.01)
+
+        results = await asyncio.gather(
+            buffer.insert(collection, {"name": "A", "email": "a@example.com"}),
+            buffer.insert(collection, {"name": "B", "email": "taken@example.com"}),
+            buffer.insert(collection, {"name": "C", "email": "c@example.com"}),
+            return_exceptions=True
+        )
+
+        assert not isinstance(results[0], Exception)
+        assert isinstance(results[1], DuplicateKeyError)
+        assert not isinstance(results[2], Exception)
+        assert buffer.stats()["failed"] == 1
+
+    async def test_duplicate_within_batch_rejected(self, collection):
+        """Test two pending inserts with the same email don't both succeed."""
+        buffer = WriteBehindBuffer(flush_interval=0.01)
+
+        results = await asyncio.gather(
+            buffer.insert(collection, {"name": "A", "email": "same@example.com"}),
+            buffer.insert(collection, {"name": "B", "email": "same@example.com"}),
+            return_exceptions=True
+        )
+
+        assert sum(isinstance(result, DuplicateKeyError) for result in results) == 1
+
+    async def test_queue_depth_is_bounded(self, collection):
+        """Test callers beyond max_queue wait for room."""
+        buffer = WriteBehindBuffer(max_batch_size=100, flush_interval=0.02, max_queue=2)
+
+        tasks = [
+            asyncio.ensure_future(buffer.insert(collection, {"name": "U", "email": f"u{i}@example.com"}))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.005)
+
+        assert buffer.stats()["queue_depth"] == 2
+        await asyncio.gather(*tasks)
+        assert await collection.count_documents({}) == 4
+
+    async def test_create_user_write_behind_mode(self, mock_database, monkeypatch, mocker):
+        """Test UserCRUD.create_user goes through the buffer, with the bulk_create write concern, when enabled."""
+        from app.crud import user as user_module
+        monkeypatch.setattr(user_module.settings, "write_behind_enabled", True)
+        insert = mocker.spy(user_module.user_writes, "insert")
+        user_crud = UserCRUD(mock_database)
+
+        user = await user_crud.create_user(UserCreate(name="Buffered", email="buffered@example.com"))
+
+        assert insert.call_count == 1
+        assert insert.call_args.args[0] is user_crud._for("bulk_create")
+        assert user.id
+        assert user.version == 1
+        assert (await user_crud.get_user(user.id)).email == "buffered@example.com"
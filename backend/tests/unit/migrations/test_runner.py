@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+import pytest
+
+from app.migrations.base import Migration
+from app.migrations.runner import COMPLETED, FAILED, PENDING, MigrationFailed, MigrationLocked
+
+
+async def seed_legacy_users(database, count):
+    """Users as stored before versions and derived email fields existed"""
+    await database.users.insert_many([
+        {"name": f"User {i}", "email": f"User{i}@Example.COM"} for i in range(count)
+    ])
+
+
+class Explode(Migration):
+    version = 99
+    name = "explode"
+
+    def filter(self) -> dict:
+        return {}
+
+    def update(self, doc: dict) -> Optional[dict]:
+        raise RuntimeError("boom")
+
+
+class TestMigrationRunner:
+    """Test cases for batched, resumable data migrations."""
+
+    async def test_status_before_any_run(self, migration_runner):
+        """Test every migration is pending until run."""
+        status = await migration_runner().status()
+
+        assert [report["version"] for report in status] == [1, 2, 3]
+        assert {report["status"] for report in status} == {PENDING}
+
+    async def test_dry_run_counts_without_writing(self, mock_database, migration_runner):
+        """Test a dry run reports how many documents each migration would change."""
+        await seed_legacy_users(mock_database, 5)
+        await mock_database.users.update_one({}, {"$set": {"version": 3}})
+
+        reports = await migration_runner().dry_run()
+
+        assert [report["would_modify"] for report in reports] == [4, 5, 5]
+        assert await mock_database.users.count_documents({"email_domain": {"$exists": True}}) == 0
+        assert await mock_database.migrations.count_documents({}) == 0
+
+    async def test_run_backfills_in_batches(self, mock_database, migration_runner):
+        """Test all migrations complete and each document gets the derived fields."""
+        await seed_legacy_users(mock_database, 5)
+        await mock_database.users.update_one({}, {"$set": {"version": 3}})
+
+        reports = await migration_runner().run()
+
+        assert [report["status"] for report in reports] == [COMPLETED] * 3
+        assert [report["modified"] for report in reports] == [4, 5, 5]
+        assert reports[1]["batches"] >= 2
+        users = await mock_database.users.find().to_list(None)
+        assert sorted(user["version"] for user in users) == [1, 1, 1, 1, 3]
+        assert {user["email_domain"] for user in users} == {"example.com"}
+        assert all(user["email_normalized"] == user["email"].lower() for user in users)
+        assert await migration_runner().run() == []
+
+    async def test_target_stops_early(self, mock_database, migration_runner):
+        """Test --target applies only migrations up to that version."""
+        await seed_legacy_users(mock_database, 2)
+
+        reports = await migration_runner().run(target=1)
+
+        assert [report["version"] for report in reports] == [1]
+        status = await migration_runner().status()
+        assert [report["status"] for report in status] == [COMPLETED, PENDING, PENDING]
+
+    async def test_resumes_after_last_id(self, mock_database, migration_runner):
+        """Test an interrupted migration continues after its recorded _id."""
+        await seed_legacy_users(mock_database, 4)
+        first = await mock_database.users.find_one(sort=[("_id", 1)])
+        await mock_database.migrations.insert_one({
+            "_id": 1, "name": "add_version_counters", "status": FAILED, "owner": None, "last_id": first["_id"],
+            "scanned": 1, "modified": 0, "batches": 1, "started_at": datetime.now(timezone.utc),
+        })
+
+        reports = await migration_runner().run(target=1)
+
+        assert reports[0]["scanned"] == 4
+        assert reports[0]["modified"] == 3
+        assert "version" not in await mock_database.users.find_one({"_id": first["_id"]})
+
+    async def test_held_migration_is_locked(self, mock_database, migration_runner):
+        """Test a migration another runner is saving progress for is not taken."""
+        await mock_database.migrations.insert_one({
+            "_id": 1, "name": "add_version_counters", "status": "running",
+            "owner": "elsewhere", "heartbeat_at": datetime.now(timezone.utc),
+        })
+
+        with pytest.raises(MigrationLocked):
+            await migration_runner().run()
+
+    async def test_failure_is_recorded(self, mock_database, migration_runner):
+        """Test a failing migration is marked failed and stops the run."""
+        await seed_legacy_users(mock_database, 1)
+
+        with pytest.raises(MigrationFailed):
+            await migration_runner([Explode()]).run()
+
+        status = await migration_runner([Explode()]).status()
+        assert status[0]["status"] == FAILED
+        assert status[0]["error"] == "boom"
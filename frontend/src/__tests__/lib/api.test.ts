@@ -142,4 +142,37 @@ describe("User API", () => {
       await expect(userApi.deleteUser("999")).rejects.toThrow();
     });
   });
+
+  describe("subscribeToChanges", () => {
+    const originalEventSource = (global as any).EventSource;
+
+    afterEach(() => {
+      (global as any).EventSource = originalEventSource;
+    });
+
+    it("should deliver change events and close on unsubscribe", () => {
+      const listeners: Record<string, (message: MessageEvent) => void> = {};
+      const close = jest.fn();
+      (global as any).EventSource = jest.fn().mockImplementation(() => ({
+        addEventListener: (type: string, listener: (message: MessageEvent) => void) => {
+          listeners[type] = listener;
+        },
+        close,
+      }));
+      const onChange = jest.fn();
+
+      const unsubscribe = userApi.subscribeToChanges(onChange);
+      listeners.created({ data: JSON.stringify({ op: "created", id: "1" }) } as MessageEvent);
+      unsubscribe();
+
+      expect(onChange).toHaveBeenCalledWith({ op: "created", id: "1" });
+      expect(close).toHaveBeenCalled();
+    });
+
+    it("should do nothing without EventSource support", () => {
+      (global as any).EventSource = undefined;
+
+      expect(() => userApi.subscribeToChanges(jest.fn())()).not.toThrow();
+    });
+  });
 });
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { UserList } from '@/components/user-list';
 import { UserForm } from '@/components/user-form';
@@ -33,6 +33,15 @@ export default function HomePage() {
     queryFn: () => userApi.getUsers({ page: currentPage, size: pageSize }),
   });
 
+  // Refetch lists when users change anywhere, instead of polling
+  useEffect(
+    () =>
+      userApi.subscribeToChanges(() => {
+        queryClient.invalidateQueries({ queryKey: ['users'] });
+      }),
+    [queryClient]
+  );
+
   // Create user mutation
   const createUserMutation = useMutation({
     mutationFn: userApi.createUser,
@@ -2,6 +2,7 @@ import {
   PaginationParams,
   User,
   UserCreate,
+  UserChangeEvent,
   UserListResponse,
   UserUpdate,
 } from "@/types/user";
@@ -67,6 +68,20 @@ export const userApi = {
   deleteUser: async (id: string): Promise<void> => {
     await api.delete(`/users/${id}`);
   },
+
+  // Subscribe to user changes (Server-Sent Events); returns an unsubscribe function.
+  // The browser reconnects on its own and resumes from the last event it saw.
+  subscribeToChanges: (onChange: (event: UserChangeEvent) => void): (() => void) => {
+    if (typeof EventSource === "undefined") {
+      return () => {};
+    }
+    const source = new EventSource(`${API_BASE_URL}/api/v1/users/changes`);
+    const handler = (message: MessageEvent) => onChange(JSON.parse(message.data));
+    ["created", "updated", "deleted", "reset"].forEach((type) =>
+      source.addEventListener(type, handler)
+    );
+    return () => source.close();
+  },
 };
 
 export default api;
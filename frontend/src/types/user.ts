@@ -29,3 +29,11 @@ export interface PaginationParams {
   page: number;
   size: number;
 }
+
+export interface UserChangeEvent {
+  op: 'created' | 'updated' | 'deleted' | 'reset';
+  token?: string;
+  id?: string;
+  user?: { name: string; email: string; version: number } | null;
+  at?: string;
+}